@@ -1,11 +1,31 @@
 """Command-line interface for working with Package Cloud repositories."""
+import asyncio
 import logging
+import os
+import time
+from dataclasses import replace
+from typing import Any, Dict, Optional
 
 import click
 import click_logging
-from packaging import version
 
-from .classes import PackageCloudManager, PackageCloudRepoConfiguration
+from .async_manager import AsyncEngine, AsyncPackageCloudManager
+from .cache import ResponseCache, default_cache_dir
+from .classes import (
+    HttpTransportConfiguration,
+    PackageCloudManager,
+    PackageCloudRepoConfiguration,
+    PromotionCandidate,
+    PromotionResult,
+)
+from .inventory import InventoryStore
+from .journal import DeletionJournal
+from .metrics import RequestMetrics
+from .mirror import MirrorStatus, PackageMirror
+from .output import ResultWriter
+from .planner import PromotionPlanner
+from .ratelimit import TokenBucket
+from .snapshot import SnapshotManager, SnapshotStore
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +33,37 @@ click_logging.basic_config(logger)
 logging.getLogger("urllib3").setLevel(logging.INFO)
 
 
+def _candidate_record(candidate: PromotionCandidate) -> Dict[str, Any]:
+    return {
+        "type": "promotion-candidate",
+        "package": candidate.package.name,
+        "distro_version": candidate.distro_version,
+        "source_repository": candidate.source_repository,
+        "source_version": candidate.version.version_str,
+        "destination_repository": candidate.destination_repository,
+        "destination_version": (
+            candidate.destination_version.version_str
+            if candidate.destination_version
+            else None
+        ),
+        "decision": "promote",
+    }
+
+
+def _promotion_record(promotion: PromotionResult) -> Dict[str, Any]:
+    record = _candidate_record(promotion.candidate)
+    record.update(
+        type="promotion", decision=promotion.status.value, error=promotion.error
+    )
+    return record
+
+
 @click.command()
 @click.argument("repo", envvar="PC_REPO")
 @click.argument("user", envvar="PC_USER")
 @click.argument("distro", envvar="PC_DISTRO")
 @click.argument("distro-version", envvar="PC_DISTRO_VERSION")
-@click.argument("api_token", envvar="PC_API_TOKEN")
+@click.argument("api_token", envvar="PC_API_TOKEN", required=False, default="")
 @click.option(
     "--all-packages", is_flag=True, help="Queries all packages in the repository."
 )
@@ -53,8 +98,138 @@ logging.getLogger("urllib3").setLevel(logging.INFO)
 )
 @click.option(
     "--promote-check",
-    help="",
+    help="Check if packages can be promoted to the additional repositories.",
+    is_flag=True,
+)
+@click.option(
+    "--promote",
+    help="Promote packages that can be promoted to the additional repository. Implies '--promote-check'.",
+    is_flag=True,
+)
+@click.option(
+    "--pool-size",
+    type=int,
+    default=10,
+    show_default=True,
+    help="Maximum number of keep-alive connections kept open to PackageCloud.",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=30.0,
+    show_default=True,
+    help="Timeout in seconds when waiting for a response from PackageCloud.",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Number of retries, with exponential backoff, on connection errors and 5xx responses.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of requests sent concurrently, across all repositories.",
+)
+@click.option(
+    "--prefetch-pages",
+    is_flag=True,
+    help="Request the next page of a paginated listing while the current one is processed.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=default_cache_dir,
+    envvar="PC_CACHE_DIR",
+    help="Directory where responses from PackageCloud are cached.",
+)
+@click.option(
+    "--cache-ttl",
+    type=float,
+    default=600,
+    show_default=True,
+    help="Seconds during which a cached response is used without revalidating it with PackageCloud.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Don't cache responses from PackageCloud.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only fetch the versions of packages whose number of versions changed since the last run.",
+)
+@click.option(
+    "--inventory-dir",
+    type=click.Path(file_okay=False),
+    default=lambda: os.path.join(default_cache_dir(), "inventory"),
+    envvar="PC_INVENTORY_DIR",
+    help="Directory where the inventory used by '--incremental' is stored.",
+)
+@click.option(
+    "--snapshot",
+    "snapshot_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Answer queries from a snapshot created with 'package-cloud-snapshot save' instead of PackageCloud.",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=10,
+    show_default=True,
+    help="Maximum number of requests per second sent to PackageCloud. 0 disables the limit.",
+)
+@click.option(
+    "--delete-journal",
+    type=click.Path(dir_okay=False),
+    help="File where deletions are journaled. Versions already deleted according to the journal are skipped.",
+)
+@click.option(
+    "--chain",
     is_flag=True,
+    help="Check promotions along the chain formed by REPO and the additional repositories, in the given order.",
+)
+@click.option(
+    "--chain-distro-version",
+    multiple=True,
+    help="Additional distribution version to check promotions for with '--chain'.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(ResultWriter.FORMATS),
+    default="text",
+    show_default=True,
+    help="Output format. 'json' and 'ndjson' write one record per package as soon as it has been evaluated.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    help="File where metrics about the requests sent to PackageCloud are written at the end of the run.",
+)
+@click.option(
+    "--metrics-format",
+    type=click.Choice(RequestMetrics.FORMATS),
+    default="json",
+    show_default=True,
+    help="Format of the metrics file. 'prometheus' can be read by node_exporter's textfile collector.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Report the time spent waiting on the network, decoding JSON and building package versions.",
+)
+@click.option(
+    "--server",
+    envvar="PC_SERVER",
+    default="https://packagecloud.io",
+    show_default=True,
+    help="URL of the PackageCloud server. Can be passed through environment variable 'PC_SERVER'.",
 )
 def main(
     repo,
@@ -69,6 +244,27 @@ def main(
     dry_run,
     additional_repo,
     promote_check,
+    promote,
+    pool_size,
+    timeout,
+    retries,
+    jobs,
+    prefetch_pages,
+    cache_dir,
+    cache_ttl,
+    no_cache,
+    incremental,
+    inventory_dir,
+    snapshot_path,
+    rate_limit,
+    delete_journal,
+    chain,
+    chain_distro_version,
+    output_format,
+    metrics_file,
+    metrics_format,
+    profile,
+    server,
 ):
     """
     REPO: Name of the PackageCloud repository. Can be passed through environment variable 'PC_REPO'
@@ -79,10 +275,39 @@ def main(
 
     DISTRO_VERSION: Version of the distribution of the repository. Can be passed through environment variable 'PC_DISTRO_VERSION'
 
-    API_TOKEN: PackageCloud API token. Can be passed through environment variable 'PC_API_TOKEN'
+    API_TOKEN: PackageCloud API token. Can be passed through environment variable 'PC_API_TOKEN'. Not required with '--snapshot'
     """
     logging.basicConfig(level=getattr(logging, verbosity))
 
+    if not snapshot_path and not api_token:
+        raise click.UsageError("Missing argument 'API_TOKEN'.")
+    if promote and len(additional_repo) != 1:
+        raise click.UsageError(
+            "'--promote' requires exactly one '--additional-repo' to promote packages to."
+        )
+    if chain_distro_version and not chain:
+        raise click.UsageError(
+            "'--chain-distro-version' can only be used with '--chain'."
+        )
+    if chain and cleanup_and_keep:
+        raise click.UsageError("'--cleanup-and-keep' can't be used with '--chain'.")
+    if chain and package_name:
+        raise click.UsageError(
+            "'--package-name' can't be used with '--chain', which checks every package."
+        )
+    if chain and not additional_repo:
+        raise click.UsageError(
+            "'--chain' requires at least one '--additional-repo' to promote packages to."
+        )
+    if snapshot_path and promote and not dry_run:
+        raise click.UsageError(
+            "'--promote' can only be used with '--dry-run' when working from a snapshot."
+        )
+    if snapshot_path and cleanup_and_keep and not dry_run:
+        raise click.UsageError(
+            "'--cleanup-and-keep' can only be used with '--dry-run' when working from a snapshot."
+        )
+
     logging.debug(f"Checking '{user}/{repo}' for distro '{distro}/{distro_version}'")
 
     config = PackageCloudRepoConfiguration(
@@ -91,68 +316,573 @@ def main(
         user=user,
         distribution=distro,
         distribution_version=distro_version,
+        server=server,
+    )
+    transport = HttpTransportConfiguration(
+        pool_size=max(pool_size, jobs), read_timeout=timeout, retries=retries
     )
-    manager = PackageCloudManager(config)
-
-    packages = []
-    if package_name:
-        package = manager.get_package(package_name)
-        if package:
-            packages.append(package)
-        else:
-            print(f"Package '{package_name}' not found in '{repo}'.")
-    elif all_packages:
-        packages = manager.list_packages()
-
-    for package in packages:
-        versions = manager.package_versions(package)
-        versions.sort()
-
-        if not promote_check:
-            print(
-                f"Package: '{package.name}' ({package.versions_count} versions), latest: '{versions[-1].version_str}'"
+    cache = None
+    inventory = None
+    store = None
+    if snapshot_path:
+        store = SnapshotStore(snapshot_path)
+    else:
+        cache = None if no_cache else ResponseCache(cache_dir, ttl=cache_ttl)
+        inventory = InventoryStore(inventory_dir) if incremental else None
+    rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+    metrics = RequestMetrics(profile=profile) if metrics_file or profile else None
+    # Shared by every manager, so that '--jobs' bounds the requests in flight
+    # across all repositories
+    engine = AsyncEngine(concurrency=jobs)
+
+    def create_manager(
+        repository: str, distribution_version: str = distro_version
+    ) -> PackageCloudManager:
+        # Every repository gets its own manager and configuration
+        repository_config = replace(
+            config, repository=repository, distribution_version=distribution_version
+        )
+        if store:
+            return SnapshotManager(repository_config, store, engine=engine)
+        return PackageCloudManager(
+            repository_config,
+            transport,
+            prefetch_pages=prefetch_pages,
+            cache=cache,
+            inventory=inventory,
+            rate_limiter=rate_limiter,
+            metrics=metrics,
+            engine=engine,
+        )
+
+    journal = DeletionJournal(delete_journal) if delete_journal else None
+    promote_check = promote_check or promote
+    promotion_candidates = []
+    manager: Optional[PackageCloudManager] = None
+    other_managers: Dict[str, PackageCloudManager] = {}
+
+    writer = ResultWriter(output_format)
+    # Stages of '--chain' that couldn't be planned
+    stage_errors = []
+
+    if chain:
+        planner = PromotionPlanner(
+            chain=[repo] + list(additional_repo),
+            distro_versions=[distro_version] + list(chain_distro_version),
+            manager_factory=create_manager,
+            jobs=jobs,
+            engine=engine,
+        )
+        for candidate in planner.plan():
+            writer.print(f"\n{candidate}")
+            writer.write(_candidate_record(candidate))
+            promotion_candidates.append(candidate)
+        for contents, name, error in planner.errors():
+            writer.write(
+                {
+                    "type": "package",
+                    "package": name,
+                    "repository": contents.repository,
+                    "distro_version": contents.distro_version,
+                    "error": error,
+                }
             )
-            print(f"Versions ('{repo}'): '{versions}'")
-
-        try:
-            for other_repo in additional_repo:
-                manager.config.repository = other_repo
-                package_in_other_repo = manager.get_package(package.name)
-                if package_in_other_repo:
-                    other_versions = manager.package_versions(
-                        package=package_in_other_repo
-                    )
-                    other_versions.sort()
-                    
-                    if not promote_check:
-                        print(f"Versions ('{other_repo}'): '{other_versions}'")
-
-                    if promote_check and version.parse(other_versions[-1].version_str) < version.parse(
-                        versions[-1].version_str
-                    ):
-                        print(
-                            f"\nPackage '{package.name}' can be promoted from '{repo}' ('{versions[-1].version_str}') "
-                            f"to '{other_repo}' (Latest version is '{other_versions[-1].version_str})')"
+        stage_errors = planner.stage_errors()
+        for source, destination, stage_distro_version, error in stage_errors:
+            writer.write(
+                {
+                    "type": "stage",
+                    "source_repository": source,
+                    "destination_repository": destination,
+                    "distro_version": stage_distro_version,
+                    "error": error,
+                }
+            )
+    else:
+        manager = create_manager(repo)
+        other_managers = {
+            other_repo: create_manager(other_repo) for other_repo in additional_repo
+        }
+
+        packages = []
+        if package_name:
+            package = manager.get_package(package_name)
+            if package:
+                packages.append(package)
+            else:
+                writer.print(f"Package '{package_name}' not found in '{repo}'.")
+                writer.write(
+                    {
+                        "type": "package",
+                        "package": package_name,
+                        "repository": repo,
+                        "error": "Package not found",
+                    }
+                )
+        elif all_packages:
+            packages = manager.list_packages()
+
+        for result in manager.iter_bulk_package_versions(packages, jobs=jobs):
+            started_at = time.monotonic()
+            package = result.package
+            record: Dict[str, Any] = {
+                "type": "package",
+                "package": package.name,
+                "repository": repo,
+                "versions_count": package.versions_count,
+            }
+            if result.error:
+                logger.error(
+                    f"Couldn't get versions of '{package.name}': {result.error}"
+                )
+                writer.print()
+                record["error"] = str(result.error)
+                writer.write(record)
+                continue
+
+            versions = result.versions
+            if not versions:
+                logger.error(
+                    f"No versions of '{package.name}' for '{distro}/{distro_version}'"
+                )
+                writer.print()
+                record["error"] = f"No versions for distro '{distro}/{distro_version}'"
+                writer.write(record)
+                continue
+            versions.sort()
+            record["latest_version"] = versions[-1].version_str
+            record["destinations"] = []
+
+            if not promote_check:
+                writer.print(
+                    f"Package: '{package.name}' ({package.versions_count} versions), latest: '{versions[-1].version_str}'"
+                )
+                writer.print(f"Versions ('{repo}'): '{versions}'")
+
+            try:
+                for other_repo, other_manager in other_managers.items():
+                    package_in_other_repo = other_manager.get_package(package.name)
+                    if package_in_other_repo:
+                        other_versions = other_manager.package_versions(
+                            package=package_in_other_repo
                         )
-                elif promote_check:
-                    print(
-                        f"\nPackage '{package.name}' can be promoted from '{repo}' ({versions[-1].version_str}) "
-                        f"to '{other_repo}' (Package doesn't exist in {other_repo})"
+                        other_versions.sort()
+
+                        if not promote_check:
+                            writer.print(
+                                f"Versions ('{other_repo}'): '{other_versions}'"
+                            )
+
+                        can_promote = (
+                            other_versions[-1].debian_version
+                            < versions[-1].debian_version
+                        )
+                        record["destinations"].append(
+                            {
+                                "repository": other_repo,
+                                "latest_version": other_versions[-1].version_str,
+                                "decision": "promote" if can_promote else "up-to-date",
+                            }
+                        )
+                        if promote_check and can_promote:
+                            writer.print(
+                                f"\nPackage '{package.name}' can be promoted from '{repo}' ('{versions[-1].version_str}') "
+                                f"to '{other_repo}' (Latest version is '{other_versions[-1].version_str})')"
+                            )
+                            promotion_candidates.append(
+                                PromotionCandidate(
+                                    package=package,
+                                    version=versions[-1],
+                                    source_repository=repo,
+                                    destination_repository=other_repo,
+                                    destination_version=other_versions[-1],
+                                )
+                            )
+                    else:
+                        record["destinations"].append(
+                            {
+                                "repository": other_repo,
+                                "latest_version": None,
+                                "decision": "promote",
+                            }
+                        )
+                        if promote_check:
+                            writer.print(
+                                f"\nPackage '{package.name}' can be promoted from '{repo}' ({versions[-1].version_str}) "
+                                f"to '{other_repo}' (Package doesn't exist in {other_repo})"
+                            )
+                            promotion_candidates.append(
+                                PromotionCandidate(
+                                    package=package,
+                                    version=versions[-1],
+                                    source_repository=repo,
+                                    destination_repository=other_repo,
+                                )
+                            )
+            except Exception as e:
+                logger.error(f"{e}")
+                record["error"] = str(e)
+
+            if cleanup_and_keep:
+                try:
+                    summary = manager.delete_old_versions(
+                        versions=versions,
+                        keep=cleanup_and_keep,
+                        dry_run=dry_run,
+                        jobs=jobs,
+                        journal=journal,
+                        verbose=writer.text,
                     )
-        except Exception as e:
-            logger.error(f"{e}")
-        finally:
-            manager.config.repository = repo
+                    record["cleanup"] = {
+                        "dry_run": dry_run,
+                        "delete": [
+                            v.version_str
+                            for v in versions[: len(versions) - len(summary.kept)]
+                        ],
+                        "deleted": summary.deleted,
+                        "failed": [
+                            {"version": v, "error": error}
+                            for v, error in summary.failed
+                        ],
+                        "kept": summary.kept,
+                    }
+                except Exception as e:
+                    logger.error(f"Cleanup error: {e}")
+                    record["cleanup"] = {"error": str(e)}
 
-        if cleanup_and_keep:
-            try:
-                manager.delete_old_versions(
-                    versions=versions, keep=cleanup_and_keep, dry_run=dry_run
+            if any(d["decision"] == "promote" for d in record["destinations"]):
+                record["decision"] = "promote"
+            elif record["destinations"]:
+                record["decision"] = "up-to-date"
+            # Time spent on the package, from fetching its versions on
+            record["elapsed"] = round(result.elapsed + time.monotonic() - started_at, 6)
+            writer.write(record)
+            writer.print()
+
+    if promote:
+        if manager is None:
+            # Candidates planned along the chain are promoted from 'repo'
+            manager = create_manager(repo)
+        writer.print(f"Promoting {len(promotion_candidates)} packages:")
+        for promotion in manager.promote(
+            promotion_candidates, jobs=jobs, dry_run=dry_run
+        ):
+            writer.print(f"\t{promotion}")
+            writer.write(_promotion_record(promotion))
+
+    writer.close()
+
+    managers = [manager] if manager else []
+    for repository_manager in managers + list(other_managers.values()):
+        stats = repository_manager.connection_stats()
+        logger.debug(
+            f"HTTP connections for '{repository_manager.config.repository}': "
+            f"{stats['opened']} opened, {stats['reused']} reused ({stats['requests']} requests)"
+        )
+        repository_manager.close()
+    engine.close()
+
+    if inventory:
+        inventory.save()
+        logger.info(
+            f"Incremental sync: fetched versions of {inventory.fetched} packages, "
+            f"skipped {inventory.skipped} unchanged packages"
+        )
+
+    if metrics:
+        if metrics_file:
+            metrics.dump(metrics_file, metrics_format)
+        if profile:
+            summary = metrics.to_dict()
+            phases = ", ".join(
+                f"{phase} {seconds:.3f}s"
+                for phase, seconds in summary["profile"].items()
+            )
+            # Network time is summed across threads, so it can exceed the
+            # duration of the run when using '--jobs'
+            logger.info(f"Profile: {phases} (run took {summary['elapsed']:.3f}s)")
+            for endpoint, endpoint_metrics in summary["endpoints"].items():
+                logger.info(
+                    f"Profile: {endpoint}: {endpoint_metrics['requests']} requests, "
+                    f"{endpoint_metrics['pages']} pages, "
+                    f"{endpoint_metrics['bytes_received']} bytes, "
+                    f"{endpoint_metrics['retries']} retries, "
+                    f"{endpoint_metrics['errors']} errors"
                 )
-            except Exception as e:
-                logger.error(f"Cleanup error: {e}")
 
-        print()
+    if stage_errors:
+        raise click.ClickException(
+            f"Promotions couldn't be planned for {len(stage_errors)} stages of the chain"
+        )
+
+
+@click.group()
+@click.option(
+    "-v",
+    "--verbosity",
+    type=click.Choice(
+        ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], case_sensitive=False
+    ),
+    default="INFO",
+    help="Verbosity level.",
+)
+def snapshot(verbosity):
+    """Save and compare local snapshots of PackageCloud repositories."""
+    logging.basicConfig(level=getattr(logging, verbosity))
+
+
+@snapshot.command("save")
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.option(
+    "-r",
+    "--repo",
+    "repos",
+    envvar="PC_REPO",
+    multiple=True,
+    required=True,
+    help="Name of a PackageCloud repository to include in the snapshot.",
+)
+@click.option("--user", envvar="PC_USER", required=True, help="Username.")
+@click.option(
+    "--distro",
+    envvar="PC_DISTRO",
+    required=True,
+    help="Distribution of the repositories.",
+)
+@click.option(
+    "-d",
+    "--distro-version",
+    "distro_versions",
+    envvar="PC_DISTRO_VERSION",
+    multiple=True,
+    required=True,
+    help="Version of the distribution of the repositories.",
+)
+@click.option(
+    "--api-token", envvar="PC_API_TOKEN", required=True, help="PackageCloud API token."
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of requests sent concurrently, across all repositories and distribution versions.",
+)
+@click.option(
+    "--server",
+    envvar="PC_SERVER",
+    default="https://packagecloud.io",
+    show_default=True,
+    help="URL of the PackageCloud server.",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=10,
+    show_default=True,
+    help="Maximum number of requests per second sent to PackageCloud, across all repositories. "
+    "0 disables the limit.",
+)
+def snapshot_save(
+    path, repos, user, distro, distro_versions, api_token, jobs, server, rate_limit
+):
+    """Save the packages and versions of the given repositories to PATH."""
+    transport = HttpTransportConfiguration(pool_size=max(10, jobs))
+    # Shared by the managers of every repository and distro version
+    rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+    configs = [
+        PackageCloudRepoConfiguration(
+            api_token=api_token,
+            repository=repo,
+            user=user,
+            distribution=distro,
+            distribution_version=distro_version,
+            server=server,
+        )
+        for repo in repos
+        for distro_version in distro_versions
+    ]
+
+    async def fetch(engine, config):
+        manager = AsyncPackageCloudManager(
+            PackageCloudManager(config, transport, rate_limiter=rate_limiter), engine
+        )
+        with manager:
+            packages = await manager.list_packages()
+            versions = {}
+            for result in await manager.bulk_package_versions(packages):
+                if result.error:
+                    logger.error(
+                        f"Couldn't get versions of '{result.package.name}': {result.error}"
+                    )
+                    continue
+                versions[result.package.name] = result.versions
+        return packages, versions
+
+    async def fetch_all(engine):
+        # Every repository and distro version is fetched at the same time;
+        # the engine limits how many requests are in flight
+        return await asyncio.gather(*[fetch(engine, config) for config in configs])
+
+    with AsyncEngine(concurrency=jobs) as engine:
+        fetched = asyncio.run(fetch_all(engine))
+
+    with SnapshotStore(path) as store:
+        for config, (packages, versions) in zip(configs, fetched):
+            store.save_repository(config, packages, versions)
+            click.echo(
+                f"Saved {len(packages)} packages from '{config.repository}' ({config.distro_version})"
+            )
+
+
+@snapshot.command("diff")
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+def snapshot_diff(old, new):
+    """Show the package versions added (+) and removed (-) between snapshots
+    OLD and NEW."""
+    with SnapshotStore(old) as old_store, SnapshotStore(new) as new_store:
+        for change in old_store.diff(new_store):
+            click.echo(str(change))
+
+
+@click.command()
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option(
+    "-r",
+    "--repo",
+    "repos",
+    envvar="PC_REPO",
+    multiple=True,
+    required=True,
+    help="Name of a PackageCloud repository to mirror.",
+)
+@click.option("--user", envvar="PC_USER", required=True, help="Username.")
+@click.option(
+    "--distro",
+    envvar="PC_DISTRO",
+    required=True,
+    help="Distribution of the repositories.",
+)
+@click.option(
+    "-d",
+    "--distro-version",
+    "distro_versions",
+    envvar="PC_DISTRO_VERSION",
+    multiple=True,
+    required=True,
+    help="Version of the distribution of the repositories.",
+)
+@click.option(
+    "--api-token", envvar="PC_API_TOKEN", required=True, help="PackageCloud API token."
+)
+@click.option(
+    "-p",
+    "--package-name",
+    "package_names",
+    multiple=True,
+    help="Name of a package to mirror. Can be repeated; all packages are mirrored by default.",
+)
+@click.option(
+    "--latest",
+    type=click.IntRange(min=1),
+    help="Only mirror this number of the newest versions of each package.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of files to download concurrently.",
+)
+@click.option(
+    "--server",
+    envvar="PC_SERVER",
+    default="https://packagecloud.io",
+    show_default=True,
+    help="URL of the PackageCloud server.",
+)
+@click.option(
+    "-v",
+    "--verbosity",
+    type=click.Choice(
+        ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], case_sensitive=False
+    ),
+    default="INFO",
+    help="Verbosity level.",
+)
+def mirror(
+    directory,
+    repos,
+    user,
+    distro,
+    distro_versions,
+    api_token,
+    package_names,
+    latest,
+    jobs,
+    server,
+    verbosity,
+):
+    """Download the package files of the given repositories to DIRECTORY,
+    verifying their sha256. Files already mirrored are skipped and partial
+    downloads are resumed."""
+    logging.basicConfig(level=getattr(logging, verbosity))
+    transport = HttpTransportConfiguration(pool_size=max(10, jobs))
+    failed = 0
+    for repo in repos:
+        for distro_version in distro_versions:
+            config = PackageCloudRepoConfiguration(
+                api_token=api_token,
+                repository=repo,
+                user=user,
+                distribution=distro,
+                distribution_version=distro_version,
+                server=server,
+            )
+            with PackageCloudManager(config, transport) as manager:
+                if package_names:
+                    packages = [manager.get_package(name) for name in package_names]
+                    packages = [package for package in packages if package]
+                else:
+                    packages = manager.list_packages()
+
+                versions = []
+                for result in manager.bulk_package_versions(packages, jobs=jobs):
+                    if result.error:
+                        logger.error(
+                            f"Couldn't get versions of '{result.package.name}': {result.error}"
+                        )
+                        failed += 1
+                        continue
+                    package_versions = sorted(result.versions)
+                    if latest:
+                        package_versions = package_versions[-latest:]
+                    versions.extend(package_versions)
+
+                counts = {status: 0 for status in MirrorStatus}
+                downloaded = 0
+                for result in PackageMirror(manager, directory, jobs=jobs).mirror(
+                    versions
+                ):
+                    counts[result.status] += 1
+                    downloaded += result.bytes_downloaded
+                    if result.status == MirrorStatus.FAILED:
+                        logger.error(str(result))
+                    else:
+                        logger.debug(str(result))
+                failed += counts[MirrorStatus.FAILED]
+                click.echo(
+                    f"Mirrored {len(versions)} files from '{repo}' ({distro}/{distro_version}): "
+                    + ", ".join(
+                        f"{count} {status.value}" for status, count in counts.items()
+                    )
+                    + f" ({downloaded} bytes downloaded)"
+                )
+    if failed:
+        raise click.ClickException(f"{failed} files couldn't be mirrored")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+"""asyncio interface to PackageCloud repositories.
+
+Requests are still sent by the 'requests' session of a PackageCloudManager;
+they run in a thread pool shared by every AsyncPackageCloudManager of an
+AsyncEngine, which bounds how many requests are in flight across all
+repositories and distro versions at once. Each listing runs as a single
+call in the pool, since its pages can only be requested one after the
+other.
+
+The concurrent methods of PackageCloudManager, those taking 'jobs', are
+thin wrappers over the coroutines of this module: they run on the engine of
+the manager, so a CLI run sharing one engine between its managers has a
+single limit on concurrent requests.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Awaitable, Callable, List, Optional
+
+from .classes import (
+    PackageCloudManager,
+    PackageFragment,
+    PackageVersion,
+    PackageVersionsResult,
+    PromotionCandidate,
+    PromotionResult,
+)
+from .journal import DeletionJournal, DeletionSummary
+
+
+class AsyncEngine:
+    def __init__(self, concurrency: int = 10) -> None:
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # Event loop for callers that aren't coroutines, started on first use
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking call in the thread pool, where it waits for a free
+        worker if 'concurrency' calls are already running."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    def submit(self, coroutine: Awaitable) -> Future:
+        """Schedule 'coroutine' from synchronous code, returning a future for
+        its result."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, daemon=True
+                )
+                self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join()
+                self._loop.close()
+                self._loop = None
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncPackageCloudManager:
+    """Coroutine counterpart of PackageCloudManager.
+
+    'manager' provides the transport, cache, inventory and rate limiter;
+    a TokenBucket shared between managers limits the rate of requests of
+    all of them.
+    """
+
+    def __init__(self, manager: PackageCloudManager, engine: AsyncEngine) -> None:
+        self.manager = manager
+        self.engine = engine
+
+    @property
+    def config(self):
+        return self.manager.config
+
+    def close(self) -> None:
+        self.manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    async def list_packages(self) -> List[PackageVersion]:
+        return await self.engine.run(self.manager.list_packages)
+
+    async def get_package(self, package_name: str) -> Optional[PackageVersion]:
+        index = self.manager.cached_package_index()
+        if index is None:
+            await self.list_packages()
+            index = self.manager.cached_package_index()
+        return index.get(package_name)
+
+    async def package_versions(self, package: PackageVersion) -> List[PackageFragment]:
+        return await self.engine.run(self.manager.package_versions, package)
+
+    async def fetch_package_versions(
+        self, package: PackageVersion
+    ) -> PackageVersionsResult:
+        """Versions of 'package', or the error that prevented getting them."""
+        started_at = time.monotonic()
+        result = PackageVersionsResult(package=package)
+        try:
+            result.versions = await self.package_versions(package)
+        except Exception as e:
+            result.error = e
+        result.elapsed = time.monotonic() - started_at
+        return result
+
+    async def bulk_package_versions(
+        self, packages: List[PackageVersion]
+    ) -> List[PackageVersionsResult]:
+        return list(
+            await asyncio.gather(
+                *[self.fetch_package_versions(package) for package in packages]
+            )
+        )
+
+    async def delete_old_versions(
+        self,
+        versions: List[PackageFragment],
+        keep: int,
+        dry_run: bool = False,
+        journal: Optional[DeletionJournal] = None,
+        verbose: bool = True,
+    ) -> DeletionSummary:
+        summary, to_delete = self.manager.plan_deletion(
+            versions, keep, dry_run, journal, verbose
+        )
+        results = await asyncio.gather(
+            *[
+                self.engine.run(self.manager.delete_version, version_obj)
+                for version_obj in to_delete
+            ]
+        )
+        return self.manager.finish_deletion(
+            versions, summary, list(results), dry_run, journal, verbose
+        )
+
+    async def promote(
+        self, candidates: List[PromotionCandidate], dry_run: bool = False
+    ) -> List[PromotionResult]:
+        results = await asyncio.gather(
+            *[
+                self.engine.run(self.manager.promote_candidate, candidate, dry_run)
+                for candidate in candidates
+            ]
+        )
+        return self.manager.finish_promotion(list(results))
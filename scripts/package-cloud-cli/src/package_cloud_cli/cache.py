@@ -0,0 +1,178 @@
+"""On-disk cache for GET responses from the PackageCloud API."""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "package-cloud-cli")
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    body: str
+    stored_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    link: Optional[str] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Link": self.link} if self.link else {}
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = 600,
+        max_size: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(url: str) -> str:
+        # Credentials are part of the URLs used by the manager; they must not
+        # end up on disk nor make the same resource map to different entries
+        parts = urlsplit(url)
+        netloc = parts.hostname or ""
+        if parts.port:
+            netloc += f":{parts.port}"
+        path = re.sub("/+", "/", parts.path)
+        return urlunsplit((parts.scheme, netloc, path, parts.query, ""))
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _entries(self):
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.is_file() and dir_entry.name.endswith(".json"):
+                yield dir_entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.ttl
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        path = self._path(self.key(url))
+        try:
+            with open(path, "r") as f:
+                entry = CacheEntry(**json.load(f))
+            # Access time is tracked with the file modification time, which
+            # is used to evict the least recently used entries
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.debug(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        return entry
+
+    def put(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        link: Optional[str] = None,
+    ) -> CacheEntry:
+        key = self.key(url)
+        entry = CacheEntry(
+            url=key,
+            body=body,
+            stored_at=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+            link=link,
+        )
+        self._write(entry)
+        self._evict()
+        return entry
+
+    def revalidated(self, entry: CacheEntry) -> None:
+        entry.stored_at = time.time()
+        self._write(entry)
+
+    def invalidate(self, url_prefix: str) -> int:
+        prefix = self.key(url_prefix)
+        removed = 0
+        with self._lock:
+            for dir_entry in list(self._entries()):
+                try:
+                    with open(dir_entry.path, "r") as f:
+                        url = json.load(f).get("url", "")
+                except (OSError, ValueError):
+                    url = prefix
+                if url.startswith(prefix):
+                    self._remove(dir_entry.path)
+                    removed += 1
+        logger.debug(f"Invalidated {removed} cache entries for {prefix}")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            for dir_entry in list(self._entries()):
+                self._remove(dir_entry.path)
+
+    def _write(self, entry: CacheEntry) -> None:
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as f:
+                json.dump(asdict(entry), f)
+            os.replace(tmp_path, self._path(entry.url))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+    def _evict(self) -> None:
+        with self._lock:
+            stats = []
+            for dir_entry in self._entries():
+                try:
+                    stat = dir_entry.stat()
+                except FileNotFoundError:
+                    continue
+                stats.append((stat.st_mtime, stat.st_size, dir_entry.path))
+
+            size = sum(s[1] for s in stats)
+            for _, entry_size, path in sorted(stats):
+                if size <= self.max_size:
+                    break
+                self._remove(path)
+                size -= entry_size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,12 +1,38 @@
 """Command-line interface for working with Package Cloud repositories."""
 import logging
-from dataclasses import dataclass, field
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Callable, List, Optional
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import requests
 from linkheader_parser import parse
-from packaging import version
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import CacheEntry, ResponseCache
+from .debversion import DebianVersion
+from .inventory import InventoryStore
+from .journal import DeletionJournal, DeletionSummary
+from .metrics import Endpoint, RequestMetrics
+from .ratelimit import TokenBucket, retry_after_seconds
+
+if TYPE_CHECKING:
+    from .async_manager import AsyncEngine, AsyncPackageCloudManager
 
 logger = logging.getLogger(__name__)
 
@@ -18,19 +44,34 @@ class PackageCloudRepoConfiguration:
     user: str
     distribution: str
     distribution_version: str
+    server: str = "https://packagecloud.io"
 
     @property
     def base(self):
-        return f"https://{self.api_token}:@packagecloud.io/"
+        scheme, _, host = self.server.rstrip("/").partition("://")
+        return f"{scheme}://{self.api_token}:@{host}/"
 
     @property
     def base_url(self):
         return f"{self.base}/api/v1/repos/{self.user}/{self.repository}"
 
+    @property
+    def distro_version(self):
+        return f"{self.distribution}/{self.distribution_version}"
+
     @property
     def packages_url(self):
+        # Listing the packages of a single distro version also makes their
+        # 'versions_url' scoped to that distro version
+        if self.distribution and self.distribution_version:
+            return f"{self.base_url}/packages/deb/{self.distro_version}.json"
         return f"{self.base_url}/packages/deb.json"
 
+    def matches_distro(self, distro_version: Optional[str]) -> bool:
+        if not distro_version or not self.distribution_version:
+            return True
+        return distro_version in (self.distro_version, self.distribution_version)
+
 
 @dataclass
 class PackageVersion:
@@ -45,37 +86,59 @@ class PackageVersion:
         return f"{self.name}"
 
 
-@dataclass(order=True)
 class PackageFragment:
     # From https://packagecloud.io/docs/api#object_PackageFragment
-    name: str  # The name of the package.
-    created_at: str  # When the package was uploaded.
-    distro_version: str  # The distro_version for the package.
-    version: str  # The version of the package.
-    release: str  # The release of the package (if available).
-    epoch: str  # The epoch of the package (if available).
-    scope: str  # The scope of the package (if available).
-    private: str  # Whether or not the package is in a private repository.
-    type: str  # The type of package ("deb", "gem", or "rpm").
-    filename: str  # The filename of the package.
-    uploader_name: str  # The name of the uploader for the package.
-    indexed: str  # Whether or not this package has been indexed.
-    repository_html_url: str  # The HTML url of the repository.
-    package_url: str  # The API url for this package.
-    package_html_url: str  # The HTML url for this package.
-    downloads_detail_url: str  # The url to get access log details for package downloads.
-    downloads_series_url: str  # The url to get time series data for package downloads.
-    downloads_count_url: str  # The url to get the total number of package downloads.
-    promote_url: str  # The url for promoting this to another repository.
-    destroy_url: str  # The url for the HTTP DELETE request to destroy this package.
-    # Not in documentation:
-    sha256sum: str
-    download_url: str
-
-    sort_index: int = field(init=False, repr=False)
-
-    def __post_init__(self):
-        self.sort_index = version.parse(self.version_str)
+    # Versions are allocated for every version of every package, so only the
+    # fields used by the CLI are kept
+    __slots__ = (
+        "name",  # The name of the package.
+        "created_at",  # When the package was uploaded.
+        "distro_version",  # The distro_version for the package.
+        "version",  # The version of the package.
+        "release",  # The release of the package (if available).
+        "epoch",  # The epoch of the package (if available).
+        "filename",  # The filename of the package.
+        "promote_url",  # The url for promoting this to another repository.
+        "destroy_url",  # The url for the HTTP DELETE request to destroy this package.
+        # Not in documentation:
+        "sha256sum",
+        "download_url",
+        "_debian_version",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        release: Optional[str] = None,
+        epoch: Optional[str] = None,
+        created_at: Optional[str] = None,
+        distro_version: Optional[str] = None,
+        filename: Optional[str] = None,
+        promote_url: Optional[str] = None,
+        destroy_url: Optional[str] = None,
+        sha256sum: Optional[str] = None,
+        download_url: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.version = version
+        self.release = release
+        self.epoch = epoch
+        self.created_at = created_at
+        self.distro_version = distro_version
+        self.filename = filename
+        self.promote_url = promote_url
+        self.destroy_url = destroy_url
+        self.sha256sum = sha256sum
+        self.download_url = download_url
+        self._debian_version: Optional[DebianVersion] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PackageFragment":
+        return cls(**{f: data.get(f) for f in cls.__slots__ if not f.startswith("_")})
+
+    def to_dict(self) -> Dict:
+        return {f: getattr(self, f) for f in self.__slots__ if not f.startswith("_")}
 
     @property
     def version_str(self):
@@ -84,10 +147,123 @@ class PackageFragment:
             v += f"-{self.release}"
         return v
 
+    @property
+    def debian_version(self) -> DebianVersion:
+        # Parsed once, as it's used as the sort key
+        if self._debian_version is None:
+            self._debian_version = DebianVersion(
+                int(self.epoch or 0), self.version, self.release or ""
+            )
+        return self._debian_version
+
+    def _key(self):
+        # The distro version only breaks ties, so that fragments that are
+        # equal are also the only ones that sort the same
+        return (self.name, self.debian_version.key, self.distro_version or "")
+
+    def __eq__(self, other):
+        if not isinstance(other, PackageFragment):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __lt__(self, other):
+        if not isinstance(other, PackageFragment):
+            return NotImplemented
+        return self._key() < other._key()
+
+    def __le__(self, other):
+        if not isinstance(other, PackageFragment):
+            return NotImplemented
+        return self._key() <= other._key()
+
+    def __gt__(self, other):
+        if not isinstance(other, PackageFragment):
+            return NotImplemented
+        return self._key() > other._key()
+
+    def __ge__(self, other):
+        if not isinstance(other, PackageFragment):
+            return NotImplemented
+        return self._key() >= other._key()
+
     def __repr__(self):
         return f"{self.version_str}"
 
 
+@dataclass
+class HttpTransportConfiguration:
+    pool_size: int = 10
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    retries: int = 3
+    backoff_factor: float = 0.5
+    retry_statuses: tuple = (500, 502, 503, 504)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+
+@dataclass
+class PackageVersionsResult:
+    package: PackageVersion
+    versions: Optional[List[PackageFragment]] = None
+    error: Optional[Exception] = None
+    # Seconds taken to get the versions, whether they were fetched or not
+    elapsed: float = 0.0
+
+
+@dataclass
+class PromotionCandidate:
+    package: PackageVersion
+    version: PackageFragment
+    source_repository: str
+    destination_repository: str
+    # Latest version in the destination repository, if the package exists there
+    destination_version: Optional[PackageFragment] = None
+    distro_version: Optional[str] = None
+
+    def __str__(self):
+        message = (
+            f"Package '{self.package.name}' can be promoted from '{self.source_repository}' "
+            f"('{self.version.version_str}') to '{self.destination_repository}' "
+        )
+        if self.destination_version:
+            message += f"(Latest version is '{self.destination_version.version_str}')"
+        else:
+            message += f"(Package doesn't exist in {self.destination_repository})"
+        if self.distro_version:
+            message += f" for '{self.distro_version}'"
+        return message
+
+
+class PromotionStatus(Enum):
+    PROMOTED = "promoted"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    DRY_RUN = "dry-run"
+
+
+@dataclass
+class PromotionResult:
+    candidate: PromotionCandidate
+    status: PromotionStatus
+    error: Optional[str] = None
+
+    def __str__(self):
+        c = self.candidate
+        message = (
+            f"{self.status.value.capitalize()}: '{c.package.name}' ('{c.version.version_str}') "
+            f"from '{c.source_repository}' to '{c.destination_repository}'"
+        )
+        if self.error:
+            message += f": {self.error}"
+        return message
+
+
 class RequestType(Enum):
     GET = auto()
     POST = auto()
@@ -96,90 +272,502 @@ class RequestType(Enum):
 
 
 class PackageCloudManager:
-    def __init__(self, config: PackageCloudRepoConfiguration) -> None:
-        self.config = config
-
-    def _send_request(
-        self, url: str, request_type: RequestType, callback: Optional[Callable]
+    def __init__(
+        self,
+        config: PackageCloudRepoConfiguration,
+        transport: Optional[HttpTransportConfiguration] = None,
+        prefetch_pages: bool = False,
+        cache: Optional[ResponseCache] = None,
+        inventory: Optional[InventoryStore] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        metrics: Optional[RequestMetrics] = None,
+        engine: Optional["AsyncEngine"] = None,
     ) -> None:
-        def format_url(url):
-            if url.startswith("/"):
-                url = self.config.base + url
-            if self.config.api_token in url:
-                return url
-            u = url.split("https://")
-            return f"https://{self.config.api_token}:@{u[1]}"
-
-        url = format_url(url)
+        self.config = config
+        self.rate_limiter = rate_limiter
+        # Runs the concurrent requests of 'jobs' arguments; without one, an
+        # engine is started for each call
+        self.engine = engine
+        self.metrics = metrics
+        self.cache = cache
+        self.inventory = inventory
+        self.prefetch_pages = prefetch_pages
+        self.transport = transport if transport else HttpTransportConfiguration()
+        self.session = self._create_session()
+        # Maps repository name to an index of its packages by name
+        self._package_index: Dict[str, Dict[str, PackageVersion]] = {}
+        self._package_index_lock = threading.Lock()
+
+    def _create_session(self) -> requests.Session:
+        retry_kwargs = dict(
+            total=self.transport.retries,
+            connect=self.transport.retries,
+            read=self.transport.retries,
+            status=self.transport.retries,
+            backoff_factor=self.transport.backoff_factor,
+            # 429 is retried by _request, which pauses the rate limiter shared
+            # by every thread for as long as Retry-After asks. urllib3 would
+            # otherwise sleep in the calling thread only, and its retries
+            # would be retried again by _request
+            status_forcelist=tuple(
+                status for status in self.transport.retry_statuses if status != 429
+            ),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        # Promoting a package that was already promoted fails without side
+        # effects, so POST requests can be retried as well
+        methods = frozenset(["GET", "DELETE", "POST"])
+        try:
+            retry = Retry(allowed_methods=methods, **retry_kwargs)
+        except TypeError:
+            # urllib3 < 1.26
+            retry = Retry(method_whitelist=methods, **retry_kwargs)
+
+        # A single adapter is shared by every request so that connections to
+        # packagecloud are kept alive and reused across pages and packages
+        adapter = HTTPAdapter(
+            pool_connections=self.transport.pool_size,
+            pool_maxsize=self.transport.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        opened = 0
+        requests_sent = 0
+        adapters = {id(a): a for a in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                requests_sent += pool.num_requests
+        return {
+            "requests": requests_sent,
+            "opened": opened,
+            "reused": max(requests_sent - opened, 0),
+        }
+
+    def _format_url(self, url: str) -> str:
+        if url.startswith("/"):
+            url = self.config.base + url
+        if self.config.api_token in url:
+            return url
+        scheme, _, location = url.partition("://")
+        return f"{scheme}://{self.config.api_token}:@{location}"
+
+    def _request(
+        self,
+        url: str,
+        request_type: RequestType,
+        headers: Optional[Dict[str, str]] = None,
+        expected_statuses: tuple = (200,),
+        data: Optional[Dict[str, str]] = None,
+    ) -> requests.Response:
+        url = self._format_url(url)
 
         logger.debug(
             f"send_request: {request_type.name} - {url.replace(self.config.api_token, '*********')}"
         )
 
         if request_type == RequestType.GET:
-            request_response = requests.get(url)
-            if request_response.status_code != 200:
-                raise Exception(f"{request_response.text}")
-
-            # Responses might have headers for pagination
-            # See https://packagecloud.io/docs/api#pagination
-            if hasattr(request_response, "headers") and request_response.headers.get(
-                "Link"
-            ):
-                link = parse(request_response.headers["Link"])
-                if link.get("next") and link["next"].get("url"):
-                    self._send_request(
-                        url=link["next"]["url"],
-                        request_type=RequestType.GET,
-                        callback=callback,
-                    )
-
+            send = self.session.get
         elif request_type == RequestType.DELETE:
-            request_response = requests.delete(url)
-            if request_response.status_code != 200:
-                raise Exception(f"{request_response.text}")
-
+            send = self.session.delete
+        elif request_type == RequestType.POST:
+            send = partial(self.session.post, data=data)
         else:
             raise NotImplementedError
 
+        endpoint = Endpoint.from_request(request_type.name, url)
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            request_response = self._timed_send(send, url, endpoint, headers)
+            if request_response.status_code != 429 or attempt >= self.transport.retries:
+                break
+
+            attempt += 1
+            if self.metrics:
+                self.metrics.record_retry(endpoint)
+            delay = retry_after_seconds(
+                request_response.headers.get("Retry-After"),
+                default=self.transport.backoff_factor * (2**attempt),
+            )
+            logger.warning(f"Rate limited by PackageCloud, retrying in {delay:.1f}s")
+            if self.rate_limiter:
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+        if request_response.status_code not in expected_statuses:
+            if self.metrics:
+                self.metrics.record_error(endpoint)
+            raise Exception(f"{request_response.text}")
+        return request_response
+
+    def _timed_send(
+        self,
+        send: Callable,
+        url: str,
+        endpoint: Endpoint,
+        headers: Optional[Dict[str, str]],
+    ) -> requests.Response:
+        if self.metrics is None:
+            return send(url, headers=headers, timeout=self.transport.timeout)
+
+        started_at = time.perf_counter()
+        try:
+            response = send(url, headers=headers, timeout=self.transport.timeout)
+        except Exception:
+            self.metrics.record_request(endpoint, time.perf_counter() - started_at)
+            self.metrics.record_error(endpoint)
+            raise
+        # Retries done by urllib3 happen within a single call to 'send'
+        retry = getattr(response.raw, "retries", None)
+        self.metrics.record_request(
+            endpoint,
+            time.perf_counter() - started_at,
+            bytes_received=len(response.content),
+            retries=len(retry.history) if retry else 0,
+        )
+        return response
+
+    @contextmanager
+    def _timer(self, phase: str):
+        if self.metrics is None:
+            yield
+            return
+        with self.metrics.timer(phase):
+            yield
+
+    def _decode_page(self, url: str, response: Union[requests.Response, CacheEntry]):
+        if self.metrics:
+            self.metrics.record_page(Endpoint.from_request("GET", url))
+        with self._timer("json_decoding"):
+            return response.json()
+
+    def _invalidate_cached_repository(self, url: str) -> None:
+        match = re.search(r"/api/v1/repos/[^/]+/[^/]+/", ResponseCache.key(url))
+        if match:
+            self.cache.invalidate(ResponseCache.key(url)[: match.end()])
+
+    def _get(self, url: str) -> Union[requests.Response, CacheEntry]:
+        if self.cache is None:
+            return self._request(url, RequestType.GET)
+
+        url = self._format_url(url)
+        entry = self.cache.get(url)
+        if entry and self.cache.is_fresh(entry):
+            logger.debug(f"send_request: GET - {entry.url} (cached)")
+            return entry
+
+        response = self._request(
+            url,
+            RequestType.GET,
+            headers=entry.validators if entry else None,
+            expected_statuses=(200, 304) if entry else (200,),
+        )
+        if response.status_code == 304 and entry:
+            logger.debug(f"send_request: GET - {entry.url} (not modified)")
+            self.cache.revalidated(entry)
+            return entry
+
+        self.cache.put(
+            url,
+            response.text,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            link=response.headers.get("Link"),
+        )
+        return response
+
+    @staticmethod
+    def _next_page_url(response: Union[requests.Response, CacheEntry]) -> Optional[str]:
+        # Responses might have headers for pagination
+        # See https://packagecloud.io/docs/api#pagination
+        if not response.headers.get("Link"):
+            return None
+        link = parse(response.headers["Link"])
+        if link.get("next") and link["next"].get("url"):
+            return link["next"]["url"]
+        return None
+
+    def _fetch_page(
+        self, url: str, listing_url: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """A page of a listing and the URL of its next page, if any.
+        'listing_url' is the URL of the first page, used for metrics."""
+        response = self._get(url)
+        next_url = self._next_page_url(response)
+        return self._decode_page(listing_url or url, response), next_url
+
+    def _iter_pages(self, url: str, prefetch: Optional[bool] = None) -> Iterator:
+        if prefetch is None:
+            prefetch = self.prefetch_pages
+
+        if not prefetch:
+            next_url: Optional[str] = url
+            while next_url:
+                page, next_url = self._fetch_page(next_url, listing_url=url)
+                yield page
+            return
+
+        # Request the next page in the background while the current one is
+        # being processed by the caller
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future: Optional[Future] = executor.submit(self._get, url)
+            while future is not None:
+                response = future.result()
+                next_url = self._next_page_url(response)
+                future = executor.submit(self._get, next_url) if next_url else None
+                yield self._decode_page(url, response)
+
+    def _send_request(
+        self, url: str, request_type: RequestType, callback: Optional[Callable]
+    ) -> None:
+        if request_type == RequestType.GET:
+            for page in self._iter_pages(url):
+                if callable(callback):
+                    callback(page)
+            return
+
+        request_response = self._request(url, request_type)
         if callable(callback):
             callback(request_response.json())
 
+    @contextmanager
+    def _async_manager(self, jobs: int) -> Iterator["AsyncPackageCloudManager"]:
+        """This manager as an AsyncPackageCloudManager, on 'engine' or on an
+        engine running at most 'jobs' requests at once."""
+        # Imported here, since the async manager is built on top of this class
+        from .async_manager import AsyncEngine, AsyncPackageCloudManager
+
+        if self.engine:
+            yield AsyncPackageCloudManager(self, self.engine)
+            return
+        with AsyncEngine(concurrency=jobs) as engine:
+            yield AsyncPackageCloudManager(self, engine)
+
     ##############
     # Public API #
     ##############
 
-    def list_packages(self) -> List[PackageVersion]:
-        packages = []
-
-        def parse_packages_response(response):
-            for package in response:
-                packages.append(PackageVersion(**package))
+    def iter_packages(
+        self, prefetch: Optional[bool] = None
+    ) -> Iterator[PackageVersion]:
+        for page in self._iter_pages(self.config.packages_url, prefetch=prefetch):
+            for package in page:
+                yield PackageVersion(**package)
 
-        self._send_request(
-            self.config.packages_url,
-            request_type=RequestType.GET,
-            callback=parse_packages_response,
-        )
+    def list_packages(self) -> List[PackageVersion]:
+        packages = list(self.iter_packages())
+        self._index_packages(packages)
         return packages
 
+    def _index_packages(self, packages: List[PackageVersion]) -> None:
+        """Keep 'packages' as the package index of the repository."""
+        with self._package_index_lock:
+            self._package_index[self.config.repository] = {
+                package.name: package for package in packages
+            }
+
+    def cached_package_index(self) -> Optional[Dict[str, PackageVersion]]:
+        """Package index of the repository, without listing it if it
+        isn't indexed yet."""
+        with self._package_index_lock:
+            return self._package_index.get(self.config.repository)
+
+    def package_index(self) -> Dict[str, PackageVersion]:
+        index = self.cached_package_index()
+        if index is None:
+            self.list_packages()
+            index = self.cached_package_index()
+        return index
+
+    def invalidate_package_index(self, repository: Optional[str] = None) -> None:
+        if repository is None:
+            repository = self.config.repository
+        with self._package_index_lock:
+            self._package_index.pop(repository, None)
+
     def get_package(self, package_name: str) -> Optional[PackageVersion]:
-        for package_obj in self.list_packages():
-            if package_obj.name == package_name:
-                return package_obj
-        return None
+        return self.package_index().get(package_name)
+
+    def iter_package_versions(
+        self, package: PackageVersion, prefetch: Optional[bool] = None
+    ) -> Iterator[PackageFragment]:
+        for page in self._iter_pages(package.versions_url, prefetch=prefetch):
+            yield from self._versions_from_page(page)
+
+    def _versions_from_page(self, page: List[Dict]) -> List[PackageFragment]:
+        """Versions of the configured distro in a page of a version listing."""
+        # Versions of other distros are skipped in case the server didn't
+        # scope the listing to the configured distro version
+        with self._timer("fragment_construction"):
+            return [
+                PackageFragment.from_dict(version_response)
+                for version_response in page
+                if self.config.matches_distro(version_response.get("distro_version"))
+            ]
+
+    def _stored_versions(
+        self, package: PackageVersion
+    ) -> Optional[List[PackageFragment]]:
+        """Versions of 'package' from the inventory, or None if they have
+        to be listed."""
+        if self.inventory is None:
+            return None
+        stored_versions = self.inventory.versions(self.config, package)
+        if stored_versions is None:
+            return None
+        logger.debug(f"Versions of '{package.name}' didn't change since last sync")
+        with self._timer("fragment_construction"):
+            return [PackageFragment.from_dict(v) for v in stored_versions]
+
+    def _store_versions(
+        self, package: PackageVersion, versions: List[PackageFragment]
+    ) -> None:
+        """Keep the listed 'versions' of 'package' in the inventory."""
+        if self.inventory:
+            self.inventory.update(self.config, package, [v.to_dict() for v in versions])
 
     def package_versions(self, package: PackageVersion) -> List[PackageFragment]:
-        versions = []
-
-        def parse_versions(response):
-            for version_response in response:
-                versions.append(PackageFragment(**version_response))
+        versions = self._stored_versions(package)
+        if versions is None:
+            versions = list(self.iter_package_versions(package))
+            self._store_versions(package, versions)
+        return versions
 
-        self._send_request(
-            package.versions_url, request_type=RequestType.GET, callback=parse_versions
+    def bulk_package_versions(
+        self, packages: List[PackageVersion], jobs: int = 1
+    ) -> List[PackageVersionsResult]:
+        return list(self.iter_bulk_package_versions(packages, jobs=jobs))
+
+    def iter_bulk_package_versions(
+        self, packages: List[PackageVersion], jobs: int = 1
+    ) -> Iterator[PackageVersionsResult]:
+        with self._async_manager(jobs) as async_manager:
+            futures = [
+                async_manager.engine.submit(async_manager.fetch_package_versions(p))
+                for p in packages
+            ]
+            try:
+                # Results are yielded in the same order as 'packages',
+                # regardless of the order in which the requests complete
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def promote(
+        self,
+        candidates: List[PromotionCandidate],
+        jobs: int = 1,
+        dry_run: bool = False,
+    ) -> List[PromotionResult]:
+        with self._async_manager(jobs) as async_manager:
+            return async_manager.engine.submit(
+                async_manager.promote(candidates, dry_run=dry_run)
+            ).result()
+
+    def promote_candidate(
+        self, candidate: PromotionCandidate, dry_run: bool = False
+    ) -> PromotionResult:
+        """Promote a single candidate, returning the error instead of raising
+        it."""
+        if dry_run:
+            return PromotionResult(candidate, PromotionStatus.DRY_RUN)
+        try:
+            response = self._request(
+                candidate.version.promote_url,
+                RequestType.POST,
+                data={
+                    "destination": f"{self.config.user}/{candidate.destination_repository}"
+                },
+                expected_statuses=(200, 201, 409, 422),
+            )
+        except Exception as e:
+            return PromotionResult(candidate, PromotionStatus.FAILED, str(e))
+
+        if response.status_code in (409, 422):
+            # PackageCloud rejects promotions of versions that already
+            # exist in the destination repository
+            return PromotionResult(
+                candidate, PromotionStatus.SKIPPED, response.text.strip()
+            )
+        return PromotionResult(candidate, PromotionStatus.PROMOTED)
+
+    def finish_promotion(self, results: List[PromotionResult]) -> List[PromotionResult]:
+        """Invalidate what the promotions in 'results' changed."""
+        # Promoting moves a package, so listings of both repositories change
+        modified_repositories = set()
+        for result in results:
+            if result.status == PromotionStatus.PROMOTED:
+                modified_repositories.add(result.candidate.source_repository)
+                modified_repositories.add(result.candidate.destination_repository)
+
+        for repository in modified_repositories:
+            self.invalidate_package_index(repository)
+            if self.cache:
+                self.cache.invalidate(
+                    f"{self.config.base}/api/v1/repos/{self.config.user}/{repository}/"
+                )
+        return results
+
+    def open_download(
+        self, version: PackageFragment, offset: int = 0
+    ) -> requests.Response:
+        """Start downloading the file of a package version, from 'offset'
+        bytes when resuming a partial download.
+
+        The body of the response is streamed; callers must close it. When
+        resuming, a 416 response is returned too: there is nothing after
+        'offset', and the caller has to check what it has already got.
+        """
+        if not version.download_url:
+            raise Exception(f"'{version.filename}' has no download URL")
+        url = self._format_url(version.download_url)
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        endpoint = Endpoint.DOWNLOAD
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        started_at = time.perf_counter()
+        response = self.session.get(
+            url, headers=headers, stream=True, timeout=self.transport.timeout
         )
-        return versions
+        if self.metrics:
+            self.metrics.record_request(
+                endpoint,
+                time.perf_counter() - started_at,
+                bytes_received=int(response.headers.get("Content-Length", 0)),
+            )
+        if response.status_code not in ((200, 206, 416) if offset else (200, 206)):
+            if self.metrics:
+                self.metrics.record_error(endpoint)
+            response.close()
+            raise Exception(
+                f"Couldn't download '{version.filename}': HTTP {response.status_code}"
+            )
+        return response
 
     def package_latest_version(
         self, package: PackageVersion
@@ -190,9 +778,17 @@ class PackageCloudManager:
                 latest = candidate
         return latest
 
-    def delete_old_versions(
-        self, versions: List[PackageFragment], keep: int, dry_run: bool = False
-    ) -> None:
+    def plan_deletion(
+        self,
+        versions: List[PackageFragment],
+        keep: int,
+        dry_run: bool,
+        journal: Optional[DeletionJournal],
+        verbose: bool,
+    ) -> Tuple[DeletionSummary, List[PackageFragment]]:
+        """Check that 'versions' can be cleaned up, returning the versions
+        to delete that weren't already deleted according to 'journal'."""
+
         def find_duplicates(versions: List[PackageFragment]) -> List[str]:
             seen = set()
             duplicates = []
@@ -218,22 +814,104 @@ class PackageCloudManager:
         versions_to_keep = min(keep, len(versions))
         versions_to_delete = len(versions) - versions_to_keep
 
-        print(
-            f"Deleting old versions: will delete {versions_to_delete} and leave {versions_to_keep}"
-        )
+        if verbose:
+            print(
+                f"Deleting old versions: will delete {versions_to_delete} and leave {versions_to_keep}"
+            )
+        summary = DeletionSummary()
+        summary.kept = [v.version_str for v in versions[versions_to_delete:]]
+        to_delete = []
         for version_obj in versions[0:versions_to_delete]:
-            print(f"\tDeleting: {version_obj.version_str}")
+            if verbose:
+                print(f"\tDeleting: {version_obj.version_str}")
             if dry_run:
                 continue
-            try:
-                self._send_request(
-                    url=version_obj.destroy_url,
-                    request_type=RequestType.DELETE,
-                    callback=None,
+            if journal and journal.is_done(version_obj.destroy_url):
+                summary.skipped.append(version_obj.version_str)
+                continue
+            if journal:
+                journal.record(
+                    version_obj.destroy_url,
+                    DeletionJournal.PENDING,
+                    name=version_obj.name,
+                    version=version_obj.version_str,
                 )
-            except Exception as e:
-                logger.error(
-                    f"Error deleting {version_obj.name} {version_obj.version_str}': {e}"
+            to_delete.append(version_obj)
+        return summary, to_delete
+
+    def delete_version(
+        self, version_obj: PackageFragment
+    ) -> Tuple[PackageFragment, Optional[Exception]]:
+        """Delete a version planned by 'plan_deletion', returning the error
+        instead of raising it."""
+        try:
+            self._send_request(
+                url=version_obj.destroy_url,
+                request_type=RequestType.DELETE,
+                callback=None,
+            )
+        except Exception as e:
+            logger.error(
+                f"Error deleting {version_obj.name} {version_obj.version_str}': {e}"
+            )
+            return version_obj, e
+        return version_obj, None
+
+    def finish_deletion(
+        self,
+        versions: List[PackageFragment],
+        summary: DeletionSummary,
+        results: List[Tuple[PackageFragment, Optional[Exception]]],
+        dry_run: bool,
+        journal: Optional[DeletionJournal],
+        verbose: bool,
+    ) -> DeletionSummary:
+        """Record the 'results' of 'delete_version' in 'summary' and
+        'journal'."""
+        for version_obj, error in results:
+            if error is None:
+                summary.deleted.append(version_obj.version_str)
+            else:
+                summary.failed.append((version_obj.version_str, str(error)))
+            if journal:
+                journal.record(
+                    version_obj.destroy_url,
+                    DeletionJournal.DONE if error is None else DeletionJournal.FAILED,
+                    name=version_obj.name,
+                    version=version_obj.version_str,
+                    error=str(error) if error else None,
                 )
 
-        print(f"Kept versions: {versions[versions_to_delete:]}")
+        if summary.deleted:
+            # Indexed package listings now have outdated version counts.
+            # Cached responses are invalidated once for the whole cleanup,
+            # since that reads every entry of the cache
+            self.invalidate_package_index()
+            if self.cache:
+                self._invalidate_cached_repository(
+                    self._format_url(versions[0].destroy_url)
+                )
+            if self.inventory:
+                self.inventory.forget(self.config, versions[0].name)
+
+        if verbose:
+            if not dry_run:
+                print(summary)
+            print(f"Kept versions: {versions[len(versions) - len(summary.kept):]}")
+        return summary
+
+    def delete_old_versions(
+        self,
+        versions: List[PackageFragment],
+        keep: int,
+        dry_run: bool = False,
+        jobs: int = 1,
+        journal: Optional[DeletionJournal] = None,
+        verbose: bool = True,
+    ) -> DeletionSummary:
+        with self._async_manager(jobs) as async_manager:
+            return async_manager.engine.submit(
+                async_manager.delete_old_versions(
+                    versions, keep, dry_run=dry_run, journal=journal, verbose=verbose
+                )
+            ).result()
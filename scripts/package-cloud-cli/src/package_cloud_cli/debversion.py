@@ -0,0 +1,115 @@
+"""Debian package version parsing and ordering, following dpkg semantics.
+
+See https://www.debian.org/doc/debian-policy/ch-controlfields.html#version
+"""
+import re
+from typing import Optional, Tuple
+
+_DIGITS = re.compile(r"\d+")
+# Marks the end of a string: anything but '~' sorts after it
+_END = ((0,), 0)
+
+
+def _char_order(c: str) -> int:
+    # '~' sorts before everything, even the end of the string; letters sort
+    # before any other non-digit character
+    if c == "~":
+        return -1
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+
+def _part_key(part: str) -> Tuple:
+    """Build a key for an upstream version or revision that compares like
+    dpkg's verrevcmp.
+
+    The string is split into alternating non-digit and digit parts; non-
+    digit parts are compared character by character, digit parts
+    numerically.
+    """
+    key = []
+    position = 0
+    while position < len(part):
+        match = _DIGITS.search(part, position)
+        end = match.start() if match else len(part)
+        non_digits = tuple(_char_order(c) for c in part[position:end]) + (0,)
+        number = int(match.group()) if match else 0
+        key.append((non_digits, number))
+        position = match.end() if match else len(part)
+    # A part that compares like the end of the string, such as the revision
+    # '0', is left out so that '1.0-0' equals '1.0', as it does for dpkg
+    while key and key[-1] == _END:
+        key.pop()
+    key.append(_END)
+    return tuple(key)
+
+
+class DebianVersion:
+    __slots__ = ("epoch", "upstream", "revision", "_key")
+
+    def __init__(self, epoch: int, upstream: str, revision: str = "") -> None:
+        self.epoch = epoch
+        self.upstream = upstream
+        self.revision = revision
+        self._key: Optional[Tuple] = None
+
+    @classmethod
+    def parse(cls, version_str: str) -> "DebianVersion":
+        epoch = 0
+        if ":" in version_str:
+            epoch_str, version_str = version_str.split(":", 1)
+            epoch = int(epoch_str)
+        revision = ""
+        if "-" in version_str:
+            version_str, revision = version_str.rsplit("-", 1)
+        return cls(epoch, version_str, revision)
+
+    @property
+    def key(self) -> Tuple:
+        if self._key is None:
+            self._key = (
+                self.epoch,
+                _part_key(self.upstream),
+                _part_key(self.revision),
+            )
+        return self._key
+
+    def __eq__(self, other):
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.key < other.key
+
+    def __le__(self, other):
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.key <= other.key
+
+    def __gt__(self, other):
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.key > other.key
+
+    def __ge__(self, other):
+        if not isinstance(other, DebianVersion):
+            return NotImplemented
+        return self.key >= other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        version_str = self.upstream
+        if self.epoch:
+            version_str = f"{self.epoch}:{version_str}"
+        if self.revision:
+            version_str += f"-{self.revision}"
+        return version_str
+
+    def __repr__(self):
+        return f"DebianVersion('{self}')"
@@ -0,0 +1,115 @@
+"""Local inventory of package versions, used for incremental repository syncs."""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryInventory:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.packages: Dict[str, Dict] = {}
+        self.modified = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                self.packages = json.load(f).get("packages", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable inventory '{self.path}': {e}")
+
+    def versions(self, package) -> Optional[List[Dict]]:
+        entry = self.packages.get(package.name)
+        if entry is None:
+            return None
+        # A package listing reports how many versions a package has; if it
+        # didn't change since the last sync the stored versions are reused
+        if (
+            entry.get("versions_count") != package.versions_count
+            or entry.get("versions_url") != package.versions_url
+        ):
+            return None
+        return entry.get("versions")
+
+    def update(self, package, versions: List[Dict]) -> None:
+        self.packages[package.name] = {
+            "versions_count": package.versions_count,
+            "versions_url": package.versions_url,
+            "versions": versions,
+        }
+        self.modified = True
+
+    def forget(self, package_name: str) -> None:
+        if self.packages.pop(package_name, None) is not None:
+            self.modified = True
+
+    def save(self) -> None:
+        if not self.modified:
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as f:
+            json.dump({"packages": self.packages}, f)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+class InventoryStore:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.fetched = 0
+        self.skipped = 0
+        self._inventories: Dict[str, RepositoryInventory] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, config) -> str:
+        name = "_".join(
+            (
+                config.user,
+                config.repository,
+                config.distribution,
+                config.distribution_version,
+            )
+        )
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "-", name) + ".json")
+
+    def inventory(self, config) -> RepositoryInventory:
+        path = self._path(config)
+        with self._lock:
+            if path not in self._inventories:
+                self._inventories[path] = RepositoryInventory(path)
+            return self._inventories[path]
+
+    def versions(self, config, package) -> Optional[List[Dict]]:
+        inventory = self.inventory(config)
+        with self._lock:
+            versions = inventory.versions(package)
+            if versions is None:
+                self.fetched += 1
+            else:
+                self.skipped += 1
+        return versions
+
+    def update(self, config, package, versions: List[Dict]) -> None:
+        inventory = self.inventory(config)
+        with self._lock:
+            inventory.update(package, versions)
+
+    def forget(self, config, package_name: str) -> None:
+        inventory = self.inventory(config)
+        with self._lock:
+            inventory.forget(package_name)
+
+    def save(self) -> None:
+        with self._lock:
+            for inventory in self._inventories.values():
+                inventory.save()
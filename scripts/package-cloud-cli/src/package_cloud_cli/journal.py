@@ -0,0 +1,77 @@
+"""Journal of package version deletions, used to resume interrupted cleanups."""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+class DeletionJournal:
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.status: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted run might be incomplete
+                    continue
+                self.status[record["url"]] = record["status"]
+
+    def is_done(self, url: str) -> bool:
+        return self.status.get(url) == self.DONE
+
+    def pending(self) -> List[str]:
+        return [url for url, status in self.status.items() if status != self.DONE]
+
+    def record(
+        self,
+        url: str,
+        status: str,
+        name: str = "",
+        version: str = "",
+        error: Optional[str] = None,
+    ) -> None:
+        record = {
+            "url": url,
+            "name": name,
+            "version": version,
+            "status": status,
+            "time": time.time(),
+        }
+        if error:
+            record["error"] = error
+        with self._lock:
+            self.status[url] = status
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+
+
+@dataclass
+class DeletionSummary:
+    deleted: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    kept: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        summary = (
+            f"Deleted {len(self.deleted)} versions, {len(self.failed)} failed, "
+            f"{len(self.skipped)} already deleted"
+        )
+        for version_str, error in self.failed:
+            summary += f"\n\tFailed: {version_str}: {error}"
+        return summary
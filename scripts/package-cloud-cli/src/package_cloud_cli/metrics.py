@@ -0,0 +1,194 @@
+"""Metrics about the requests sent to the PackageCloud API."""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Dict, List
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Endpoint(Enum):
+    PACKAGES = "packages"
+    VERSIONS = "versions"
+    DELETE = "delete"
+    PROMOTE = "promote"
+    DOWNLOAD = "download"
+    OTHER = "other"
+
+    @classmethod
+    def from_request(cls, method: str, url: str) -> "Endpoint":
+        if method == "DELETE":
+            return cls.DELETE
+        if method == "POST":
+            return cls.PROMOTE
+        path = url.split("?")[0]
+        if path.endswith(".deb"):
+            return cls.DOWNLOAD
+        if path.endswith("/versions.json"):
+            return cls.VERSIONS
+        if "/packages/" in path:
+            return cls.PACKAGES
+        return cls.OTHER
+
+
+@dataclass
+class EndpointMetrics:
+    requests: int = 0
+    pages: int = 0
+    bytes_received: int = 0
+    retries: int = 0
+    errors: int = 0
+    latency_sum: float = 0.0
+    # Number of requests per latency bucket; non cumulative
+    latency_buckets: List[int] = field(
+        default_factory=lambda: [0] * len(LATENCY_BUCKETS)
+    )
+
+    def observe_latency(self, seconds: float) -> None:
+        self.latency_sum += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.latency_buckets[i] += 1
+                break
+
+
+class RequestMetrics:
+    FORMATS = ("json", "prometheus")
+    PROFILE_PHASES = ("network", "json_decoding", "fragment_construction")
+
+    def __init__(self, profile: bool = False) -> None:
+        self.profile = profile
+        self.endpoints: Dict[Endpoint, EndpointMetrics] = {
+            endpoint: EndpointMetrics() for endpoint in Endpoint
+        }
+        self.profile_seconds: Dict[str, float] = {
+            phase: 0.0 for phase in self.PROFILE_PHASES
+        }
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_request(
+        self,
+        endpoint: Endpoint,
+        latency: float,
+        bytes_received: int = 0,
+        retries: int = 0,
+    ) -> None:
+        with self._lock:
+            metrics = self.endpoints[endpoint]
+            metrics.requests += 1
+            metrics.bytes_received += bytes_received
+            metrics.retries += retries
+            metrics.observe_latency(latency)
+            self.profile_seconds["network"] += latency
+
+    def record_retry(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            self.endpoints[endpoint].retries += 1
+
+    def record_error(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            self.endpoints[endpoint].errors += 1
+
+    def record_page(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            self.endpoints[endpoint].pages += 1
+
+    @contextmanager
+    def timer(self, phase: str):
+        if not self.profile:
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self.profile_seconds[phase] += elapsed
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            summary: Dict = {
+                "elapsed": time.monotonic() - self._started_at,
+                "latency_buckets": [str(bound) for bound in LATENCY_BUCKETS],
+                "endpoints": {
+                    endpoint.value: asdict(metrics)
+                    for endpoint, metrics in self.endpoints.items()
+                    if metrics.requests or metrics.pages
+                },
+            }
+            if self.profile:
+                summary["profile"] = dict(self.profile_seconds)
+        return summary
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP package_cloud_{name} {help_text}")
+            lines.append(f"# TYPE package_cloud_{name} {metric_type}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"package_cloud_{name}{{{label_str}}} {value}")
+
+        with self._lock:
+            endpoints = [
+                (endpoint.value, metrics)
+                for endpoint, metrics in self.endpoints.items()
+                if metrics.requests or metrics.pages
+            ]
+            counters = (
+                ("requests_total", "requests", "Requests sent to PackageCloud."),
+                ("pages_total", "pages", "Pages of paginated listings followed."),
+                ("bytes_received_total", "bytes_received", "Bytes received."),
+                ("retries_total", "retries", "Requests retried."),
+                ("errors_total", "errors", "Requests that failed."),
+            )
+            for name, attribute, help_text in counters:
+                metric(
+                    name,
+                    "counter",
+                    help_text,
+                    [({"endpoint": e}, getattr(m, attribute)) for e, m in endpoints],
+                )
+
+            prefix = "package_cloud_request_duration_seconds"
+            lines.append(f"# HELP {prefix} Latency of requests sent to PackageCloud.")
+            lines.append(f"# TYPE {prefix} histogram")
+            for e, m in endpoints:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, m.latency_buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(
+                        f'{prefix}_bucket{{endpoint="{e}",le="{le}"}} {cumulative}'
+                    )
+                lines.append(f'{prefix}_sum{{endpoint="{e}"}} {m.latency_sum}')
+                lines.append(f'{prefix}_count{{endpoint="{e}"}} {m.requests}')
+
+            if self.profile:
+                metric(
+                    "profile_seconds",
+                    "gauge",
+                    "Time spent in each phase of the run.",
+                    [({"phase": p}, s) for p, s in self.profile_seconds.items()],
+                )
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, output_format: str = "json") -> None:
+        content = (
+            self.to_prometheus()
+            if output_format == "prometheus"
+            else json.dumps(self.to_dict(), indent=2) + "\n"
+        )
+        # Written atomically, as textfile collectors might read it at any time
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
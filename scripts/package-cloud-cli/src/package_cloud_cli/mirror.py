@@ -0,0 +1,207 @@
+"""Local mirror of the package files of PackageCloud repositories."""
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterator, List, Optional
+
+from .classes import PackageCloudManager, PackageFragment
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_FILENAME = "index.json"
+
+
+class MirrorStatus(Enum):
+    DOWNLOADED = "downloaded"
+    RESUMED = "resumed"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+@dataclass
+class MirrorResult:
+    version: PackageFragment
+    status: MirrorStatus
+    path: str
+    bytes_downloaded: int = 0
+    error: Optional[str] = None
+
+    def __str__(self):
+        message = f"{self.status.value.capitalize()}: {self.version.filename}"
+        if self.error:
+            message += f": {self.error}"
+        return message
+
+
+class PackageMirror:
+    """Mirror the files of the versions of a repository/distro version into
+    'directory'.
+
+    Files are streamed to disk in chunks and their sha256 is computed while
+    they are written, so memory use doesn't depend on the size of packages.
+    Downloads are written to a '.part' file first and resumed from where they
+    stopped. Files that are already mirrored are verified against the index
+    written by previous runs and skipped.
+    """
+
+    def __init__(
+        self,
+        manager: PackageCloudManager,
+        directory: str,
+        jobs: int = 1,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.manager = manager
+        self.directory = os.path.join(
+            directory,
+            manager.config.repository,
+            manager.config.distribution,
+            manager.config.distribution_version,
+        )
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.index_path = os.path.join(self.directory, INDEX_FILENAME)
+        self._index = self._load_index()
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring corrupted mirror index '{self.index_path}'")
+            return {}
+        return {entry["filename"]: entry for entry in entries}
+
+    def _save_index(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                sorted(self._index.values(), key=lambda e: e["filename"]),
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def _hash_file(self, path: str, hasher=None):
+        hasher = hasher if hasher else hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                hasher.update(chunk)
+        return hasher
+
+    def _is_mirrored(self, version: PackageFragment, path: str) -> bool:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        entry = self._index.get(version.filename)
+        if (
+            entry
+            and entry["sha256sum"] == version.sha256sum
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+        ):
+            # Verified by a previous run and unchanged since
+            return True
+        return self._hash_file(path).hexdigest() == version.sha256sum
+
+    def _download(self, version: PackageFragment, path: str) -> MirrorResult:
+        part_path = f"{path}.part"
+        hasher = hashlib.sha256()
+        offset = 0
+        if os.path.exists(part_path):
+            # Bytes already on disk are hashed again, so that the checksum of
+            # resumed downloads covers the whole file
+            self._hash_file(part_path, hasher)
+            offset = os.path.getsize(part_path)
+            if version.sha256sum and hasher.hexdigest() == version.sha256sum:
+                # Interrupted after the whole file was written
+                os.replace(part_path, path)
+                return MirrorResult(version, MirrorStatus.RESUMED, path)
+
+        downloaded = 0
+        response = self.manager.open_download(version, offset=offset)
+        if response.status_code == 416:
+            # The '.part' file is at least as long as the file
+            response.close()
+            if not version.sha256sum:
+                # Nothing to verify it against
+                os.replace(part_path, path)
+                return MirrorResult(version, MirrorStatus.RESUMED, path)
+            # It doesn't match the checksum, so it's downloaded again
+            os.remove(part_path)
+            offset = 0
+            hasher = hashlib.sha256()
+            response = self.manager.open_download(version)
+        with response:
+            resumed = offset > 0 and response.status_code == 206
+            if offset and not resumed:
+                # The server ignored the range; start from scratch
+                hasher = hashlib.sha256()
+            with open(part_path, "ab" if resumed else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    downloaded += len(chunk)
+
+        if version.sha256sum and hasher.hexdigest() != version.sha256sum:
+            os.remove(part_path)
+            return MirrorResult(
+                version,
+                MirrorStatus.FAILED,
+                path,
+                downloaded,
+                error=f"sha256 mismatch (got {hasher.hexdigest()})",
+            )
+        os.replace(part_path, path)
+        return MirrorResult(
+            version,
+            MirrorStatus.RESUMED if resumed else MirrorStatus.DOWNLOADED,
+            path,
+            downloaded,
+        )
+
+    def mirror_version(self, version: PackageFragment) -> MirrorResult:
+        path = os.path.join(self.directory, version.filename)
+        try:
+            if self._is_mirrored(version, path):
+                result = MirrorResult(version, MirrorStatus.SKIPPED, path)
+            else:
+                result = self._download(version, path)
+        except Exception as e:
+            return MirrorResult(version, MirrorStatus.FAILED, path, error=str(e))
+
+        if result.status != MirrorStatus.FAILED:
+            stat = os.stat(path)
+            self._index[version.filename] = {
+                "name": version.name,
+                "version": version.version_str,
+                "filename": version.filename,
+                "sha256sum": version.sha256sum,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+        return result
+
+    def mirror(self, versions: List[PackageFragment]) -> Iterator[MirrorResult]:
+        """Mirror 'versions', yielding results as downloads complete in the
+        order of 'versions'."""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            if self.jobs <= 1:
+                for version in versions:
+                    yield self.mirror_version(version)
+            else:
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    yield from executor.map(self.mirror_version, versions)
+        finally:
+            # Saved even if interrupted, so that files mirrored so far don't
+            # need to be hashed again
+            self._save_index()
@@ -0,0 +1,50 @@
+"""Structured output of package-cloud results."""
+import json
+import sys
+from typing import Dict, Optional, TextIO
+
+
+class ResultWriter:
+    FORMATS = ("text", "json", "ndjson")
+
+    def __init__(self, output_format: str = "text", stream: Optional[TextIO] = None):
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}'")
+        self.format = output_format
+        self._stream = stream
+        self._records = 0
+
+    @property
+    def stream(self) -> TextIO:
+        # sys.stdout is looked up on every write, as it might be replaced
+        # after the writer is created
+        return self._stream if self._stream else sys.stdout
+
+    @property
+    def text(self) -> bool:
+        return self.format == "text"
+
+    def print(self, *args, **kwargs) -> None:
+        """Print human readable output, only when using the text format."""
+        if self.text:
+            print(*args, file=self.stream, **kwargs)
+
+    def write(self, record: Dict) -> None:
+        """Write a record as soon as it's available, so that it can be
+        consumed before the run finishes."""
+        if self.text:
+            return
+        line = json.dumps(record)
+        if self.format == "json":
+            # Records are streamed as the elements of a JSON array
+            line = ("[\n" if self._records == 0 else ",\n") + line
+        else:
+            line += "\n"
+        self.stream.write(line)
+        self.stream.flush()
+        self._records += 1
+
+    def close(self) -> None:
+        if self.format == "json":
+            self.stream.write("[]\n" if self._records == 0 else "\n]\n")
+            self.stream.flush()
@@ -0,0 +1,171 @@
+"""Promotion planning across a chain of PackageCloud repositories."""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .async_manager import AsyncEngine, AsyncPackageCloudManager
+from .classes import (
+    PackageCloudManager,
+    PackageFragment,
+    PackageVersion,
+    PromotionCandidate,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RepositoryContents:
+    repository: str
+    distro_version: str
+    packages: List[PackageVersion] = field(default_factory=list)
+    # Versions of each package, sorted from oldest to newest
+    versions: Dict[str, List[PackageFragment]] = field(default_factory=dict)
+    # Why the versions of a package couldn't be fetched, by package name
+    errors: Dict[str, str] = field(default_factory=dict)
+    # Why the packages couldn't be listed at all
+    error: Optional[str] = None
+
+    def latest(self, package_name: str):
+        versions = self.versions.get(package_name)
+        return versions[-1] if versions else None
+
+
+class PromotionPlanner:
+    def __init__(
+        self,
+        chain: List[str],
+        distro_versions: List[str],
+        manager_factory: Callable[[str, str], PackageCloudManager],
+        jobs: int = 1,
+        engine: Optional[AsyncEngine] = None,
+    ) -> None:
+        if len(chain) < 2:
+            raise ValueError("A promotion chain needs at least two repositories")
+        self.chain = chain
+        self.distro_versions = distro_versions
+        self.manager_factory = manager_factory
+        self.jobs = jobs
+        # Shared by every repository/distro; one limited to 'jobs' requests
+        # at once is started otherwise
+        self.engine = engine
+        self._contents: Dict[Tuple[str, str], RepositoryContents] = {}
+
+    async def _fetch(
+        self, engine: AsyncEngine, repository: str, distro_version: str
+    ) -> RepositoryContents:
+        contents = RepositoryContents(repository, distro_version)
+        # Every repository/distro gets its own manager, so they can be queried
+        # at the same time
+        manager = self.manager_factory(repository, distro_version)
+        with AsyncPackageCloudManager(manager, engine) as async_manager:
+            try:
+                contents.packages = await async_manager.list_packages()
+            except Exception as e:
+                logger.error(
+                    f"Couldn't list packages of '{repository}' ({distro_version}): {e}"
+                )
+                contents.error = str(e)
+                return contents
+            for result in await async_manager.bulk_package_versions(contents.packages):
+                if result.error:
+                    logger.error(
+                        f"Couldn't get versions of '{result.package.name}' in "
+                        f"'{repository}' ({distro_version}): {result.error}"
+                    )
+                    contents.errors[result.package.name] = str(result.error)
+                    continue
+                contents.versions[result.package.name] = sorted(result.versions)
+        return contents
+
+    def contents(self) -> Dict[Tuple[str, str], RepositoryContents]:
+        """Fetch the contents of every repository/distro in the chain, once."""
+        missing = [
+            (repository, distro_version)
+            for distro_version in self.distro_versions
+            for repository in self.chain
+            if (repository, distro_version) not in self._contents
+        ]
+        if missing:
+            if self.engine:
+                fetched = asyncio.run(self._fetch_all(self.engine, missing))
+            else:
+                with AsyncEngine(concurrency=self.jobs) as engine:
+                    fetched = asyncio.run(self._fetch_all(engine, missing))
+            for key, contents in zip(missing, fetched):
+                self._contents[key] = contents
+        return self._contents
+
+    async def _fetch_all(
+        self, engine: AsyncEngine, keys: List[Tuple[str, str]]
+    ) -> List[RepositoryContents]:
+        return await asyncio.gather(*[self._fetch(engine, *key) for key in keys])
+
+    def errors(self) -> List[Tuple[RepositoryContents, str, str]]:
+        """Repository/distro contents, package name and error of every
+        package whose versions couldn't be fetched; 'plan' leaves them out."""
+        return [
+            (contents, package_name, error)
+            for contents in self.contents().values()
+            for package_name, error in contents.errors.items()
+        ]
+
+    def stage_errors(self) -> List[Tuple[str, str, str, str]]:
+        """Source, destination, distro version and error of every stage of the
+        chain with a repository that couldn't be listed; 'plan' leaves them
+        out."""
+        contents = self.contents()
+        errors = []
+        for distro_version in self.distro_versions:
+            for source, destination in zip(self.chain, self.chain[1:]):
+                for repository in (source, destination):
+                    error = contents[(repository, distro_version)].error
+                    if error is not None:
+                        errors.append(
+                            (
+                                source,
+                                destination,
+                                distro_version,
+                                f"Couldn't list packages of '{repository}': {error}",
+                            )
+                        )
+                        break
+        return errors
+
+    def plan(self) -> List[PromotionCandidate]:
+        contents = self.contents()
+        candidates = []
+        for distro_version in self.distro_versions:
+            for source, destination in zip(self.chain, self.chain[1:]):
+                source_contents = contents[(source, distro_version)]
+                destination_contents = contents[(destination, distro_version)]
+                if source_contents.error or destination_contents.error:
+                    # Every package would look missing from a destination
+                    # that couldn't be listed
+                    continue
+                for package in source_contents.packages:
+                    latest = source_contents.latest(package.name)
+                    if latest is None:
+                        continue
+                    if package.name in destination_contents.errors:
+                        # Its latest version in the destination is unknown,
+                        # which isn't the same as the package not being there
+                        continue
+                    destination_latest = destination_contents.latest(package.name)
+                    if (
+                        destination_latest is not None
+                        and destination_latest.debian_version >= latest.debian_version
+                    ):
+                        continue
+                    candidates.append(
+                        PromotionCandidate(
+                            package=package,
+                            version=latest,
+                            source_repository=source,
+                            destination_repository=destination,
+                            destination_version=destination_latest,
+                            distro_version=distro_version,
+                        )
+                    )
+        return candidates
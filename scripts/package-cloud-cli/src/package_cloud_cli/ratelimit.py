@@ -0,0 +1,61 @@
+"""Rate limiting of requests sent to the PackageCloud API."""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def retry_after_seconds(value: Optional[str], default: float = 1.0) -> float:
+    # 'Retry-After' is either a number of seconds or an HTTP date
+    # See https://httpwg.org/specs/rfc7231.html#header.retry-after
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        # Used when the server asks to slow down: every caller sharing this
+        # bucket waits, not only the one that got the response
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - max(self._updated_at, self._paused_until)
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def delay(self) -> float:
+        """Take a token, returning how long the caller must wait before using
+        it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Tokens are only refilled once a pause ends, so callers queued
+            # during a pause stay spaced out after it
+            wait = max(self._paused_until - now, 0.0)
+            wait += max(0.0, (1 - self._tokens) / self.rate)
+            self._tokens -= 1
+            return wait
+
+    def acquire(self) -> None:
+        wait = self.delay()
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,215 @@
+"""Local snapshots of the packages and versions in PackageCloud repositories."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .async_manager import AsyncEngine
+from .classes import (
+    PackageCloudManager,
+    PackageCloudRepoConfiguration,
+    PackageFragment,
+    PackageVersion,
+    RequestType,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS packages (
+    user TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    distribution TEXT NOT NULL,
+    distribution_version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    versions_count INTEGER,
+    versions_url TEXT,
+    repository_url TEXT,
+    repository_html_url TEXT,
+    PRIMARY KEY (user, repository, distribution, distribution_version, name)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    user TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    distribution TEXT NOT NULL,
+    distribution_version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    created_at TEXT,
+    sha256sum TEXT,
+    destroy_url TEXT,
+    promote_url TEXT,
+    fragment TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_by_package
+    ON versions (user, repository, distribution, distribution_version, name);
+"""
+
+
+def _scope(config: PackageCloudRepoConfiguration) -> Tuple[str, str, str, str]:
+    return (
+        config.user,
+        config.repository,
+        config.distribution,
+        config.distribution_version,
+    )
+
+
+@dataclass(frozen=True)
+class SnapshotChange:
+    repository: str
+    distro: str
+    package: str
+    version: str
+    added: bool
+
+    def __str__(self):
+        sign = "+" if self.added else "-"
+        return f"{sign} {self.repository} ({self.distro}) {self.package} {self.version}"
+
+
+class SnapshotStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Snapshots are queried from the threads used to fetch versions
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def created_at(self) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT value FROM metadata WHERE key = 'created_at'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_repository(
+        self,
+        config: PackageCloudRepoConfiguration,
+        packages: List[PackageVersion],
+        versions: Dict[str, List[PackageFragment]],
+    ) -> None:
+        scope = _scope(config)
+        where = "user = ? AND repository = ? AND distribution = ? AND distribution_version = ?"
+        with self.connection:
+            self.connection.execute(f"DELETE FROM packages WHERE {where}", scope)
+            self.connection.execute(f"DELETE FROM versions WHERE {where}", scope)
+            self.connection.executemany(
+                "INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope
+                    + (
+                        p.name,
+                        p.versions_count,
+                        p.versions_url,
+                        p.repository_url,
+                        p.repository_html_url,
+                    )
+                    for p in packages
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope
+                    + (
+                        name,
+                        v.version_str,
+                        v.created_at,
+                        v.sha256sum,
+                        v.destroy_url,
+                        v.promote_url,
+                        json.dumps(v.to_dict()),
+                    )
+                    for name, package_versions in versions.items()
+                    for v in package_versions
+                ),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('created_at', ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%S%z"),),
+            )
+
+    def packages(self, config: PackageCloudRepoConfiguration) -> List[PackageVersion]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT name, versions_count, versions_url, repository_url, repository_html_url "
+                "FROM packages WHERE user = ? AND repository = ? AND distribution = ? "
+                "AND distribution_version = ? ORDER BY rowid",
+                _scope(config),
+            ).fetchall()
+        return [PackageVersion(*row) for row in rows]
+
+    def versions(
+        self, config: PackageCloudRepoConfiguration, package_name: str
+    ) -> List[PackageFragment]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT fragment FROM versions WHERE user = ? AND repository = ? "
+                "AND distribution = ? AND distribution_version = ? AND name = ? ORDER BY rowid",
+                _scope(config) + (package_name,),
+            ).fetchall()
+        return [PackageFragment.from_dict(json.loads(row[0])) for row in rows]
+
+    def _version_keys(self) -> set:
+        rows = self.connection.execute(
+            "SELECT repository, distribution || '/' || distribution_version, name, version "
+            "FROM versions"
+        )
+        return set(rows)
+
+    def diff(self, other: "SnapshotStore") -> List[SnapshotChange]:
+        """Return the versions added and removed in 'other' compared to this
+        snapshot."""
+        old = self._version_keys()
+        new = other._version_keys()
+        changes = [SnapshotChange(*key, added=False) for key in old - new]
+        changes += [SnapshotChange(*key, added=True) for key in new - old]
+        return sorted(
+            changes, key=lambda c: (c.repository, c.distro, c.package, c.version)
+        )
+
+
+class SnapshotManager(PackageCloudManager):
+    """Read-only manager that answers queries from a snapshot instead of
+    PackageCloud."""
+
+    def __init__(
+        self,
+        config: PackageCloudRepoConfiguration,
+        store: SnapshotStore,
+        engine: Optional[AsyncEngine] = None,
+    ) -> None:
+        super().__init__(config, engine=engine)
+        self.store = store
+
+    def _request(self, url: str, request_type: RequestType, *args, **kwargs):
+        raise Exception(
+            f"Can't send {request_type.name} requests when working from snapshot '{self.store.path}'"
+        )
+
+    def iter_packages(
+        self, prefetch: Optional[bool] = None
+    ) -> Iterator[PackageVersion]:
+        return iter(self.store.packages(self.config))
+
+    def iter_package_versions(
+        self, package: PackageVersion, prefetch: Optional[bool] = None
+    ) -> Iterator[PackageFragment]:
+        return iter(self.store.versions(self.config, package.name))
@@ -0,0 +1 @@
+"""Test suite for the package_cloud_cli package."""
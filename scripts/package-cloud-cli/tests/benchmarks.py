@@ -0,0 +1,196 @@
+"""Benchmarks of package-cloud-cli against a fake PackageCloud server.
+
+Each scenario runs the CLI in-process against a freshly populated fake
+server and records the number of requests it received, the wall time of the
+run and the peak memory allocated while it ran. No network access is needed.
+Allocations are traced during the whole run, so wall times are only
+comparable between runs of the benchmarks themselves.
+
+Run with 'python -m tests.benchmarks' from scripts/package-cloud-cli. Results
+can be saved with '--output' and compared against a previous run with
+'--baseline'; the exit code is non zero if a scenario regressed.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+
+from .fake_packagecloud import (
+    FakePackageCloud,
+    FakePackageCloudConfiguration,
+    cli_args,
+)
+
+SOURCE = "pi-top-os-unstable"
+DESTINATIONS = ("pi-top-os-testing", "pi-top-os-experimental", "pi-top-os")
+
+
+@dataclass
+class Scenario:
+    name: str
+    args: Callable[[FakePackageCloud, int], List[str]]
+
+
+@dataclass
+class BenchmarkResult:
+    scenario: str
+    requests: int
+    faults: int
+    wall_time: float
+    peak_memory: int
+
+    def __str__(self):
+        return (
+            f"{self.scenario:<16} {self.requests:>8} requests "
+            f"{self.wall_time:>8.2f}s {self.peak_memory / 2**20:>8.1f} MiB"
+        )
+
+
+SCENARIOS = (
+    Scenario(
+        "all-packages",
+        lambda fake, jobs: cli_args(fake, SOURCE, "--all-packages", "-j", str(jobs)),
+    ),
+    Scenario(
+        "promote-check",
+        lambda fake, jobs: cli_args(
+            fake,
+            SOURCE,
+            "--all-packages",
+            "--promote-check",
+            *[arg for repo in DESTINATIONS for arg in ("-a", repo)],
+            "-j",
+            str(jobs),
+        ),
+    ),
+    Scenario(
+        "cleanup-and-keep",
+        lambda fake, jobs: cli_args(
+            fake, SOURCE, "--all-packages", "--cleanup-and-keep", "2", "-j", str(jobs)
+        ),
+    ),
+)
+
+
+def run_scenario(
+    scenario: Scenario, config: FakePackageCloudConfiguration, jobs: int = 1
+) -> BenchmarkResult:
+    runner = CliRunner()
+    with FakePackageCloud(config) as fake:
+        args = scenario.args(fake, jobs)
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        result = runner.invoke(__main__.main, args)
+        wall_time = time.perf_counter() - started_at
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if result.exit_code != 0:
+            raise RuntimeError(
+                f"Scenario '{scenario.name}' failed: {result.output}"
+            ) from result.exception
+        return BenchmarkResult(
+            scenario=scenario.name,
+            requests=fake.stats.total,
+            faults=fake.stats.faults,
+            wall_time=wall_time,
+            peak_memory=peak_memory,
+        )
+
+
+def regressions(
+    results: List[BenchmarkResult],
+    baseline: Dict[str, Dict],
+    max_slowdown: float,
+    max_memory_growth: float,
+) -> List[str]:
+    found = []
+    for result in results:
+        previous = baseline.get(result.scenario)
+        if previous is None:
+            continue
+        if result.requests > previous["requests"]:
+            found.append(
+                f"{result.scenario}: {result.requests} requests, was {previous['requests']}"
+            )
+        if result.wall_time > previous["wall_time"] * max_slowdown:
+            found.append(
+                f"{result.scenario}: took {result.wall_time:.2f}s, was {previous['wall_time']:.2f}s"
+            )
+        if result.peak_memory > previous["peak_memory"] * max_memory_growth:
+            found.append(
+                f"{result.scenario}: peak memory {result.peak_memory} bytes, was {previous['peak_memory']}"
+            )
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark package-cloud-cli against a fake PackageCloud server."
+    )
+    parser.add_argument("--packages", type=int, default=2000)
+    parser.add_argument("--versions", type=int, default=6)
+    parser.add_argument("--page-size", type=int, default=30)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every response."
+    )
+    parser.add_argument(
+        "--fault-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with 429 or 503.",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=8)
+    parser.add_argument(
+        "-s",
+        "--scenario",
+        action="append",
+        choices=[s.name for s in SCENARIOS],
+        help="Scenario to run. Can be repeated; all scenarios are run by default.",
+    )
+    parser.add_argument("--output", help="File where results are saved as JSON.")
+    parser.add_argument("--baseline", help="Results of a previous run to compare to.")
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    parser.add_argument("--max-memory-growth", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = []
+    for scenario in SCENARIOS:
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        config = FakePackageCloudConfiguration(
+            repositories=(SOURCE,) + DESTINATIONS,
+            packages=args.packages,
+            versions_per_package=args.versions,
+            page_size=args.page_size,
+            latency=args.latency,
+            fault_rate=args.fault_rate,
+        )
+        result = run_scenario(scenario, config, jobs=args.jobs)
+        print(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({r.scenario: asdict(r) for r in results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(
+            results, baseline, args.max_slowdown, args.max_memory_growth
+        )
+        for regression in found:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
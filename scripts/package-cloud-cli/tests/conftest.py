@@ -0,0 +1,51 @@
+"""Fixtures shared by the test suite."""
+from typing import Callable
+
+import pytest
+from click.testing import CliRunner
+
+from package_cloud_cli.classes import PackageCloudRepoConfiguration
+
+from .fake_packagecloud import FakePackageCloud, FakePackageCloudConfiguration
+
+
+@pytest.fixture
+def runner() -> CliRunner:
+    """Fixture for invoking command-line interfaces."""
+    return CliRunner()
+
+
+@pytest.fixture
+def fake_config() -> FakePackageCloudConfiguration:
+    """Configuration of the fake server; tests can change it before the
+    server is started."""
+    return FakePackageCloudConfiguration(
+        packages=12, versions_per_package=4, page_size=5
+    )
+
+
+@pytest.fixture
+def fake(fake_config: FakePackageCloudConfiguration) -> FakePackageCloud:
+    """Fixture for a fake PackageCloud server running on localhost."""
+    with FakePackageCloud(fake_config) as server:
+        yield server
+
+
+@pytest.fixture
+def repo_config(
+    fake: FakePackageCloud,
+) -> Callable[[str], PackageCloudRepoConfiguration]:
+    """Fixture for the configuration of a repository of the fake server, by
+    name."""
+
+    def make(repository: str) -> PackageCloudRepoConfiguration:
+        return PackageCloudRepoConfiguration(
+            api_token="fake-token",
+            repository=repository,
+            user=fake.config.user,
+            distribution="debian",
+            distribution_version="bullseye",
+            server=fake.url,
+        )
+
+    return make
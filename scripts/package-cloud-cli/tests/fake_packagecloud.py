@@ -0,0 +1,496 @@
+"""A local stand-in for the PackageCloud API, used by tests and benchmarks.
+
+Only the endpoints used by package-cloud-cli are implemented: package and
+version listings (paginated through 'Link' headers, with 'ETag' and
+'Last-Modified' validators), deletion, promotion and downloads of package
+files.
+Repositories are filled with synthetic packages, so runs don't need network
+access nor an API token.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = "/api/v1/repos"
+# Last-Modified of repositories that never changed; every change adds a
+# second, so that changes made within the same second can be told apart
+BASE_MODIFIED_AT = 1640995200
+
+
+@dataclass
+class FakePackageCloudConfiguration:
+    user: str = "pi-top"
+    repositories: Tuple[str, ...] = ("pi-top-os-unstable", "pi-top-os")
+    distro_versions: Tuple[str, ...] = ("debian/bullseye",)
+    packages: int = 100
+    versions_per_package: int = 5
+    page_size: int = 30
+    # Size in bytes of the file of every package version
+    package_size: int = 4096
+    # Seconds added to every response
+    latency: float = 0.0
+    # Fraction of requests answered with one of 'fault_statuses'
+    fault_rate: float = 0.0
+    fault_statuses: Tuple[int, ...] = (429, 503)
+    # (repository, package) pairs whose version listings always fail
+    failing_versions: Tuple[Tuple[str, str], ...] = ()
+    # Repositories whose package listings always fail
+    failing_repositories: Tuple[str, ...] = ()
+    # Pages of every listing that always fail, counted from 1
+    failing_pages: Tuple[int, ...] = ()
+    # (repository, package, status) of promotions from the repository that
+    # are rejected with the status, like PackageCloud does with 409 or 422
+    rejected_promotions: Tuple[Tuple[str, str, int], ...] = ()
+    seed: int = 0
+
+
+@dataclass
+class RequestStats:
+    total: int = 0
+    faults: int = 0
+    # Downloads that were resumed through a 'Range' header
+    ranges: int = 0
+    # Listings answered with 304 Not Modified
+    not_modified: int = 0
+    # Highest number of requests handled at the same time
+    max_in_flight: int = 0
+    by_method: Dict[str, int] = field(default_factory=dict)
+
+
+def package_name(index: int) -> str:
+    return f"package-{index:05d}"
+
+
+def package_content(filename: str, size: int) -> bytes:
+    """Synthetic content of a package file, the same for every run."""
+    block = hashlib.sha256(filename.encode()).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+class FakePackageCloud:
+    def __init__(self, config: Optional[FakePackageCloudConfiguration] = None) -> None:
+        self.config = config if config else FakePackageCloudConfiguration()
+        self.stats = RequestStats()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Maps (repository, distro_version) to the versions of each package
+        self.repositories: Dict[Tuple[str, str], Dict[str, List[Dict]]] = {}
+        # Number of changes made to each repository
+        self.revisions: Dict[str, int] = {}
+        self._populate()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _populate(self) -> None:
+        # Every repository has one version less of each package than the
+        # previous one in 'repositories', so that there is always something
+        # to promote
+        for position, repository in enumerate(self.config.repositories):
+            versions_count = max(self.config.versions_per_package - position, 1)
+            for distro_version in self.config.distro_versions:
+                packages = {}
+                for i in range(self.config.packages):
+                    name = package_name(i)
+                    packages[name] = [
+                        self._fragment(
+                            repository, distro_version, name, f"1.{v}.0", "1"
+                        )
+                        for v in range(versions_count)
+                    ]
+                self.repositories[(repository, distro_version)] = packages
+
+    def _fragment(
+        self,
+        repository: str,
+        distro_version: str,
+        name: str,
+        version: str,
+        release: str,
+    ) -> Dict:
+        filename = f"{name}_{version}-{release}_all.deb"
+        base = f"{API_PREFIX}/{self.config.user}/{repository}"
+        return {
+            "name": name,
+            "created_at": "2022-01-01T00:00:00.000Z",
+            "distro_version": distro_version,
+            "version": version,
+            "release": release,
+            "epoch": 0,
+            "filename": filename,
+            "private": True,
+            "type": "deb",
+            "promote_url": f"{base}/{distro_version}/{filename}/promote.json",
+            "destroy_url": f"{base}/{distro_version}/{filename}",
+            "sha256sum": hashlib.sha256(
+                package_content(filename, self.config.package_size)
+            ).hexdigest(),
+            "download_url": f"/{self.config.user}/{repository}/packages/{distro_version}/{filename}/download.deb",
+        }
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None, "Server isn't running"
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePackageCloud":
+        handler = type("Handler", (_RequestHandler,), {"fake": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = RequestStats()
+
+    def versions(self, repository: str, distro_version: str, name: str) -> List[Dict]:
+        return self.repositories[(repository, distro_version)].get(name, [])
+
+    def last_modified(self, repository: str) -> int:
+        return BASE_MODIFIED_AT + self.revisions.get(repository, 0)
+
+    def _modified(self, repository: str) -> None:
+        self.revisions[repository] = self.revisions.get(repository, 0) + 1
+
+    def _wait(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+        time.sleep(self.config.latency)
+        with self._lock:
+            self._in_flight -= 1
+
+    def _count(self, method: str) -> Optional[int]:
+        """Count a request, returning the status code of the fault to inject
+        if any."""
+        with self._lock:
+            self.stats.total += 1
+            self.stats.by_method[method] = self.stats.by_method.get(method, 0) + 1
+            if (
+                self.config.fault_rate
+                and self._random.random() < self.config.fault_rate
+            ):
+                self.stats.faults += 1
+                return self._random.choice(self.config.fault_statuses)
+        return None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    fake: FakePackageCloud
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs
+    # would add tens of milliseconds to every response
+    disable_nagle_algorithm = True
+
+    PACKAGES = re.compile(
+        rf"^{API_PREFIX}/(?P<user>[^/]+)/(?P<repo>[^/]+)/packages/deb"
+        r"(?:/(?P<distro_version>[^/]+/[^/]+))?\.json$"
+    )
+    VERSIONS = re.compile(
+        rf"^{API_PREFIX}/(?P<user>[^/]+)/(?P<repo>[^/]+)/package/deb/"
+        r"(?P<distro_version>[^/]+/[^/]+)/(?P<name>[^/]+)/all/versions\.json$"
+    )
+    PACKAGE_FILE = re.compile(
+        rf"^{API_PREFIX}/(?P<user>[^/]+)/(?P<repo>[^/]+)/"
+        r"(?P<distro_version>[^/]+/[^/]+)/(?P<filename>[^/]+\.deb)(?P<promote>/promote\.json)?$"
+    )
+    DOWNLOAD = re.compile(
+        r"^/(?P<user>[^/]+)/(?P<repo>[^/]+)/packages/"
+        r"(?P<distro_version>[^/]+/[^/]+)/(?P<filename>[^/]+\.deb)/download\.deb$"
+    )
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send_json(
+        self, status: int, body, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _begin(self, method: str) -> Optional[Tuple[str, Dict]]:
+        """Handle what's common to every request, returning its path and
+        query parameters if it must be answered."""
+        if self.fake.config.latency:
+            self.fake._wait()
+        fault = self.fake._count(method)
+        if fault:
+            self._send_json(fault, {"error": "Injected fault"}, {"Retry-After": "0"})
+            return None
+        if "Authorization" not in self.headers:
+            self._send_json(401, {"error": "Unauthenticated"})
+            return None
+        parts = urlsplit(self.path)
+        path = re.sub("/+", "/", parts.path)
+        return path, parse_qs(parts.query)
+
+    def _not_modified(self, etag: str, last_modified: int) -> bool:
+        # Like HTTP caches, If-Modified-Since is ignored along If-None-Match
+        if "If-None-Match" in self.headers:
+            return self.headers["If-None-Match"] == etag
+        since = self.headers.get("If-Modified-Since")
+        if since is None:
+            return False
+        return parsedate_to_datetime(since).timestamp() >= last_modified
+
+    def _send_page(self, repository: str, path: str, query: Dict, items: List) -> None:
+        page = int(query.get("page", ["1"])[0])
+        if page in self.fake.config.failing_pages:
+            self._send_json(500, {"error": "Internal server error"})
+            return
+        page_size = int(query.get("per_page", [self.fake.config.page_size])[0])
+        start = (page - 1) * page_size
+        body = items[start : start + page_size]
+        last_modified = self.fake.last_modified(repository)
+        etag = f'"{hashlib.sha256(json.dumps(body).encode()).hexdigest()[:16]}"'
+        headers = {
+            "Total": str(len(items)),
+            "Per-Page": str(page_size),
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+        }
+        if start + page_size < len(items):
+            headers["Link"] = f'<{self.fake.url}{path}?page={page + 1}>; rel="next"'
+        if self._not_modified(etag, last_modified):
+            with self.fake._lock:
+                self.fake.stats.not_modified += 1
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        self._send_json(200, body, headers)
+
+    def _send_file(self, filename: str) -> None:
+        content = package_content(filename, self.fake.config.package_size)
+        status = 200
+        headers = {"Content-Type": "application/vnd.debian.binary-package"}
+        range_match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if range_match and int(range_match.group(1)) >= len(content):
+            # Like PackageCloud, nothing is sent for ranges past the end
+            headers["Content-Range"] = f"bytes */{len(content)}"
+            content = b""
+            status = 416
+        elif range_match:
+            start = int(range_match.group(1))
+            headers["Content-Range"] = (
+                f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+            content = content[start:]
+            status = 206
+            with self.fake._lock:
+                self.fake.stats.ranges += 1
+        self.send_response(status)
+        headers["Content-Length"] = str(len(content))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:
+        request = self._begin("GET")
+        if request is None:
+            return
+        path, query = request
+        fake = self.fake
+
+        match = self.PACKAGES.match(path)
+        if match and match["repo"] in fake.config.failing_repositories:
+            self._send_json(500, {"error": "Internal server error"})
+            return
+        if match:
+            distro_versions = (
+                [match["distro_version"]]
+                if match["distro_version"]
+                else list(fake.config.distro_versions)
+            )
+            items = []
+            for distro_version in distro_versions:
+                packages = fake.repositories.get((match["repo"], distro_version), {})
+                for name, versions in packages.items():
+                    items.append(
+                        {
+                            "name": name,
+                            "versions_count": len(versions),
+                            "versions_url": f"{API_PREFIX}/{match['user']}/{match['repo']}"
+                            f"/package/deb/{distro_version}/{name}/all/versions.json",
+                            "repository_url": f"{API_PREFIX}/{match['user']}/{match['repo']}",
+                            "repository_html_url": f"/{match['user']}/{match['repo']}",
+                        }
+                    )
+            self._send_page(match["repo"], path, query, items)
+            return
+
+        match = self.VERSIONS.match(path)
+        if match and (match["repo"], match["name"]) in fake.config.failing_versions:
+            self._send_json(500, {"error": "Internal server error"})
+            return
+        if match:
+            versions = fake.versions(
+                match["repo"], match["distro_version"], match["name"]
+            )
+            self._send_page(match["repo"], path, query, list(versions))
+            return
+
+        match = self.DOWNLOAD.match(path)
+        if match:
+            self._send_file(match["filename"])
+            return
+
+        self._send_json(404, {"error": "Not found"})
+
+    def _find_version(self, match) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+        packages = self.fake.repositories.get((match["repo"], match["distro_version"]))
+        if packages is None:
+            return None, None
+        for versions in packages.values():
+            for version in versions:
+                if version["filename"] == match["filename"]:
+                    return versions, version
+        return None, None
+
+    def do_DELETE(self) -> None:
+        request = self._begin("DELETE")
+        if request is None:
+            return
+        path, _ = request
+        match = self.PACKAGE_FILE.match(path)
+        if not match or match["promote"]:
+            self._send_json(404, {"error": "Not found"})
+            return
+        with self.fake._lock:
+            versions, version = self._find_version(match)
+            if version is None:
+                self._send_json(404, {"error": "Not found"})
+                return
+            versions.remove(version)
+            self.fake._modified(match["repo"])
+        self._send_json(200, {})
+
+    def do_POST(self) -> None:
+        request = self._begin("POST")
+        if request is None:
+            return
+        path, _ = request
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        match = self.PACKAGE_FILE.match(path)
+        if not match or not match["promote"]:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        destination = form.get("destination", [""])[0]
+        destination_repo = destination.split("/")[-1]
+        fake = self.fake
+        with fake._lock:
+            source_versions, version = self._find_version(match)
+            destination_packages = fake.repositories.get(
+                (destination_repo, match["distro_version"])
+            )
+            if version is None or destination_packages is None:
+                self._send_json(404, {"error": "Not found"})
+                return
+            for repository, name, status in fake.config.rejected_promotions:
+                if (repository, name) == (match["repo"], version["name"]):
+                    self._send_json(status, {"error": "Promotion rejected"})
+                    return
+            destination_versions = destination_packages.setdefault(version["name"], [])
+            if any(v["filename"] == version["filename"] for v in destination_versions):
+                self._send_json(422, {"error": "Package already exists"})
+                return
+            # Promoting moves the package to the destination repository
+            source_versions.remove(version)
+            fake._modified(match["repo"])
+            fake._modified(destination_repo)
+            destination_versions.append(
+                fake._fragment(
+                    destination_repo,
+                    match["distro_version"],
+                    version["name"],
+                    version["version"],
+                    version["release"],
+                )
+            )
+        self._send_json(200, {})
+
+
+def cli_args(
+    fake: FakePackageCloud,
+    repository: str,
+    *options: str,
+    distro_version: str = "debian/bullseye",
+    cache_dir: Optional[str] = None,
+) -> List[str]:
+    """Arguments to run 'package-cloud' against the fake server; responses
+    are only cached in 'cache_dir' if it's given."""
+    distro, version = distro_version.split("/")
+    return [
+        repository,
+        fake.config.user,
+        distro,
+        version,
+        "fake-token",
+        "--server",
+        fake.url,
+        *(["--cache-dir", cache_dir] if cache_dir else ["--no-cache"]),
+        "--rate-limit",
+        "0",
+        *options,
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with FakePackageCloud(
+        FakePackageCloudConfiguration(
+            packages=args.packages,
+            page_size=args.page_size,
+            latency=args.latency,
+            fault_rate=args.fault_rate,
+        )
+    ) as fake:
+        print(
+            f"Serving fake PackageCloud API on {fake.url}; use 'PC_SERVER={fake.url}'"
+        )
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
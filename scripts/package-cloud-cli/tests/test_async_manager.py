@@ -0,0 +1,103 @@
+"""Test cases for the async_manager module."""
+import asyncio
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+from package_cloud_cli.async_manager import AsyncEngine, AsyncPackageCloudManager
+from package_cloud_cli.classes import PackageCloudManager, PackageCloudRepoConfiguration
+
+from .fake_packagecloud import FakePackageCloud, cli_args, package_name
+
+
+def async_manager(
+    config: PackageCloudRepoConfiguration, engine: AsyncEngine
+) -> AsyncPackageCloudManager:
+    return AsyncPackageCloudManager(PackageCloudManager(config), engine)
+
+
+def test_package_versions(fake: FakePackageCloud, repo_config) -> None:
+    """It lists packages and their versions."""
+
+    async def run(engine):
+        with async_manager(repo_config("pi-top-os-unstable"), engine) as manager:
+            packages = await manager.list_packages()
+            package = await manager.get_package(package_name(5))
+            versions = await manager.package_versions(package)
+        return packages, versions
+
+    with AsyncEngine() as engine:
+        packages, versions = asyncio.run(run(engine))
+    assert len(packages) == 12
+    assert [v.version_str for v in sorted(versions)] == [
+        "1.0.0-1",
+        "1.1.0-1",
+        "1.2.0-1",
+        "1.3.0-1",
+    ]
+
+
+def test_concurrency_limit(fake: FakePackageCloud, repo_config) -> None:
+    """It never has more requests in flight than the engine allows, across
+    every manager."""
+    fake.config.latency = 0.02
+
+    async def run(engine):
+        managers = [
+            async_manager(repo_config(repository), engine)
+            for repository in fake.config.repositories
+        ]
+
+        async def fetch(manager):
+            return await manager.bulk_package_versions(await manager.list_packages())
+
+        return await asyncio.gather(*[fetch(manager) for manager in managers])
+
+    with AsyncEngine(concurrency=3) as engine:
+        results = asyncio.run(run(engine))
+    assert all(not r.error for repository in results for r in repository)
+    assert fake.stats.max_in_flight == 3
+
+
+def test_sync_api_runs_on_the_engine(fake: FakePackageCloud, repo_config) -> None:
+    """The concurrent methods of the sync manager go through its engine."""
+    fake.config.latency = 0.02
+    with AsyncEngine(concurrency=2) as engine:
+        manager = PackageCloudManager(repo_config("pi-top-os-unstable"), engine=engine)
+        packages = manager.list_packages()
+        # 'jobs' only sizes the engine started when the manager has none
+        results = manager.bulk_package_versions(packages, jobs=8)
+    assert [r.package for r in results] == packages
+    assert all(len(r.versions) == 4 for r in results)
+    assert fake.stats.max_in_flight == 2
+
+
+def test_chain_shares_one_concurrency_limit(
+    runner: CliRunner, fake: FakePackageCloud
+) -> None:
+    """Repositories of a chain are fetched at the same time, within '--jobs'
+    requests in flight overall."""
+    fake.config.latency = 0.02
+    result = runner.invoke(
+        __main__.main,
+        cli_args(fake, "pi-top-os-unstable", "--chain", "-a", "pi-top-os", "-j", "3"),
+    )
+    assert result.exit_code == 0, result.output
+    assert fake.stats.max_in_flight == 3
+
+
+def test_delete_old_versions(fake: FakePackageCloud, repo_config) -> None:
+    """It deletes old versions concurrently."""
+
+    async def run(engine):
+        with async_manager(repo_config("pi-top-os-unstable"), engine) as manager:
+            package = await manager.get_package(package_name(0))
+            versions = sorted(await manager.package_versions(package))
+            return await manager.delete_old_versions(versions, keep=1, verbose=False)
+
+    with AsyncEngine(concurrency=4) as engine:
+        summary = asyncio.run(run(engine))
+    assert summary.deleted == ["1.0.0-1", "1.1.0-1", "1.2.0-1"]
+    assert summary.kept == ["1.3.0-1"]
+    remaining = fake.versions("pi-top-os-unstable", "debian/bullseye", package_name(0))
+    assert [v["version"] for v in remaining] == ["1.3.0"]
@@ -0,0 +1,26 @@
+"""Guard the number of requests sent by each benchmark scenario."""
+import pytest
+
+from .benchmarks import DESTINATIONS, SCENARIOS, SOURCE, run_scenario
+from .fake_packagecloud import FakePackageCloudConfiguration
+
+# 12 packages listed in pages of 5 take 3 requests; the 4 versions of each
+# package fit in a single page
+EXPECTED_REQUESTS = {
+    "all-packages": 3 + 12,
+    "promote-check": (3 + 12) * (1 + len(DESTINATIONS)),
+    "cleanup-and-keep": 3 + 12 + 12 * 2,
+}
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=lambda s: s.name)
+def test_scenario_requests(scenario) -> None:
+    """It doesn't send more requests than needed."""
+    config = FakePackageCloudConfiguration(
+        repositories=(SOURCE,) + DESTINATIONS,
+        packages=12,
+        versions_per_package=4,
+        page_size=5,
+    )
+    result = run_scenario(scenario, config, jobs=4)
+    assert result.requests == EXPECTED_REQUESTS[scenario.name]
@@ -0,0 +1,111 @@
+"""Test cases for the cache module."""
+import os
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+from package_cloud_cli.cache import ResponseCache
+from package_cloud_cli.classes import PackageCloudManager
+
+from .fake_packagecloud import FakePackageCloud, cli_args, package_name
+
+# Requests to list the 12 packages of a repository, 5 by page
+PACKAGE_PAGES = 3
+
+
+def test_fresh_responses_are_reused(
+    fake: FakePackageCloud, repo_config, tmp_path
+) -> None:
+    """It answers GET requests from the cache until the TTL expires."""
+    cache = ResponseCache(str(tmp_path), ttl=600)
+    with PackageCloudManager(repo_config("pi-top-os"), cache=cache) as manager:
+        packages = manager.list_packages()
+        assert fake.stats.total == PACKAGE_PAGES
+        assert manager.list_packages() == packages
+        assert fake.stats.total == PACKAGE_PAGES
+
+        cache.ttl = 0
+        assert manager.list_packages() == packages
+    assert fake.stats.total == 2 * PACKAGE_PAGES
+
+
+def test_stale_responses_are_revalidated(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It sends the validators of expired responses, and reuses them when
+    PackageCloud answers 304 Not Modified."""
+    args = cli_args(
+        fake,
+        "pi-top-os",
+        "--all-packages",
+        "--cache-ttl",
+        "0",
+        cache_dir=str(tmp_path),
+    )
+    first = runner.invoke(__main__.main, args)
+    assert first.exit_code == 0, first.output
+    assert fake.stats.not_modified == 0
+
+    second = runner.invoke(__main__.main, args)
+    assert second.exit_code == 0, second.output
+    assert second.stdout == first.stdout
+    # Every page of the package listing and of every version listing
+    assert fake.stats.not_modified == PACKAGE_PAGES + 12
+
+
+def test_changed_responses_replace_stale_ones(
+    fake: FakePackageCloud, repo_config, tmp_path
+) -> None:
+    """It stores the new response when a listing changed since it was
+    cached."""
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    with PackageCloudManager(repo_config("pi-top-os"), cache=cache) as manager:
+        package = manager.get_package(package_name(2))
+        assert len(manager.package_versions(package)) == 3
+        fake.versions("pi-top-os", "debian/bullseye", package_name(2)).pop()
+        assert len(manager.package_versions(package)) == 2
+    assert fake.stats.not_modified == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path) -> None:
+    """It removes the entries read the longest time ago once it's full."""
+    cache = ResponseCache(str(tmp_path))
+    urls = [f"https://packagecloud.io/api/v1/repos/pi-top/os/{i}.json" for i in "abc"]
+    for i, url in enumerate(urls[:2]):
+        cache.put(url, "[]")
+        os.utime(cache._path(cache.key(url)), (i, i))
+    sizes = [entry.stat().st_size for entry in os.scandir(tmp_path)]
+    # Entries differ by a few bytes, depending on when they were stored
+    cache.max_size = sum(sizes) + min(sizes) // 2
+
+    # Reading the oldest entry makes it the most recently used one
+    assert cache.get(urls[0]) is not None
+    cache.put(urls[2], "[]")
+    assert cache.get(urls[0]) is not None
+    assert cache.get(urls[1]) is None
+    assert cache.get(urls[2]) is not None
+
+
+def test_deletions_invalidate_the_repository(
+    fake: FakePackageCloud, repo_config, tmp_path
+) -> None:
+    """It drops the cached listings of a repository after deleting from it,
+    and only those."""
+    cache = ResponseCache(str(tmp_path), ttl=600)
+    with PackageCloudManager(repo_config("pi-top-os"), cache=cache) as other:
+        other.list_packages()
+    with PackageCloudManager(repo_config("pi-top-os-unstable"), cache=cache) as manager:
+        package = manager.get_package(package_name(0))
+        versions = sorted(manager.package_versions(package))
+        fake.reset_stats()
+
+        summary = manager.delete_old_versions(versions, keep=1, verbose=False)
+        assert len(summary.deleted) == 3
+        package = manager.get_package(package_name(0))
+        assert package.versions_count == 1
+        assert [v.version_str for v in manager.package_versions(package)] == ["1.3.0-1"]
+    assert fake.stats.by_method["GET"] == PACKAGE_PAGES + 1
+
+    with PackageCloudManager(repo_config("pi-top-os"), cache=cache) as other:
+        other.list_packages()
+    assert fake.stats.by_method["GET"] == PACKAGE_PAGES + 1
@@ -0,0 +1,95 @@
+"""Test cases for the classes module."""
+import pytest
+
+from package_cloud_cli.classes import (
+    HttpTransportConfiguration,
+    PackageCloudManager,
+    PackageFragment,
+)
+from package_cloud_cli.metrics import Endpoint, RequestMetrics
+from package_cloud_cli.ratelimit import TokenBucket
+
+from .fake_packagecloud import (
+    FakePackageCloud,
+    FakePackageCloudConfiguration,
+    package_name,
+)
+
+
+class RecordingTokenBucket(TokenBucket):
+    def __init__(self) -> None:
+        super().__init__(rate=1000)
+        self.pauses = []
+
+    def pause(self, seconds: float) -> None:
+        self.pauses.append(seconds)
+        super().pause(seconds)
+
+
+@pytest.fixture
+def fake_config() -> FakePackageCloudConfiguration:
+    """Every request is answered with '429 Retry-After: 0'."""
+    return FakePackageCloudConfiguration(
+        packages=12, page_size=5, fault_rate=1.0, fault_statuses=(429,)
+    )
+
+
+def test_rate_limited_requests_pause_the_limiter(
+    fake: FakePackageCloud, repo_config
+) -> None:
+    """Responses with status 429 are only retried by the manager, which pauses
+    the shared rate limiter for as long as Retry-After asks."""
+    rate_limiter = RecordingTokenBucket()
+    metrics = RequestMetrics()
+    # Even if 429 is configured as a status for urllib3 to retry
+    transport = HttpTransportConfiguration(retries=3, retry_statuses=(429, 503))
+    manager = PackageCloudManager(
+        repo_config("pi-top-os-unstable"),
+        transport,
+        rate_limiter=rate_limiter,
+        metrics=metrics,
+    )
+    with manager, pytest.raises(Exception):
+        manager.list_packages()
+
+    assert fake.stats.total == 4
+    assert rate_limiter.pauses == [0.0, 0.0, 0.0]
+    assert metrics.endpoints[Endpoint.PACKAGES].retries == 3
+    assert metrics.endpoints[Endpoint.PACKAGES].requests == 4
+
+
+def test_prefetched_pages(fake: FakePackageCloud, repo_config) -> None:
+    """Pages requested ahead of time come back complete and in order."""
+    fake.config.fault_rate = 0.0
+    with PackageCloudManager(repo_config("pi-top-os"), prefetch_pages=True) as manager:
+        packages = manager.list_packages()
+    assert [p.name for p in packages] == [package_name(i) for i in range(12)]
+    assert fake.stats.total == 3
+
+
+def test_prefetched_page_failure(fake: FakePackageCloud, repo_config) -> None:
+    """A page that failed while being requested ahead of time raises its
+    error when it's reached."""
+    fake.config.fault_rate = 0.0
+    fake.config.failing_pages = (2,)
+    transport = HttpTransportConfiguration(retries=0)
+    manager = PackageCloudManager(
+        repo_config("pi-top-os"), transport, prefetch_pages=True
+    )
+    names = []
+    with manager, pytest.raises(Exception, match="Internal server error"):
+        for package in manager.iter_packages():
+            names.append(package.name)
+    assert names == [package_name(i) for i in range(5)]
+
+
+def test_fragment_equality_agrees_with_ordering() -> None:
+    """Fragments of the same version for different distros are neither equal
+    nor unordered."""
+    bullseye = PackageFragment("pi-topd", "1.0", "1", distro_version="debian/bullseye")
+    bookworm = PackageFragment("pi-topd", "1.0", "1", distro_version="debian/bookworm")
+    newer = PackageFragment("pi-topd", "1.1", "1", distro_version="debian/bookworm")
+    assert bullseye != bookworm
+    assert (bullseye < bookworm) != (bookworm < bullseye)
+    assert bullseye <= PackageFragment.from_dict(bullseye.to_dict()) <= bullseye
+    assert sorted([newer, bullseye, bookworm])[-1] is newer
@@ -0,0 +1,73 @@
+"""Test cases for the debversion module, checked against dpkg's ordering."""
+import pytest
+
+from package_cloud_cli.debversion import DebianVersion
+
+
+def v(version_str: str) -> DebianVersion:
+    return DebianVersion.parse(version_str)
+
+
+@pytest.mark.parametrize(
+    "lower, higher",
+    [
+        # '~' sorts before everything, even the end of the string
+        ("1.0~rc1", "1.0"),
+        ("1.0~~", "1.0~"),
+        ("1.0~rc1", "1.0~rc2"),
+        ("1.0-1~bpo1", "1.0-1"),
+        # Epochs take precedence over the rest of the version
+        ("2.0", "1:1.0"),
+        ("1:2.0", "2:0.1"),
+        # Letters sort before other non-digit characters, and numbers are
+        # compared numerically
+        ("1.0a", "1.0+"),
+        ("1.0a", "1.0.1"),
+        ("1.9", "1.10"),
+        ("1.0", "1.0a"),
+        # Snapshot builds of git-buildpackage
+        ("1.0", "1.0+gbp20220101"),
+        ("1.0.gbp20220101", "1.0.gbp20220102"),
+        ("1.0~gbp20220101", "1.0"),
+        # Revisions are compared after the upstream version
+        ("1.0-1", "1.0-2"),
+        ("1.0-2", "1.0-10"),
+        ("1.0-9", "1.1-1"),
+        ("1.0-1", "1.0-1.1"),
+        ("1.0", "1.0-1"),
+    ],
+)
+def test_ordering(lower: str, higher: str) -> None:
+    """It orders versions like dpkg --compare-versions."""
+    assert v(lower) < v(higher)
+    assert v(higher) > v(lower)
+    assert v(lower) != v(higher)
+
+
+@pytest.mark.parametrize(
+    "version_str, other",
+    [
+        ("1.0", "1.0-0"),
+        ("1.0", "0:1.0"),
+        ("1.01", "1.1"),
+        ("1.0-00", "1.0"),
+    ],
+)
+def test_equal_versions(version_str: str, other: str) -> None:
+    """It treats versions that dpkg considers equal as equal."""
+    assert v(version_str) == v(other)
+    assert hash(v(version_str)) == hash(v(other))
+    assert v(version_str) <= v(other) and v(version_str) >= v(other)
+
+
+def test_parse() -> None:
+    """It splits the epoch and the revision off the upstream version, which
+    may contain hyphens and colons."""
+    version = v("2:1.0-beta:1-3")
+    assert (version.epoch, version.upstream, version.revision) == (
+        2,
+        "1.0-beta:1",
+        "3",
+    )
+    assert str(version) == "2:1.0-beta:1-3"
+    assert str(v("1.0")) == "1.0"
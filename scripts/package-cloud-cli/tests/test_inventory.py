@@ -0,0 +1,63 @@
+"""Test cases for the inventory module."""
+import json
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+from package_cloud_cli.classes import PackageCloudManager
+from package_cloud_cli.inventory import InventoryStore
+
+from .fake_packagecloud import FakePackageCloud, cli_args, package_name
+
+# Requests to list the 12 packages of a repository, 5 by page
+PACKAGE_PAGES = 3
+
+
+def test_incremental(runner: CliRunner, fake: FakePackageCloud, tmp_path) -> None:
+    """It only lists the versions of packages whose number of versions
+    changed since the last run."""
+    args = cli_args(
+        fake,
+        "pi-top-os",
+        "--all-packages",
+        "--incremental",
+        "--inventory-dir",
+        str(tmp_path),
+        "--format",
+        "ndjson",
+    )
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert fake.stats.by_method["GET"] == PACKAGE_PAGES + 12
+
+    fake.reset_stats()
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert fake.stats.by_method["GET"] == PACKAGE_PAGES
+
+    fake.versions("pi-top-os", "debian/bullseye", package_name(4)).append(
+        fake._fragment("pi-top-os", "debian/bullseye", package_name(4), "1.4.0", "1")
+    )
+    fake.reset_stats()
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert fake.stats.by_method["GET"] == PACKAGE_PAGES + 1
+    packages = {p["package"]: p for p in map(json.loads, result.stdout.splitlines())}
+    assert packages[package_name(4)]["latest_version"] == "1.4.0-1"
+    assert packages[package_name(5)]["latest_version"] == "1.2.0-1"
+
+
+def test_deletions_are_forgotten(fake: FakePackageCloud, repo_config, tmp_path) -> None:
+    """It lists the versions of a package again after deleting some of them."""
+    inventory = InventoryStore(str(tmp_path))
+    with PackageCloudManager(repo_config("pi-top-os"), inventory=inventory) as manager:
+        package = manager.get_package(package_name(0))
+        versions = sorted(manager.package_versions(package))
+        manager.delete_old_versions(versions, keep=1, verbose=False)
+        fake.reset_stats()
+
+        # Even if the package still has the number of versions stored in the
+        # inventory
+        assert [v.version_str for v in manager.package_versions(package)] == ["1.2.0-1"]
+    assert fake.stats.by_method["GET"] == 1
+    assert inventory.fetched == 2
@@ -0,0 +1,322 @@
+"""Test cases for the __main__ module, run against a fake PackageCloud server."""
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+
+from .fake_packagecloud import FakePackageCloud, cli_args, package_name
+
+
+def records(output: str) -> list:
+    return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+
+def test_all_packages(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It lists the latest version of every package, following pagination."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(fake, "pi-top-os-unstable", "--all-packages", "--format", "ndjson"),
+    )
+    assert result.exit_code == 0, result.output
+    packages = records(result.stdout)
+    assert [p["package"] for p in packages] == [package_name(i) for i in range(12)]
+    assert all(p["latest_version"] == "1.3.0-1" for p in packages)
+
+
+def test_json_format(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It writes every record as an element of a single JSON array."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(fake, "pi-top-os-unstable", "--all-packages", "--format", "json"),
+    )
+    assert result.exit_code == 0, result.output
+    packages = json.loads(result.stdout)
+    assert [p["package"] for p in packages] == [package_name(i) for i in range(12)]
+    assert all(p["type"] == "package" for p in packages)
+
+
+def test_package_without_versions(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It reports packages without versions for the distro as errors."""
+    fake.repositories[("pi-top-os-unstable", "debian/bullseye")][package_name(3)] = []
+    result = runner.invoke(
+        __main__.main,
+        cli_args(fake, "pi-top-os-unstable", "--all-packages", "--format", "ndjson"),
+    )
+    assert result.exit_code == 0, result.output
+    packages = {p["package"]: p for p in records(result.stdout)}
+    assert len(packages) == 12
+    assert packages[package_name(3)]["error"] == (
+        "No versions for distro 'debian/bullseye'"
+    )
+    assert "latest_version" not in packages[package_name(3)]
+    assert packages[package_name(4)]["latest_version"] == "1.3.0-1"
+
+
+def test_elapsed_includes_fetching_versions(
+    runner: CliRunner, fake: FakePackageCloud
+) -> None:
+    """It counts the time taken to fetch the versions of a package."""
+    fake.config.latency = 0.1
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--package-name",
+            package_name(3),
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    [package] = records(result.stdout)
+    assert package["elapsed"] >= 0.1
+
+
+def test_promote_check(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It finds packages with newer versions than in the other repository."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--promote-check",
+            "-a",
+            "pi-top-os",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    for package in records(result.stdout):
+        assert package["destinations"] == [
+            {
+                "repository": "pi-top-os",
+                "latest_version": "1.2.0-1",
+                "decision": "promote",
+            }
+        ]
+
+
+def test_promote(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It promotes the latest version of packages newer than in the other
+    repository."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--promote",
+            "-a",
+            "pi-top-os",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    promotions = [r for r in records(result.stdout) if r["type"] == "promotion"]
+    assert [p["package"] for p in promotions] == [package_name(i) for i in range(12)]
+    assert all(p["decision"] == "promoted" for p in promotions)
+    assert fake.stats.by_method["POST"] == 12
+    for i in range(12):
+        for repository, latest in (
+            ("pi-top-os-unstable", "1.2.0"),
+            ("pi-top-os", "1.3.0"),
+        ):
+            versions = fake.versions(repository, "debian/bullseye", package_name(i))
+            assert versions[-1]["version"] == latest
+
+
+@pytest.mark.parametrize("status", [409, 422])
+def test_promote_rejected(runner: CliRunner, fake: FakePackageCloud, status) -> None:
+    """It reports promotions rejected by PackageCloud as skipped."""
+    fake.config.rejected_promotions = (("pi-top-os-unstable", package_name(3), status),)
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--package-name",
+            package_name(3),
+            "--promote",
+            "-a",
+            "pi-top-os",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    [promotion] = [r for r in records(result.stdout) if r["type"] == "promotion"]
+    assert promotion["decision"] == "skipped"
+    assert "Promotion rejected" in promotion["error"]
+    assert fake.stats.by_method["POST"] == 1
+
+
+def test_promote_dry_run(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It doesn't send any promotion with '--dry-run'."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--promote",
+            "--dry-run",
+            "-a",
+            "pi-top-os",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    promotions = [r for r in records(result.stdout) if r["type"] == "promotion"]
+    assert len(promotions) == 12
+    assert all(p["decision"] == "dry-run" for p in promotions)
+    assert "POST" not in fake.stats.by_method
+
+
+def test_chain_leaves_out_unknown_destination_versions(
+    runner: CliRunner, fake: FakePackageCloud
+) -> None:
+    """It doesn't take packages whose versions couldn't be fetched from the
+    destination as missing there."""
+    fake.config.failing_versions = (("pi-top-os", package_name(3)),)
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--chain",
+            "-a",
+            "pi-top-os",
+            "--retries",
+            "0",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    output = records(result.stdout)
+    candidates = [r["package"] for r in output if r["type"] == "promotion-candidate"]
+    assert candidates == [package_name(i) for i in range(12) if i != 3]
+    [error] = [r for r in output if r["type"] == "package"]
+    assert error["package"] == package_name(3)
+    assert error["repository"] == "pi-top-os"
+    assert "error" in error
+
+
+def test_chain_reports_repositories_that_cant_be_listed(
+    runner: CliRunner, fake: FakePackageCloud
+) -> None:
+    """It plans the other stages of the chain and fails without a traceback
+    when a repository can't be listed."""
+    fake.config.failing_repositories = ("pi-top-os",)
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--chain",
+            "-a",
+            "pi-top-os-testing",
+            "-a",
+            "pi-top-os",
+            "--retries",
+            "0",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert "Promotions couldn't be planned for 1 stages of the chain" in result.output
+    output = records(result.stdout)
+    candidates = [r for r in output if r["type"] == "promotion-candidate"]
+    assert len(candidates) == 12
+    assert all(c["destination_repository"] == "pi-top-os-testing" for c in candidates)
+    [error] = [r for r in output if r["type"] == "stage"]
+    assert error["source_repository"] == "pi-top-os-testing"
+    assert error["destination_repository"] == "pi-top-os"
+    assert error["error"].startswith("Couldn't list packages of 'pi-top-os': ")
+
+
+def test_chain_rejects_per_package_options(
+    runner: CliRunner, fake: FakePackageCloud
+) -> None:
+    """It refuses options that '--chain' would otherwise ignore."""
+    for options in (("--cleanup-and-keep", "1"), ("--package-name", package_name(3))):
+        result = runner.invoke(
+            __main__.main,
+            cli_args(
+                fake, "pi-top-os-unstable", "--chain", "-a", "pi-top-os", *options
+            ),
+        )
+        assert result.exit_code == 2
+        assert f"'{options[0]}' can't be used with '--chain'" in result.output
+    assert fake.stats.total == 0
+
+
+def test_cleanup_and_keep(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It deletes all but the newest versions of a package."""
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--package-name",
+            package_name(3),
+            "--cleanup-and-keep",
+            "1",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    versions = fake.versions("pi-top-os-unstable", "debian/bullseye", package_name(3))
+    assert [v["version"] for v in versions] == ["1.3.0"]
+    assert fake.stats.by_method["DELETE"] == 3
+
+
+def test_injected_faults_are_retried(runner: CliRunner, fake: FakePackageCloud) -> None:
+    """It retries requests that are rate limited or fail on the server."""
+    fake.config.fault_rate = 0.4
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--retries",
+            "10",
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    assert fake.stats.faults > 0
+    packages = records(result.stdout)
+    assert len(packages) == 12
+    assert not any("error" in p for p in packages)
+
+
+def test_metrics_file(runner: CliRunner, fake: FakePackageCloud, tmp_path) -> None:
+    """It writes the number of requests sent to each endpoint."""
+    metrics_file = tmp_path / "metrics.json"
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--metrics-file",
+            str(metrics_file),
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    endpoints = json.loads(metrics_file.read_text())["endpoints"]
+    # 12 packages in pages of 5, and 4 versions of each package
+    assert endpoints["packages"]["requests"] == 3
+    assert endpoints["versions"]["requests"] == 12
+    assert fake.stats.total == 15
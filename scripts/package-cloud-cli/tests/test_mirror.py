@@ -0,0 +1,144 @@
+"""Test cases for mirroring package files."""
+import hashlib
+import json
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+
+from .fake_packagecloud import FakePackageCloud, package_content, package_name
+
+REPO = "pi-top-os-unstable"
+
+
+def mirror_args(fake: FakePackageCloud, directory, *options: str) -> list:
+    return [
+        str(directory),
+        "-r",
+        REPO,
+        "--user",
+        fake.config.user,
+        "--distro",
+        "debian",
+        "-d",
+        "bullseye",
+        "--api-token",
+        "fake-token",
+        "--server",
+        fake.url,
+        *options,
+    ]
+
+
+def test_mirror(runner: CliRunner, fake: FakePackageCloud, tmp_path) -> None:
+    """It downloads the newest versions of packages and writes an index."""
+    result = runner.invoke(
+        __main__.mirror, mirror_args(fake, tmp_path, "--latest", "2", "-j", "4")
+    )
+    assert result.exit_code == 0, result.output
+    assert "24 downloaded" in result.output
+
+    directory = tmp_path / REPO / "debian" / "bullseye"
+    filename = f"{package_name(0)}_1.3.0-1_all.deb"
+    content = (directory / filename).read_bytes()
+    assert content == package_content(filename, fake.config.package_size)
+    assert not (directory / f"{package_name(0)}_1.1.0-1_all.deb").exists()
+
+    index = json.loads((directory / "index.json").read_text())
+    assert len(index) == 24
+    entry = next(e for e in index if e["filename"] == filename)
+    assert entry["sha256sum"] == hashlib.sha256(content).hexdigest()
+
+
+def test_mirror_skips_mirrored_files(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It doesn't download files that are already mirrored."""
+    args = mirror_args(fake, tmp_path, "-p", package_name(1))
+    assert runner.invoke(__main__.mirror, args).exit_code == 0
+    fake.reset_stats()
+
+    result = runner.invoke(__main__.mirror, args)
+    assert result.exit_code == 0, result.output
+    assert "4 skipped" in result.output
+    # Only the package and version listings are requested
+    assert fake.stats.by_method == {"GET": 4}
+
+
+def test_mirror_resumes_partial_downloads(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It resumes partial downloads and verifies the whole file."""
+    directory = tmp_path / REPO / "debian" / "bullseye"
+    directory.mkdir(parents=True)
+    filename = f"{package_name(2)}_1.0.0-1_all.deb"
+    content = package_content(filename, fake.config.package_size)
+    (directory / f"{filename}.part").write_bytes(content[:1000])
+
+    result = runner.invoke(
+        __main__.mirror, mirror_args(fake, tmp_path, "-p", package_name(2))
+    )
+    assert result.exit_code == 0, result.output
+    assert "1 resumed" in result.output
+    assert fake.stats.ranges == 1
+    assert (directory / filename).read_bytes() == content
+    assert not (directory / f"{filename}.part").exists()
+
+
+def test_mirror_checksum_mismatch(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It fails when the downloaded file doesn't match its sha256."""
+    version = fake.versions(REPO, "debian/bullseye", package_name(3))[0]
+    version["sha256sum"] = "0" * 64
+
+    result = runner.invoke(
+        __main__.mirror, mirror_args(fake, tmp_path, "-p", package_name(3))
+    )
+    assert result.exit_code == 1
+    assert "1 failed" in result.output
+    directory = tmp_path / REPO / "debian" / "bullseye"
+    assert not (directory / version["filename"]).exists()
+    assert not (directory / f"{version['filename']}.part").exists()
+
+
+def test_mirror_complete_partial_download(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It keeps a '.part' file that's complete without downloading it again."""
+    directory = tmp_path / REPO / "debian" / "bullseye"
+    directory.mkdir(parents=True)
+    filename = f"{package_name(2)}_1.0.0-1_all.deb"
+    content = package_content(filename, fake.config.package_size)
+    (directory / f"{filename}.part").write_bytes(content)
+
+    result = runner.invoke(
+        __main__.mirror, mirror_args(fake, tmp_path, "-p", package_name(2))
+    )
+    assert result.exit_code == 0, result.output
+    assert "1 resumed" in result.output
+    assert "3 downloaded" in result.output
+    # The listings, and the files of the other 3 versions
+    assert fake.stats.by_method["GET"] == 4 + 3
+    assert (directory / filename).read_bytes() == content
+    assert not (directory / f"{filename}.part").exists()
+
+
+def test_mirror_restarts_unsatisfiable_partial_download(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It downloads a file again when the server can't resume a corrupted
+    '.part' file that's as long as the file."""
+    directory = tmp_path / REPO / "debian" / "bullseye"
+    directory.mkdir(parents=True)
+    filename = f"{package_name(2)}_1.0.0-1_all.deb"
+    content = package_content(filename, fake.config.package_size)
+    (directory / f"{filename}.part").write_bytes(b"x" * len(content))
+
+    result = runner.invoke(
+        __main__.mirror, mirror_args(fake, tmp_path, "-p", package_name(2))
+    )
+    assert result.exit_code == 0, result.output
+    assert "4 downloaded" in result.output
+    assert (directory / filename).read_bytes() == content
+    assert not (directory / f"{filename}.part").exists()
@@ -0,0 +1,16 @@
+"""Test cases for the ratelimit module."""
+import pytest
+
+from package_cloud_cli.ratelimit import TokenBucket
+
+
+def test_delays_after_pause_increase() -> None:
+    """It releases callers queued during a pause one token at a time."""
+    bucket = TokenBucket(rate=10)
+    bucket.pause(2.0)
+    delays = [bucket.delay() for _ in range(8)]
+    assert delays == sorted(delays)
+    assert len(set(round(delay, 3) for delay in delays)) == 8
+    assert delays[0] >= 2.0
+    # One token every 0.1 seconds once the pause ends
+    assert delays[-1] - delays[0] == pytest.approx(0.7, abs=0.01)
@@ -0,0 +1,127 @@
+"""Test cases for the snapshot module."""
+import json
+from typing import List
+
+from click.testing import CliRunner
+
+from package_cloud_cli import __main__
+from package_cloud_cli.ratelimit import TokenBucket
+from package_cloud_cli.snapshot import SnapshotStore
+
+from .fake_packagecloud import FakePackageCloud, cli_args, package_name
+
+
+def save_args(fake: FakePackageCloud, path, *options: str) -> List[str]:
+    """Arguments to save both repositories of the fake server to 'path',
+    without rate limit unless 'options' set one."""
+    return [
+        "save",
+        str(path),
+        "-r",
+        "pi-top-os-unstable",
+        "-r",
+        "pi-top-os",
+        "--user",
+        fake.config.user,
+        "--distro",
+        "debian",
+        "-d",
+        "bullseye",
+        "--api-token",
+        "fake-token",
+        "--server",
+        fake.url,
+        "--rate-limit",
+        "0",
+        *options,
+    ]
+
+
+def test_snapshot_save(
+    runner: CliRunner, fake: FakePackageCloud, repo_config, tmp_path
+) -> None:
+    """It saves every repository to the snapshot."""
+    path = tmp_path / "snapshot.db"
+    result = runner.invoke(__main__.snapshot, save_args(fake, path))
+    assert result.exit_code == 0, result.output
+    assert "Saved 12 packages from 'pi-top-os' (debian/bullseye)" in result.output
+    with SnapshotStore(str(path)) as store:
+        for repository in ("pi-top-os-unstable", "pi-top-os"):
+            assert len(store.packages(repo_config(repository))) == 12
+
+
+def test_snapshot_save_rate_limit(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path, monkeypatch
+) -> None:
+    """Every request of every repository goes through the same rate limiter."""
+    limiters = []
+    acquire = TokenBucket.acquire
+
+    def recording_acquire(self):
+        limiters.append(self)
+        acquire(self)
+
+    monkeypatch.setattr(TokenBucket, "acquire", recording_acquire)
+    result = runner.invoke(
+        __main__.snapshot,
+        save_args(fake, tmp_path / "snapshot.db", "--rate-limit", "1000"),
+    )
+    assert result.exit_code == 0, result.output
+    assert len(limiters) == fake.stats.total
+    assert len(set(map(id, limiters))) == 1
+
+
+def test_plan_from_snapshot(
+    runner: CliRunner, fake: FakePackageCloud, tmp_path
+) -> None:
+    """It plans promotions from a snapshot without sending any request."""
+    path = tmp_path / "snapshot.db"
+    result = runner.invoke(__main__.snapshot, save_args(fake, path))
+    assert result.exit_code == 0, result.output
+    fake.reset_stats()
+
+    result = runner.invoke(
+        __main__.main,
+        cli_args(
+            fake,
+            "pi-top-os-unstable",
+            "--all-packages",
+            "--promote",
+            "--dry-run",
+            "-a",
+            "pi-top-os",
+            "--snapshot",
+            str(path),
+            "--format",
+            "ndjson",
+        ),
+    )
+    assert result.exit_code == 0, result.output
+    promotions = [
+        record
+        for record in map(json.loads, result.stdout.splitlines())
+        if record["type"] == "promotion"
+    ]
+    assert [p["package"] for p in promotions] == [package_name(i) for i in range(12)]
+    assert all(p["source_version"] == "1.3.0-1" for p in promotions)
+    assert all(p["destination_version"] == "1.2.0-1" for p in promotions)
+    assert fake.stats.total == 0
+
+
+def test_snapshot_diff(runner: CliRunner, fake: FakePackageCloud, tmp_path) -> None:
+    """It shows the versions added and removed between two snapshots."""
+    old, new = tmp_path / "old.db", tmp_path / "new.db"
+    assert runner.invoke(__main__.snapshot, save_args(fake, old)).exit_code == 0
+    versions = fake.versions("pi-top-os", "debian/bullseye", package_name(2))
+    versions.pop(0)
+    versions.append(
+        fake._fragment("pi-top-os", "debian/bullseye", package_name(2), "1.4.0", "1")
+    )
+    assert runner.invoke(__main__.snapshot, save_args(fake, new)).exit_code == 0
+
+    result = runner.invoke(__main__.snapshot, ["diff", str(old), str(new)])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        f"- pi-top-os (debian/bullseye) {package_name(2)} 1.0.0-1",
+        f"+ pi-top-os (debian/bullseye) {package_name(2)} 1.4.0-1",
+    ]
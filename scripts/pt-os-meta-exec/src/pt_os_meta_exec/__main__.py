@@ -1,14 +1,59 @@
 """Command-line interface for working with pi-topOS software repositories."""
+import os
+import pathlib
+import sys
+import time
+
 import click
 from pyfiglet import Figlet
 
+from .checks import (
+    CheckEngine,
+    CheckSpecError,
+    format_matrix,
+    load_checks,
+    matrix_to_json,
+)
 from .classes import InteractivePrompt, ScriptRunConditions, ScriptRunner, ScriptRunOpts
+from .executor import cloned_projects
+from .facts import FACTS, FILE_PREFIX, KEY_FILES, parse_where
+from .filters import ProjectFilter
+from .meta import find_meta_file, load_projects
+from .sync import ProjectSync
 from .terminal import color
 
+DEFAULT_CHECKS = str(
+    pathlib.Path(__file__).parent.absolute() / "package-quality-checks.yaml"
+)
+
 # TODO: set opts in interactive mode
 
 
-@click.command()
+def validate_where(ctx, param, value):
+    for where in value:
+        try:
+            parse_where(where)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    return value
+
+
+class DefaultCommandGroup(click.Group):
+    """Group that runs 'default_command' unless the first argument names
+    another command, so that 'pt-os-meta-exec <options> <command>' keeps
+    running commands in every repo."""
+
+    def __init__(self, *args, default_command, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not args or args[0] not in self.commands:
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.command("exec")
 ###############################
 # Command OR sourced function #
 ###############################
@@ -25,10 +70,37 @@ from .terminal import color
 @click.option(
     "--parallel/--no-parallel",
     type=bool,
-    help="Run 'meta exec' in parallel.",
+    help="Run the command in several repos at the same time.",
     default=False,
     show_default=True,
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of repos to run the command in at the same time with '--parallel'.",
+    default=os.cpu_count() or 1,
+    show_default=True,
+)
+@click.option(
+    "--output",
+    type=click.Choice(["prefixed", "grouped"]),
+    help="With '--parallel', show lines as they come prefixed with their repo, or the output of each repo once it's done.",
+    default="prefixed",
+    show_default=True,
+)
+@click.option(
+    "--results-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the exit code, duration and last lines of output of each repo to this JSON file.",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["native", "meta"]),
+    help="Run the command in each repo directly, or through 'meta exec'.",
+    default="native",
+    show_default=True,
+)
 ##################
 # Script options #
 ##################
@@ -76,27 +148,86 @@ from .terminal import color
     help="Bash string condition (including wildcards) to not match before running the command on each repo (e.g. 'debian/*').",
     multiple=True,
 )
-def main(
+@click.option(
+    "where",
+    "--where",
+    type=str,
+    help=f"Condition on a fact about each repo, as <fact>=<pattern> with wildcards (e.g. 'distribution=bookworm'). "
+    f"Facts are cached between runs. One of: {', '.join(FACTS)}; or "
+    f"'{FILE_PREFIX}<path>=yes|no' for whether one of {', '.join(KEY_FILES)} exists.",
+    multiple=True,
+    callback=validate_where,
+)
+@click.option(
+    "--changed-since",
+    type=str,
+    help="Only run the command in repos with commits since a git ref, a timestamp or an ISO 8601 date "
+    "(e.g. 'origin/master', '2022-06-01').",
+)
+@click.option(
+    "--memoize/--no-memoize",
+    help="Replay the output and exit code of repos that didn't change since the same command last ran in them, "
+    "for read-only commands.",
+    default=False,
+)
+def exec_command(
     dry_run,
     strict,
     debug,
     repo_str_match,
     command,
     parallel,
+    jobs,
+    output,
+    results_file,
+    backend,
     bash_conditions,
     file_conditions,
     no_file_conditions,
+    where,
+    changed_since,
+    memoize,
 ):
-    """pi-topOS meta-exec."""
+    """Run COMMAND in every repo, or start an interactive prompt without a
+    COMMAND. This is the default command: a command that is also the name of
+    a pt-os-meta-exec command can be run after '--'."""
     click.echo(
         color.BOLD + color.GREEN + Figlet().renderText("pi-topOS meta-exec") + color.END
     )
 
+    if backend == "meta":
+        for name, value in (
+            ("--where", where),
+            ("--changed-since", changed_since),
+            ("--memoize", memoize),
+            ("--results-file", results_file),
+        ):
+            if value:
+                raise click.UsageError(
+                    f"'{name}' isn't supported with '--backend meta'"
+                )
+
     conditions = ScriptRunConditions(
-        repo_str_match, bash_conditions, file_conditions, no_file_conditions
+        repo_str_match,
+        bash_conditions,
+        file_conditions,
+        no_file_conditions,
+        where,
+        changed_since,
     )
 
-    opts = ScriptRunOpts(dry_run, strict, debug, parallel, conditions)
+    opts = ScriptRunOpts(
+        dry_run,
+        strict,
+        debug,
+        parallel,
+        conditions,
+        jobs=jobs,
+        memoize=memoize,
+        output=output,
+        results_file=results_file,
+        backend=backend,
+    )
 
     runner = ScriptRunner(opts)
 
@@ -104,7 +235,145 @@ def main(
         InteractivePrompt(runner).cmdloop()
     else:
         # 'command' is actually a tuple of commands
-        runner.run_commands(command)
+        sys.exit(runner.run_commands(command))
+
+
+@click.command()
+@click.argument(
+    "spec",
+    type=click.Path(exists=True, dir_okay=False),
+    default=DEFAULT_CHECKS,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of repos to check at the same time.",
+    default=os.cpu_count() or 1,
+    show_default=True,
+)
+@click.option(
+    "repo_str_match",
+    "--repo-match",
+    type=str,
+    help="String matching pattern for repository ID (key in .meta) to check.",
+    multiple=True,
+)
+@click.option(
+    "output_format",
+    "--format",
+    type=click.Choice(["text", "json"]),
+    help="Show results as a table, or as JSON.",
+    default="text",
+    show_default=True,
+)
+def check(spec, jobs, repo_str_match, output_format):
+    """Check the files of every repo against the checks in SPEC (the package
+    quality checks by default), showing a table of repos by checks."""
+    try:
+        checks = load_checks(spec)
+    except CheckSpecError as e:
+        raise click.ClickException(str(e))
+
+    meta_file = find_meta_file()
+    if meta_file is None:
+        raise click.ClickException("No .meta file found")
+    conditions = ScriptRunConditions(repo_str_match, (), (), ())
+    projects, _ = ProjectFilter(conditions).split(load_projects(meta_file))
+
+    engine = CheckEngine(checks, jobs)
+    matrix = engine.run(cloned_projects(projects))
+    if output_format == "json":
+        click.echo(matrix_to_json(matrix))
+    else:
+        click.echo(format_matrix(checks, matrix))
+
+    failed = engine.failed(matrix)
+    if failed:
+        click.echo(
+            f"\n{color.BOLD}{color.RED}Checks failed in {len(failed)} of {len(matrix)} repos:{color.END}",
+            err=True,
+        )
+        for name in failed:
+            click.echo(f"  {name}", err=True)
+        sys.exit(1)
+
+
+@click.command()
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of repos to clone or fetch at the same time.",
+    default=8,
+    show_default=True,
+)
+@click.option(
+    "--depth",
+    type=click.IntRange(min=1),
+    help="Clone and fetch shallow, with this many commits of history.",
+)
+@click.option(
+    "filter_spec",
+    "--filter",
+    type=str,
+    help="Partial clone filter for new clones (e.g. 'blob:none').",
+)
+@click.option(
+    "--reference",
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    help="Directory with local copies of the repos, at the same paths as in .meta, to borrow objects from "
+    "when cloning.",
+)
+@click.option(
+    "repo_str_match",
+    "--repo-match",
+    type=str,
+    help="String matching pattern for repository ID (key in .meta) to sync.",
+    multiple=True,
+)
+def sync(jobs, depth, filter_spec, reference, repo_str_match):
+    """Clone the repos in .meta that are missing, and fetch the ones whose
+    remote branch moved, showing how long each one took."""
+    meta_file = find_meta_file()
+    if meta_file is None:
+        raise click.ClickException("No .meta file found")
+    conditions = ScriptRunConditions(repo_str_match, (), (), ())
+    projects, _ = ProjectFilter(conditions).split(load_projects(meta_file))
+
+    if reference is not None:
+        reference = reference.absolute()
+    project_sync = ProjectSync(jobs, depth, filter_spec, reference)
+    started_at = time.monotonic()
+    failed = []
+    for result in project_sync.sync(projects):
+        style = color.RED if result.failed else color.BOLD
+        click.echo(
+            f"{result.project.name}: {style}{result.action}{color.END} ({result.duration:.2f}s)"
+        )
+        if result.failed:
+            click.echo(f"  {result.error}", err=True)
+            failed.append(result)
+    click.echo(f"Synced {len(projects)} repos in {time.monotonic() - started_at:.2f}s")
+
+    if failed:
+        click.echo(
+            f"\n{color.BOLD}{color.RED}Failed to sync {len(failed)} of {len(projects)} repos:{color.END}",
+            err=True,
+        )
+        for result in failed:
+            click.echo(f"  {result.project.name}", err=True)
+        sys.exit(1)
+
+
+@click.group(cls=DefaultCommandGroup, default_command="exec")
+def main():
+    """pi-topOS meta-exec."""
+
+
+main.add_command(exec_command)
+main.add_command(check)
+main.add_command(sync)
 
 
 if __name__ == "__main__":
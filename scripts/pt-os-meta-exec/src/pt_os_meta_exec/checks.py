@@ -0,0 +1,204 @@
+"""Declarative checks of the files of every project.
+
+A check spec is a YAML file with a list of checks, e.g.:
+
+    checks:
+      - name: changelog distribution
+        changelog:
+          distribution: buster
+      - name: clean ignores Jenkinsfile
+        file: debian/clean
+        line: "^tar-ignore = Jenkinsfile$"
+      - name: has pre-commit config
+        file: .pre-commit-config.yaml
+
+A check with only 'file' passes if the file exists; with 'line', if a line of
+the file matches the regular expression; 'changelog' checks fields of the
+first header of 'debian/changelog' (package, version, distribution and
+urgency, each a regular expression). A check whose file is missing is
+reported as such, and only counts as a failure if it's 'required'.
+
+Each file is read once per project, however many checks use it, and all of
+its patterns are matched in a single pass over its lines.
+"""
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional, Pattern
+
+import yaml
+
+from .meta import MetaProject
+
+CHANGELOG = "debian/changelog"
+CHANGELOG_FIELDS = ("package", "version", "distribution", "urgency")
+# e.g. 'pi-topd (4.2.0) buster; urgency=medium'
+CHANGELOG_HEADER_RE = re.compile(
+    r"^(?P<package>\S+) \((?P<version>[^)]+)\) (?P<distribution>[^;]+);"
+    r"(?:.*\burgency=(?P<urgency>\S+))?"
+)
+
+
+class CheckSpecError(Exception):
+    pass
+
+
+class CheckStatus(Enum):
+    PASS = "ok"
+    FAIL = "FAIL"
+    MISSING = "-"
+
+
+@dataclass
+class Check:
+    name: str
+    path: str
+    line: Optional[Pattern] = None
+    changelog: Dict[str, Pattern] = field(default_factory=dict)
+    required: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Check":
+        try:
+            name = data["name"]
+        except (KeyError, TypeError):
+            raise CheckSpecError(f"Check without a name: {data}")
+
+        try:
+            if "changelog" in data:
+                fields = data["changelog"] or {}
+                unknown = set(fields) - set(CHANGELOG_FIELDS)
+                if unknown:
+                    raise CheckSpecError(
+                        f"Unknown changelog fields in check '{name}': {', '.join(sorted(unknown))}"
+                    )
+                return cls(
+                    name,
+                    data.get("file", CHANGELOG),
+                    changelog={k: re.compile(str(v)) for k, v in fields.items()},
+                    required=data.get("required", False),
+                )
+            if "file" not in data:
+                raise CheckSpecError(f"Check '{name}' has no 'file' or 'changelog'")
+            line = data.get("line")
+            return cls(
+                name,
+                data["file"],
+                line=re.compile(line) if line is not None else None,
+                required=data.get("required", False),
+            )
+        except re.error as e:
+            raise CheckSpecError(f"Invalid pattern in check '{name}': {e}")
+
+
+def load_checks(path: str) -> List[Check]:
+    with open(path) as f:
+        spec = yaml.safe_load(f) or {}
+    checks = [Check.from_dict(data) for data in spec.get("checks", [])]
+    names = [check.name for check in checks]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise CheckSpecError(f"Duplicate checks: {', '.join(sorted(duplicates))}")
+    return checks
+
+
+def parse_changelog_header(line: str) -> Optional[Dict[str, str]]:
+    match = CHANGELOG_HEADER_RE.match(line)
+    return match.groupdict() if match else None
+
+
+class CheckEngine:
+    def __init__(self, checks: List[Check], jobs: int = 1):
+        self.checks = checks
+        self.jobs = jobs
+        self._by_path: Dict[str, List[Check]] = {}
+        for check in checks:
+            self._by_path.setdefault(check.path, []).append(check)
+
+    def _check_file(self, project: MetaProject, path: str, checks: List[Check]):
+        try:
+            with open(project.path / path, "rb") as f:
+                text = f.read().decode(errors="replace")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return {check.name: CheckStatus.MISSING for check in checks}
+
+        results = {}
+        pending = []
+        for check in checks:
+            if check.changelog:
+                header = parse_changelog_header(text.partition("\n")[0])
+                passed = header is not None and all(
+                    pattern.search(header[key] or "")
+                    for key, pattern in check.changelog.items()
+                )
+                results[check.name] = CheckStatus.PASS if passed else CheckStatus.FAIL
+            elif check.line is None:
+                results[check.name] = CheckStatus.PASS
+            else:
+                pending.append(check)
+
+        for line in text.splitlines():
+            if not pending:
+                break
+            found = [check for check in pending if check.line.search(line)]
+            for check in found:
+                results[check.name] = CheckStatus.PASS
+                pending.remove(check)
+        for check in pending:
+            results[check.name] = CheckStatus.FAIL
+        return results
+
+    def check_project(self, project: MetaProject) -> Dict[str, CheckStatus]:
+        results = {}
+        for path, checks in self._by_path.items():
+            results.update(self._check_file(project, path, checks))
+        # In the order of the spec
+        return {check.name: results[check.name] for check in self.checks}
+
+    def run(self, projects: List[MetaProject]) -> Dict[str, Dict[str, CheckStatus]]:
+        """Results of every check, by project name and check name."""
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            results = executor.map(self.check_project, projects)
+            return {project.name: result for project, result in zip(projects, results)}
+
+    def failed(self, matrix: Dict[str, Dict[str, CheckStatus]]) -> List[str]:
+        """Names of the projects where any check failed."""
+        required = {check.name for check in self.checks if check.required}
+        return [
+            name
+            for name, results in matrix.items()
+            if any(
+                status == CheckStatus.FAIL
+                or (status == CheckStatus.MISSING and check in required)
+                for check, status in results.items()
+            )
+        ]
+
+
+def format_matrix(checks: List[Check], matrix: Dict[str, Dict[str, CheckStatus]]):
+    """Text table of projects by checks, with a column per check numbered in
+    the order of the spec."""
+    lines = [f"{i:>3}. {check.name}" for i, check in enumerate(checks, start=1)]
+    lines.append("")
+    width = max([len("repo")] + [len(name) for name in matrix])
+    column = max(
+        [len(str(len(checks)))] + [len(status.value) for status in CheckStatus]
+    )
+    header = " ".join(str(i).rjust(column) for i in range(1, len(checks) + 1))
+    lines.append(f"{'repo'.ljust(width)}  {header}")
+    for name, results in matrix.items():
+        row = " ".join(results[check.name].value.rjust(column) for check in checks)
+        lines.append(f"{name.ljust(width)}  {row}")
+    return "\n".join(lines)
+
+
+def matrix_to_json(matrix: Dict[str, Dict[str, CheckStatus]]) -> str:
+    return json.dumps(
+        {
+            name: {check: status.name.lower() for check, status in results.items()}
+            for name, results in matrix.items()
+        },
+        indent=2,
+    )
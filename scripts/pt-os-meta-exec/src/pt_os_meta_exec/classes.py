@@ -6,9 +6,16 @@ import subprocess
 import tempfile
 from cmd import Cmd
 from dataclasses import dataclass
+from typing import Optional
 
 import click
 
+from .executor import ParallelExecutor, cloned_projects, report, write_results
+from .facts import FactsIndex
+from .filters import ProjectFilter
+from .memo import ResultCache
+from .meta import find_meta_file, load_projects
+from .shells import ShellPool
 from .terminal import color
 
 masterWorkflowsPath = str(pathlib.Path(__file__).parent.absolute()) + "/workflow-files"
@@ -21,6 +28,8 @@ class InteractivePrompt(Cmd):
     def __init__(self, runner):
         super(InteractivePrompt, self).__init__()
         self.runner = runner
+        # Started on the first command, and kept for the whole session
+        self.shells = None
 
     def do_update_workflow_files(self, userInputStr):
         inputFields = userInputStr.split(" ")
@@ -77,7 +86,21 @@ class InteractivePrompt(Cmd):
         if inputFields[0] == "u":
             return self.do_update_workflow_files(userInputStr)
 
-        return self.runner.run_command(userInputStr)
+        # The exit code isn't returned: Cmd would take it as a request to
+        # leave the prompt
+        if self.runner.opts.dry_run or self.runner.opts.backend == "meta":
+            self.runner.run_command(userInputStr)
+            return
+
+        if self.shells is None:
+            self.shells = self.runner.shell_pool()
+            if self.shells is None:
+                return
+        report(self.shells.run(userInputStr))
+
+    def postloop(self):
+        if self.shells is not None:
+            self.shells.close()
 
     do_EOF = do_exit
     help_EOF = help_exit
@@ -89,6 +112,10 @@ class ScriptRunConditions:
     bash: tuple
     file: tuple
     no_file: tuple
+    # 'key=pattern' conditions on facts about each project
+    where: tuple = ()
+    # Only projects with commits since this ref or timestamp
+    changed_since: Optional[str] = None
 
 
 @dataclass
@@ -98,10 +125,21 @@ class ScriptRunOpts:
     debug: bool
     parallel: bool
     conditions: ScriptRunConditions
+    jobs: int = 1
+    # Replay results of projects that didn't change since the same script ran
+    memoize: bool = False
+    # How output of parallel runs is shown: 'prefixed' or 'grouped'
+    output: str = "prefixed"
+    # JSON file to write the result of each project to
+    results_file: Optional[str] = None
+    # 'native' runs the script in each project itself; 'meta' uses 'meta exec'
+    backend: str = "native"
 
 
 class ExecutableScript(object):
-    def create(self, commands, opts):
+    def create(self, commands, opts, prefiltered=False):
+        # When 'prefiltered', projects were already filtered by repo and file
+        # conditions, so only bash conditions are left to the script
         handle, self.path = tempfile.mkstemp(text=True)
         atexit.register(self.cleanup)
 
@@ -134,23 +172,24 @@ class ExecutableScript(object):
                 f.write("done\n")
                 f.write('if [[ "${found}" -eq 0 ]]; then exit; fi\n')
 
-            if opts.conditions.repo_str_match:
+            if opts.conditions.repo_str_match and not prefiltered:
                 add_exit_on_multiple_condition_failure(
                     opts.conditions.repo_str_match,
                     condition_prefix='[[ $(pwd) == *"',
                     condition_suffix='"* ]]',
                 )
             add_exit_on_condition_failure(opts.conditions.bash)
-            add_exit_on_condition_failure(
-                opts.conditions.file,
-                condition_prefix="! compgen -G ",
-                condition_suffix=" >/dev/null",
-            )
-            add_exit_on_condition_failure(
-                opts.conditions.no_file,
-                condition_prefix="compgen -G ",
-                condition_suffix=" >/dev/null",
-            )
+            if not prefiltered:
+                add_exit_on_condition_failure(
+                    opts.conditions.file,
+                    condition_prefix="! compgen -G ",
+                    condition_suffix=" >/dev/null",
+                )
+                add_exit_on_condition_failure(
+                    opts.conditions.no_file,
+                    condition_prefix="compgen -G ",
+                    condition_suffix=" >/dev/null",
+                )
 
             for command in commands:
                 f.write(command + "\n")
@@ -173,17 +212,69 @@ class ScriptRunner:
         return self.run_commands((command,))
 
     def run_commands(self, commands):
-        self.script.create(commands, self.opts)
+        native = self.opts.backend == "native"
+        self.script.create(commands, self.opts, prefiltered=native)
 
         click.echo(f"{color.BOLD}{color.UNDERLINE}Script contents:{color.END}")
         with open(self.script.path, "r") as f:
             click.echo(f.read())
 
         if self.opts.dry_run:
-            return
-
-        args = ["meta", "exec", self.script.path]
-        if self.opts.parallel:
-            args.append("--parallel")
-
-        subprocess.run(args)
+            return 0
+
+        if self.opts.backend == "meta":
+            args = ["meta", "exec", self.script.path]
+            if self.opts.parallel:
+                args.append("--parallel")
+            return subprocess.run(args).returncode
+
+        matched = self._matched_projects()
+        if matched is None:
+            return 1
+        projects, facts = matched
+        memo = ResultCache(self.script.path, facts) if self.opts.memoize else None
+        executor = ParallelExecutor(
+            self._jobs,
+            memo,
+            self.opts.output,
+            capture_output=self.opts.results_file is not None,
+        )
+        results = executor.run(self.script.path, projects)
+        if facts is not None:
+            facts.save()
+        if self.opts.results_file:
+            write_results(self.opts.results_file, results)
+        return report(results)
+
+    @property
+    def _jobs(self):
+        return self.opts.jobs if self.opts.parallel else 1
+
+    def _matched_projects(self):
+        """The projects matching the conditions, and the facts index if it's
+        needed, to be saved once done with."""
+        meta_file = find_meta_file()
+        if meta_file is None:
+            click.echo(f"{color.RED}No .meta file found{color.END}", err=True)
+            return None
+        facts = None
+        if self.opts.conditions.where or self.opts.memoize:
+            facts = FactsIndex.for_meta_file(meta_file)
+        projects, skipped = ProjectFilter(self.opts.conditions, facts).split(
+            load_projects(meta_file)
+        )
+        click.echo(
+            f"{color.BOLD}Matched {len(projects)} repos, skipped {len(skipped)}{color.END}"
+        )
+        return projects, facts
+
+    def shell_pool(self):
+        """Warm shells for the matched projects, for running several commands
+        without starting a new shell for each of them."""
+        matched = self._matched_projects()
+        if matched is None:
+            return None
+        projects, facts = matched
+        if facts is not None:
+            facts.save()
+        return ShellPool(cloned_projects(projects), self.opts, self._jobs)
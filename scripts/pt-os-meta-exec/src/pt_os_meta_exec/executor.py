@@ -0,0 +1,338 @@
+"""Run a script in every project of a meta repository."""
+import json
+import os
+import selectors
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Deque, Dict, List, Optional
+
+import click
+
+from .meta import MetaProject
+from .terminal import color
+
+# Lines of output kept in memory for each project
+TAIL_LINES = 50
+READ_SIZE = 65536
+
+
+@dataclass
+class RepoResult:
+    project: MetaProject
+    exit_code: int
+    duration: float
+    # Only captured when running in parallel, memoizing or writing a results
+    # file; only the last lines when run by ParallelExecutor
+    output: str = ""
+    # Replayed from a previous run
+    cached: bool = False
+
+    @property
+    def failed(self):
+        return self.exit_code != 0
+
+
+def print_header(project: MetaProject, cached: bool = False):
+    suffix = " (cached)" if cached else ""
+    click.echo(f"\n{color.BOLD}{color.BLUE}{project.name}:{color.END}{suffix}")
+
+
+def print_result(result: RepoResult):
+    print_header(result.project, result.cached)
+    click.echo(result.output, nl=False)
+
+
+def print_output(project: MetaProject, output: BinaryIO, cached: bool = False):
+    """Like print_result, with the whole output read back from a file."""
+    print_header(project, cached)
+    output.seek(0)
+    for line in output:
+        click.echo(line.decode(errors="replace"), nl=False)
+
+
+def output_tail(output: BinaryIO) -> str:
+    output.seek(0)
+    lines = (line.decode(errors="replace") for line in output)
+    return "".join(deque(lines, maxlen=TAIL_LINES))
+
+
+def cloned_projects(projects: List[MetaProject]) -> List[MetaProject]:
+    """Leave out the projects that aren't cloned, with a warning for each."""
+    for project in projects:
+        if not project.exists:
+            click.echo(
+                f"{color.YELLOW}Skipping '{project.name}': not cloned{color.END}",
+                err=True,
+            )
+    return [project for project in projects if project.exists]
+
+
+class Progress:
+    """Line at the bottom of the terminal with the number of projects done,
+    running and failed. Only shown if stderr is a terminal."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.running = 0
+        self.failed = 0
+        self.enabled = sys.stderr.isatty()
+
+    def clear(self):
+        if self.enabled:
+            click.echo("\r\x1b[K", nl=False, err=True)
+
+    def draw(self):
+        if self.enabled:
+            click.echo(
+                f"\r\x1b[K{color.BOLD}[{self.done}/{self.total} done, {self.running} running, "
+                f"{self.failed} failed]{color.END}",
+                nl=False,
+                err=True,
+            )
+
+
+@dataclass
+class _Running:
+    project: MetaProject
+    process: subprocess.Popen
+    started_at: float
+    key: Optional[str]
+    # Last lines of output
+    lines: Deque[str] = field(default_factory=lambda: deque(maxlen=TAIL_LINES))
+    # Whole output, when it's needed, spooled to a temporary file rather than
+    # kept in memory
+    spool: Optional[BinaryIO] = None
+    # Incomplete last line of each stream
+    partial: Dict[int, bytes] = field(default_factory=dict)
+    open_streams: int = 2
+
+
+class ParallelExecutor:
+    OUTPUTS = ("prefixed", "grouped")
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        memo=None,
+        output: str = "prefixed",
+        capture_output: bool = False,
+    ):
+        self.jobs = jobs
+        # A ResultCache, to replay results of projects that didn't change
+        self.memo = memo
+        # Whether the last lines of output of each project are needed, e.g.
+        # for a results file, even when running one project at a time
+        self.capture_output = capture_output
+        # 'prefixed' shows lines as they come, prefixed with the name of
+        # their project; 'grouped' shows the output of each project as a
+        # whole once it's done
+        self.output = output
+        self._width = 0
+        self._progress: Optional[Progress] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+
+    def _run_serial(self, script_path, project):
+        print_header(project)
+        started_at = time.monotonic()
+        # Output goes straight to the terminal, so that commands can be
+        # interactive
+        process = subprocess.run([script_path], cwd=project.path)
+        return RepoResult(project, process.returncode, time.monotonic() - started_at)
+
+    def _prefix(self, project: MetaProject) -> str:
+        return f"{color.BLUE}{project.name.ljust(self._width)}{color.END} | "
+
+    def _echo(self, project: MetaProject, line: str, err: bool = False):
+        self._progress.clear()
+        click.echo(self._prefix(project) + line, nl=False, err=err)
+        self._progress.draw()
+
+    def _start(self, script_path, project, key) -> _Running:
+        process = subprocess.Popen(
+            [script_path],
+            cwd=project.path,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        running = _Running(project, process, time.monotonic(), key)
+        # Memoized and grouped output is needed whole, to be stored or shown
+        if key is not None or self.output == "grouped":
+            running.spool = tempfile.TemporaryFile()
+        for stream in (process.stdout, process.stderr):
+            os.set_blocking(stream.fileno(), False)
+            self._selector.register(stream, selectors.EVENT_READ, running)
+        return running
+
+    def _line(self, running: _Running, line: bytes, err: bool):
+        text = line.decode(errors="replace")
+        running.lines.append(text)
+        if running.spool is not None:
+            running.spool.write(line)
+        if self.output == "prefixed":
+            self._echo(running.project, text, err=err)
+
+    def _read(self, running: _Running, stream) -> bool:
+        """Read what's available from 'stream', returning True once the
+        process closed all its streams."""
+        fd = stream.fileno()
+        err = stream is running.process.stderr
+        data = os.read(fd, READ_SIZE)
+        if not data:
+            self._selector.unregister(stream)
+            stream.close()
+            rest = running.partial.pop(fd, b"")
+            if rest:
+                self._line(running, rest + b"\n", err)
+            running.open_streams -= 1
+            return running.open_streams == 0
+
+        *lines, running.partial[fd] = (running.partial.get(fd, b"") + data).split(b"\n")
+        for line in lines:
+            self._line(running, line + b"\n", err)
+        return False
+
+    def _finish(self, result: RepoResult, output: Optional[BinaryIO] = None):
+        """Show the end of a project; 'output' is its whole output, for grouped
+        output and replayed results."""
+        self._progress.done += 1
+        if result.failed:
+            self._progress.failed += 1
+        if self.output == "grouped":
+            self._progress.clear()
+            print_output(result.project, output, result.cached)
+            self._progress.draw()
+            return
+        if result.cached:
+            output.seek(0)
+            for line in output:
+                self._echo(result.project, line.decode(errors="replace"))
+            status = f"cached, exit code {result.exit_code}"
+        else:
+            status = f"exit code {result.exit_code} after {result.duration:.2f}s"
+        style = color.RED if result.failed else color.BOLD
+        self._echo(result.project, f"{style}{status}{color.END}\n")
+
+    def _replay(self, project, key) -> Optional[RepoResult]:
+        """Show the stored result of 'project', if there's one."""
+        cached = self.memo.get(key) if key is not None else None
+        if cached is None:
+            return None
+        exit_code, output = cached
+        with output:
+            result = RepoResult(
+                project, exit_code, 0.0, output_tail(output), cached=True
+            )
+            self._finish(result, output)
+        return result
+
+    def _multiplex(self, script_path, projects) -> Dict[str, RepoResult]:
+        keys = {}
+        if self.memo is not None:
+            # Keys need git, so they're worked out in parallel up front
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                keys = dict(
+                    zip(
+                        (project.name for project in projects),
+                        executor.map(self.memo.key, projects),
+                    )
+                )
+
+        results = {}
+        pending = deque(projects)
+        running = 0
+        self._width = max((len(project.name) for project in projects), default=0)
+        self._progress = Progress(len(projects))
+        with selectors.DefaultSelector() as self._selector:
+            while pending or running:
+                while pending and running < self.jobs:
+                    project = pending.popleft()
+                    key = keys.get(project.name)
+                    result = self._replay(project, key)
+                    if result is not None:
+                        results[project.name] = result
+                        continue
+                    self._start(script_path, project, key)
+                    running += 1
+                    self._progress.running = running
+                    self._progress.draw()
+                if not running:
+                    break
+
+                for selector_key, _ in self._selector.select():
+                    state = selector_key.data
+                    if not self._read(state, selector_key.fileobj):
+                        continue
+                    exit_code = state.process.wait()
+                    result = RepoResult(
+                        state.project,
+                        exit_code,
+                        time.monotonic() - state.started_at,
+                        "".join(state.lines),
+                    )
+                    if state.key is not None:
+                        self.memo.put(state.key, result.exit_code, state.spool)
+                    results[state.project.name] = result
+                    running -= 1
+                    self._progress.running = running
+                    self._finish(result, state.spool)
+                    if state.spool is not None:
+                        state.spool.close()
+        self._progress.clear()
+        return results
+
+    def run(self, script_path: str, projects: List[MetaProject]) -> List[RepoResult]:
+        """Run the script in each project, returning results in the order of
+        'projects'."""
+        projects = cloned_projects(projects)
+
+        if self.jobs <= 1 and self.memo is None and not self.capture_output:
+            return [self._run_serial(script_path, project) for project in projects]
+
+        # Output has to be captured to be memoized or written to a results
+        # file, even without '--parallel'
+        results = self._multiplex(script_path, projects)
+        return [results[project.name] for project in projects]
+
+
+def write_results(path: str, results: List[RepoResult]):
+    """Write the exit code, duration and last lines of output of each project
+    as JSON."""
+    data = {
+        "repos": [
+            {
+                "name": result.project.name,
+                "path": str(result.project.path),
+                "exit_code": result.exit_code,
+                "duration": round(result.duration, 3),
+                "cached": result.cached,
+                "output_tail": result.output.splitlines()[-TAIL_LINES:],
+            }
+            for result in results
+        ],
+        "failed": [result.project.name for result in results if result.failed],
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def report(results: List[RepoResult]) -> int:
+    """Print a summary of failures, returning the overall exit code."""
+    failed = [result for result in results if result.failed]
+    if not failed:
+        return 0
+    click.echo(
+        f"\n{color.BOLD}{color.RED}Failed in {len(failed)} of {len(results)} repos:{color.END}",
+        err=True,
+    )
+    for result in failed:
+        click.echo(f"  {result.project.name} (exit code {result.exit_code})", err=True)
+    return 1
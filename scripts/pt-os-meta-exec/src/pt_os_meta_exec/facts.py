@@ -0,0 +1,251 @@
+"""On-disk index of facts about each project, for filtering with '--where'.
+
+Facts are the current branch, HEAD commit and tree, the package, version,
+distribution and urgency of the latest entry of 'debian/changelog',
+'debian/source/format', and which key files exist, queried as
+'file:<path>=yes|no'.
+
+An entry is only refreshed when its signature changes: the HEAD commit, read
+from '.git' without running git, and the size and modification time of the
+key files. Checking the index when nothing has changed doesn't start any
+process.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import subprocess
+import threading
+from fnmatch import fnmatchcase
+from typing import Dict, Optional, Tuple
+
+from .checks import CHANGELOG, parse_changelog_header
+from .meta import MetaProject
+
+INDEX_VERSION = 3
+SOURCE_FORMAT = "debian/source/format"
+KEY_FILES = (
+    CHANGELOG,
+    "debian/control",
+    "debian/clean",
+    SOURCE_FORMAT,
+    "debian/source/options",
+    ".pre-commit-config.yaml",
+    ".github/workflows",
+    "Jenkinsfile",
+    "setup.cfg",
+    "setup.py",
+    "pyproject.toml",
+)
+FACTS = (
+    "branch",
+    "head",
+    "tree",
+    "package",
+    "version",
+    "distribution",
+    "urgency",
+    "source_format",
+)
+# Conditions on key files are written 'file:<path>=yes|no'
+FILE_PREFIX = "file:"
+
+
+def cache_dir() -> pathlib.Path:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(base) / "pt-os-meta-exec"
+
+
+def git_dir(path: pathlib.Path) -> Optional[pathlib.Path]:
+    dot_git = path / ".git"
+    if dot_git.is_dir():
+        return dot_git
+    if dot_git.is_file():
+        # Submodules and worktrees: 'gitdir: <path>'
+        content = dot_git.read_text().strip()
+        if content.startswith("gitdir:"):
+            return (path / content[len("gitdir:") :].strip()).resolve()
+    return None
+
+
+def _resolve_ref(git_dir: pathlib.Path, ref: str) -> Optional[str]:
+    # Worktrees keep their HEAD, but share the refs of the main repository
+    common_dir = git_dir
+    if (git_dir / "commondir").is_file():
+        common_dir = (git_dir / (git_dir / "commondir").read_text().strip()).resolve()
+
+    for directory in (git_dir, common_dir):
+        try:
+            return (directory / ref).read_text().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+    try:
+        with open(common_dir / "packed-refs") as f:
+            for line in f:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.rstrip("\n").partition(" ")
+                if name == ref:
+                    return sha
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def read_head(path: pathlib.Path) -> Tuple[Optional[str], Optional[str]]:
+    """Current branch (None if detached) and HEAD commit of a repository."""
+    directory = git_dir(path)
+    if directory is None:
+        return None, None
+    try:
+        head = (directory / "HEAD").read_text().strip()
+    except FileNotFoundError:
+        return None, None
+    if not head.startswith("ref:"):
+        return None, head
+    ref = head[len("ref:") :].strip()
+    branch = ref[len("refs/heads/") :] if ref.startswith("refs/heads/") else ref
+    return branch, _resolve_ref(directory, ref)
+
+
+def _stat(path: pathlib.Path) -> Optional[list]:
+    try:
+        stat = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_text(path: pathlib.Path) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode(errors="replace")
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+class FactsIndex:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._changed = False
+        # Facts are looked up by the workers of the executor
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        if data.get("version") != INDEX_VERSION:
+            data = {}
+        self._entries: Dict[str, dict] = data.get("projects", {})
+
+    @classmethod
+    def for_meta_file(cls, meta_file: pathlib.Path) -> "FactsIndex":
+        key = hashlib.sha1(str(meta_file.absolute()).encode()).hexdigest()[:16]
+        return cls(cache_dir() / f"facts-{key}.json")
+
+    @staticmethod
+    def _signature(project: MetaProject) -> dict:
+        branch, head = read_head(project.path)
+        return {
+            "branch": branch,
+            "head": head,
+            "files": {name: _stat(project.path / name) for name in KEY_FILES},
+        }
+
+    @staticmethod
+    def _collect(project: MetaProject, signature: dict) -> dict:
+        facts = dict.fromkeys(FACTS)
+        facts.update(branch=signature["branch"], head=signature["head"])
+        if facts["head"] is not None:
+            process = subprocess.run(
+                ["git", "rev-parse", "--verify", "-q", "HEAD^{tree}"],
+                cwd=project.path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            if process.returncode == 0:
+                facts["tree"] = process.stdout.decode().strip()
+
+        changelog = _read_text(project.path / CHANGELOG)
+        if changelog is not None:
+            header = parse_changelog_header(changelog.partition("\n")[0])
+            if header:
+                facts.update(header)
+        source_format = _read_text(project.path / SOURCE_FORMAT)
+        if source_format is not None:
+            facts["source_format"] = source_format.strip()
+
+        facts["files"] = {
+            name: stat is not None for name, stat in signature["files"].items()
+        }
+        return facts
+
+    def facts(self, project: MetaProject) -> Optional[dict]:
+        """Facts about 'project', collected again if it changed since they
+        were stored."""
+        if not project.exists:
+            return None
+        signature = self._signature(project)
+        with self._lock:
+            entry = self._entries.get(project.name)
+        if entry is None or entry["signature"] != signature:
+            # Collected outside of the lock, so that projects don't wait for
+            # each other's git processes
+            entry = {"signature": signature, "facts": self._collect(project, signature)}
+            with self._lock:
+                self._entries[project.name] = entry
+                self._changed = True
+        return entry["facts"]
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "projects": self._entries}, f)
+            os.replace(tmp_path, self.path)
+            self._changed = False
+
+
+def parse_where(where: str) -> Tuple[str, str]:
+    """Split a 'key=pattern' condition, checking that 'key' is a fact."""
+    key, sep, pattern = where.partition("=")
+    key = key.strip()
+    if key.startswith(FILE_PREFIX):
+        if (
+            not sep
+            or key[len(FILE_PREFIX) :] not in KEY_FILES
+            or pattern.strip() not in ("yes", "no")
+        ):
+            raise ValueError(
+                f"Invalid condition '{where}': expected {FILE_PREFIX}<path>=yes|no, "
+                f"with a path out of {', '.join(KEY_FILES)}"
+            )
+        return key, pattern.strip()
+    if not sep or key not in FACTS:
+        raise ValueError(
+            f"Invalid condition '{where}': expected <fact>=<pattern>, "
+            f"with a fact out of {', '.join(FACTS)}"
+        )
+    return key, pattern.strip()
+
+
+def _fact(facts: dict, key: str) -> Optional[str]:
+    if key.startswith(FILE_PREFIX):
+        exists = facts.get("files", {}).get(key[len(FILE_PREFIX) :])
+        return None if exists is None else ("yes" if exists else "no")
+    return facts.get(key)
+
+
+def facts_match(facts: Optional[dict], conditions) -> bool:
+    """Whether 'facts' match every (key, pattern) condition; patterns may use
+    shell wildcards."""
+    if facts is None:
+        return False
+    return all(
+        _fact(facts, key) is not None and fnmatchcase(_fact(facts, key), pattern)
+        for key, pattern in conditions
+    )
@@ -0,0 +1,97 @@
+"""Filtering of projects before running anything in them."""
+import glob
+import os
+import subprocess
+from datetime import datetime
+from fnmatch import fnmatchcase
+from typing import List, Optional, Tuple
+
+import click
+
+from .facts import FactsIndex, facts_match, parse_where
+from .meta import MetaProject
+from .terminal import color
+
+
+def parse_since(value: str) -> Optional[int]:
+    """Timestamp of '--changed-since', as seconds since the epoch or an ISO
+    8601 date, or None if it's a git ref."""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+class ProjectFilter:
+    """Evaluate the conditions that don't need a shell: '--repo-match',
+    '--condition-file' and '--condition-no-file'.
+
+    '--where' conditions are looked up in 'facts', which is required if
+    there are any. '--changed-since' runs git, so it's checked last. Bash
+    conditions are left to the script, which then only
+    runs in the projects that pass these filters.
+    """
+
+    def __init__(self, conditions, facts: Optional[FactsIndex] = None):
+        self.conditions = conditions
+        self.facts = facts
+        self._where = [parse_where(where) for where in conditions.where]
+        self._since = None
+        if conditions.changed_since:
+            self._since = parse_since(conditions.changed_since)
+
+    @staticmethod
+    def _glob_matches(project: MetaProject, pattern: str) -> bool:
+        # Like 'compgen -G', which conditions used to be evaluated with:
+        # patterns are relative to the project and '*' skips hidden files
+        pattern = os.path.join(glob.escape(str(project.path)), pattern)
+        return next(glob.iglob(pattern), None) is not None
+
+    def matches(self, project: MetaProject) -> bool:
+        repo_str_match = self.conditions.repo_str_match
+        if repo_str_match and not any(
+            fnmatchcase(project.name, f"*{pattern}*") for pattern in repo_str_match
+        ):
+            return False
+        if not all(self._glob_matches(project, p) for p in self.conditions.file):
+            return False
+        if any(self._glob_matches(project, p) for p in self.conditions.no_file):
+            return False
+        if self._where and not facts_match(self.facts.facts(project), self._where):
+            return False
+        if self.conditions.changed_since and not self._changed_since(project):
+            return False
+        return True
+
+    def _changed_since(self, project: MetaProject) -> bool:
+        if not project.exists:
+            # Left for the executor to report
+            return True
+        if self._since is not None:
+            args = ["git", "rev-list", "-n1", f"--max-age={self._since}", "HEAD"]
+        else:
+            args = ["git", "rev-list", "-n1", f"{self.conditions.changed_since}..HEAD"]
+        process = subprocess.run(
+            args, cwd=project.path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        if process.returncode != 0:
+            # Without a way to tell, the command runs
+            click.echo(
+                f"{color.YELLOW}'{project.name}': can't tell if it changed since "
+                f"'{self.conditions.changed_since}'{color.END}",
+                err=True,
+            )
+            return True
+        return bool(process.stdout.strip())
+
+    def split(
+        self, projects: List[MetaProject]
+    ) -> Tuple[List[MetaProject], List[MetaProject]]:
+        """Split 'projects' into the ones that match and the ones that don't."""
+        matched = []
+        skipped = []
+        for project in projects:
+            (matched if self.matches(project) else skipped).append(project)
+        return matched, skipped
@@ -0,0 +1,102 @@
+"""Results of scripts, kept to be replayed for projects that didn't change.
+
+A result is stored under a key made of the content of the script (and of
+'lib.bash', which it sources), the project, the tree of its HEAD commit and
+the state of its working tree: the output of 'git status' and the size and
+modification time of every file listed there. Only projects that are git
+repositories can be memoized.
+
+The output of a result is stored in a file of its own, next to its exit
+code, so that it's copied and replayed without being read in memory whole.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from typing import BinaryIO, Optional, Tuple
+
+from .facts import FactsIndex, cache_dir
+from .meta import MetaProject
+from .shells import LIB_BASH
+
+
+def worktree_state(project: MetaProject) -> Optional[bytes]:
+    """Digest of the uncommitted changes of a project, or None if it isn't a
+    git repository."""
+    process = subprocess.run(
+        ["git", "status", "--porcelain", "-z", "--untracked-files=all"],
+        cwd=project.path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if process.returncode != 0:
+        return None
+
+    digest = hashlib.sha256(process.stdout)
+    entries = iter(process.stdout.split(b"\0"))
+    for entry in entries:
+        if len(entry) < 4:
+            continue
+        status, path = entry[:2], entry[3:].decode(errors="surrogateescape")
+        if status[:1] in (b"R", b"C"):
+            # Renames and copies are followed by the original path
+            next(entries, None)
+        # Listed files can change again without changing the status
+        try:
+            stat = os.stat(project.path / path)
+            digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+    return digest.digest()
+
+
+class ResultCache:
+    def __init__(self, script_path: str, facts: FactsIndex, directory=None):
+        self.facts = facts
+        self.directory = directory or cache_dir() / "results"
+        script = hashlib.sha256()
+        for path in (script_path, LIB_BASH):
+            with open(path, "rb") as f:
+                script.update(f.read())
+        self._script = script.hexdigest()
+
+    def key(self, project: MetaProject) -> Optional[str]:
+        facts = self.facts.facts(project)
+        tree = facts["tree"] if facts else None
+        if tree is None:
+            return None
+        state = worktree_state(project)
+        if state is None:
+            return None
+        key = hashlib.sha256()
+        for part in (self._script, project.name, tree):
+            key.update(part.encode() + b"\0")
+        key.update(state)
+        return key.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[int, BinaryIO]]:
+        """Exit code of a stored result, and its output opened for reading."""
+        try:
+            with open(self.directory / f"{key}.json") as f:
+                exit_code = json.load(f)["exit_code"]
+            return exit_code, open(self.directory / f"{key}.out", "rb")
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, exit_code: int, output: BinaryIO):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # The output goes first: a result is only found once its exit code is
+        # written
+        output.seek(0)
+        path = self.directory / f"{key}.out"
+        tmp_path = path.with_suffix(f".out.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(output, f)
+        os.replace(tmp_path, path)
+
+        path = self.directory / f"{key}.json"
+        tmp_path = path.with_suffix(f".json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"exit_code": exit_code}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,38 @@
+"""Projects listed in a '.meta' file."""
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+META_FILENAME = ".meta"
+
+
+@dataclass
+class MetaProject:
+    # Key of the project in '.meta': its path relative to the meta repository
+    name: str
+    path: pathlib.Path
+    url: str
+
+    @property
+    def exists(self):
+        return self.path.is_dir()
+
+
+def find_meta_file(start: Optional[pathlib.Path] = None) -> Optional[pathlib.Path]:
+    """Find the '.meta' file of the meta repository containing 'start'."""
+    directory = (start if start else pathlib.Path.cwd()).absolute()
+    for candidate in [directory] + list(directory.parents):
+        meta_file = candidate / META_FILENAME
+        if meta_file.is_file():
+            return meta_file
+    return None
+
+
+def load_projects(meta_file: pathlib.Path) -> List[MetaProject]:
+    with open(meta_file) as f:
+        projects = json.load(f).get("projects", {})
+    return [
+        MetaProject(name=name, path=meta_file.parent / name, url=url)
+        for name, url in projects.items()
+    ]
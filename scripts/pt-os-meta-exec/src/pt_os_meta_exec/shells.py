@@ -0,0 +1,150 @@
+"""Long-lived bash shells, one per project, for the interactive prompt.
+
+Each shell sources 'lib.bash' once when it starts. Commands are then written
+to its stdin and run in a subshell, so that 'cd', 'exit' or variables set by
+one command don't leak into the next; the subshell is followed by a marker
+line carrying its exit code, which frames the output of the command.
+"""
+import pathlib
+import shlex
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+import click
+
+from .executor import RepoResult, print_header, print_result
+from .meta import MetaProject
+
+LIB_BASH = pathlib.Path(__file__).parent.absolute() / "lib.bash"
+
+
+class ShellWorker:
+    def __init__(self, project: MetaProject, opts):
+        self.project = project
+        self.opts = opts
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            cwd=self.project.path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self._send(f"source {shlex.quote(str(LIB_BASH))}\n")
+
+    def _send(self, text: str):
+        self.process.stdin.write(text.encode())
+        self.process.stdin.flush()
+
+    def _frame(self, command: str, marker: str) -> str:
+        lines = ["("]
+        if self.opts.strict:
+            lines.append("set -euo pipefail")
+        if self.opts.debug:
+            lines.append("set -x")
+        for condition in self.opts.conditions.bash:
+            lines.append(f"if ! {condition}; then exit; fi")
+        # Passed to 'eval' as a single quoted word, so that a command with a
+        # syntax error fails in the subshell instead of leaving the shell
+        # waiting for the rest of it
+        lines.append(f"eval {shlex.quote(command)}")
+        # Commands can't read the shell's stdin, which carries the commands
+        lines.append(") </dev/null")
+        lines.append(f"printf '%s %d\\n' {marker} $?")
+        return "\n".join(lines) + "\n"
+
+    def run(
+        self, command: str, on_output: Optional[Callable[[str], None]] = None
+    ) -> RepoResult:
+        """Run 'command' in the shell, passing each line of output to
+        'on_output' as it arrives."""
+        if not self.alive:
+            self.start()
+
+        started_at = time.monotonic()
+        marker = f"__pt_os_meta_exec_{uuid.uuid4().hex}__"
+        output = []
+        exit_code = None
+        try:
+            self._send(self._frame(command, marker))
+        except BrokenPipeError:
+            pass
+        for raw_line in iter(self.process.stdout.readline, b""):
+            line = raw_line.decode(errors="replace")
+            index = line.find(marker)
+            if index != -1:
+                # Output that didn't end with a newline precedes the marker
+                line, exit_code = line[:index], int(line[index + len(marker) :])
+            if line:
+                output.append(line)
+                if on_output:
+                    on_output(line)
+            if exit_code is not None:
+                break
+        else:
+            # The shell itself exited; it's started again for the next command
+            exit_code = self.process.wait()
+        return RepoResult(
+            self.project, exit_code, time.monotonic() - started_at, "".join(output)
+        )
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (BrokenPipeError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class ShellPool:
+    """Warm shells for a fixed set of projects, started on first use."""
+
+    def __init__(self, projects: List[MetaProject], opts, jobs: int = 1):
+        self.workers = [ShellWorker(project, opts) for project in projects]
+        self.jobs = jobs
+
+    def run(self, command: str) -> List[RepoResult]:
+        """Run 'command' in every shell, returning results in the order of the
+        projects."""
+        if self.jobs <= 1:
+            results = []
+            for worker in self.workers:
+                print_header(worker.project)
+                results.append(
+                    worker.run(
+                        command, on_output=lambda line: click.echo(line, nl=False)
+                    )
+                )
+            return results
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(worker.run, command) for worker in self.workers]
+            for future in as_completed(futures):
+                result = future.result()
+                print_result(result)
+                results[result.project.name] = result
+        return [results[worker.project.name] for worker in self.workers]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
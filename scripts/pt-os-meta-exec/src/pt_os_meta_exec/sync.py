@@ -0,0 +1,137 @@
+"""Clone and fetch the projects of a meta repository in parallel.
+
+Projects that aren't cloned yet are cloned, optionally shallow ('depth'),
+partial ('filter') or borrowing objects from a local copy of the project
+under 'reference'. Cloned projects are only fetched if the remote branch
+tracked by their current branch moved, which is checked with 'git
+ls-remote' rather than a full fetch.
+"""
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from .facts import read_head
+from .meta import MetaProject
+
+
+class SyncAction:
+    CLONED = "cloned"
+    FETCHED = "fetched"
+    UP_TO_DATE = "up to date"
+    FAILED = "failed"
+
+
+@dataclass
+class SyncResult:
+    project: MetaProject
+    action: str
+    duration: float
+    error: str = ""
+
+    @property
+    def failed(self):
+        return self.action == SyncAction.FAILED
+
+
+class GitError(Exception):
+    pass
+
+
+def git(*args, cwd=None) -> str:
+    process = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if process.returncode != 0:
+        raise GitError(process.stderr.decode(errors="replace").strip())
+    return process.stdout.decode(errors="replace").strip()
+
+
+class ProjectSync:
+    def __init__(
+        self,
+        jobs: int = 4,
+        depth: Optional[int] = None,
+        filter_spec: Optional[str] = None,
+        reference=None,
+    ):
+        self.jobs = jobs
+        self.depth = depth
+        self.filter_spec = filter_spec
+        # Directory with local copies of projects, at the same paths as in
+        # the meta repository
+        self.reference = reference
+
+    def _clone(self, project: MetaProject):
+        args = ["clone", "--quiet"]
+        if self.depth:
+            args.append(f"--depth={self.depth}")
+        if self.filter_spec:
+            args.append(f"--filter={self.filter_spec}")
+        if self.reference:
+            reference = self.reference / project.name
+            if reference.is_dir():
+                args.append(f"--reference-if-able={reference}")
+        git(*args, project.url, str(project.path))
+
+    def _is_behind(self, project: MetaProject) -> bool:
+        """Whether the remote branch tracked by the current branch moved since
+        it was last fetched. True if there's no way to tell."""
+        branch, _ = read_head(project.path)
+        if branch is None:
+            return True
+        upstream = git(
+            "for-each-ref",
+            "--format=%(upstream:remotename) %(upstream:remoteref) %(upstream)",
+            f"refs/heads/{branch}",
+            cwd=project.path,
+        ).split()
+        if len(upstream) != 3:
+            return True
+        remote, remote_ref, tracking_ref = upstream
+        remote_sha = git("ls-remote", remote, remote_ref, cwd=project.path).split()
+        try:
+            local_sha = git(
+                "rev-parse", "--verify", "-q", tracking_ref, cwd=project.path
+            )
+        except GitError:
+            return True
+        return not remote_sha or remote_sha[0] != local_sha
+
+    def _fetch(self, project: MetaProject) -> bool:
+        if not self._is_behind(project):
+            return False
+        args = ["fetch", "--quiet"]
+        if self.depth:
+            args.append(f"--depth={self.depth}")
+        git(*args, cwd=project.path)
+        return True
+
+    def sync_project(self, project: MetaProject) -> SyncResult:
+        started_at = time.monotonic()
+        try:
+            if project.exists:
+                fetched = self._fetch(project)
+                action = SyncAction.FETCHED if fetched else SyncAction.UP_TO_DATE
+            else:
+                self._clone(project)
+                action = SyncAction.CLONED
+        except GitError as e:
+            return SyncResult(
+                project, SyncAction.FAILED, time.monotonic() - started_at, str(e)
+            )
+        return SyncResult(project, action, time.monotonic() - started_at)
+
+    def sync(self, projects: List[MetaProject]) -> Iterator[SyncResult]:
+        """Sync every project, yielding results as they're done."""
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [
+                executor.submit(self.sync_project, project) for project in projects
+            ]
+            for future in as_completed(futures):
+                yield future.result()
@@ -1,8 +1,14 @@
 """Test cases for the __main__ module."""
+import json
+import os
+import subprocess
+
 import pytest
 from click.testing import CliRunner
 
 from pt_os_meta_exec import __main__
+from pt_os_meta_exec.facts import FactsIndex
+from pt_os_meta_exec.meta import load_projects
 
 
 @pytest.fixture
@@ -15,3 +21,507 @@ def test_main_succeeds(runner: CliRunner) -> None:
     """It exits with a status code of zero."""
     result = runner.invoke(__main__.main)
     assert result.exit_code == 0
+
+
+@pytest.fixture
+def meta_repo(tmp_path, monkeypatch):
+    """Fixture for a meta repository with a few projects, used as the current
+    directory."""
+    projects = {
+        "apps/one": "git@example.com:one.git",
+        "apps/two": "git@example.com:two.git",
+        "three": "git@example.com:three.git",
+    }
+    (tmp_path / ".meta").write_text(json.dumps({"projects": projects}))
+    for name in projects:
+        (tmp_path / name).mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_runs_in_every_repo(runner: CliRunner, meta_repo) -> None:
+    """It runs the command in each project of .meta."""
+    result = runner.invoke(__main__.main, ["touch ran"])
+    assert result.exit_code == 0, result.output
+    for name in ("apps/one", "apps/two", "three"):
+        assert (meta_repo / name / "ran").exists()
+
+
+def test_parallel_output(runner: CliRunner, meta_repo) -> None:
+    """It shows the output of each project under its name."""
+    result = runner.invoke(
+        __main__.main, ["--parallel", "-j", "3", "echo hello from $(basename $PWD)"]
+    )
+    assert result.exit_code == 0, result.output
+    for name in ("one", "two", "three"):
+        assert f"hello from {name}" in result.output
+
+
+def test_failure_exit_code(runner: CliRunner, meta_repo) -> None:
+    """It exits with a non-zero status if the command fails in any project."""
+    result = runner.invoke(
+        __main__.main, ["--parallel", '[ "$(basename $PWD)" != two ]']
+    )
+    assert result.exit_code == 1
+    assert "apps/two (exit code 1)" in result.output
+
+
+def test_skips_missing_repos(runner: CliRunner, meta_repo) -> None:
+    """It skips projects that aren't cloned."""
+    (meta_repo / "three").rmdir()
+    result = runner.invoke(__main__.main, ["touch ran"])
+    assert result.exit_code == 0, result.output
+    assert "Skipping 'three': not cloned" in result.output
+    assert (meta_repo / "apps" / "one" / "ran").exists()
+
+
+def test_filters_repos_before_running(runner: CliRunner, meta_repo) -> None:
+    """It only runs the command in projects matching the cheap filters."""
+    (meta_repo / "apps" / "one" / "debian").mkdir()
+    (meta_repo / "apps" / "one" / "debian" / "control").touch()
+    (meta_repo / "three" / "debian").mkdir()
+    (meta_repo / "three" / "debian" / "control").touch()
+    (meta_repo / "three" / "Jenkinsfile").touch()
+    result = runner.invoke(
+        __main__.main,
+        [
+            "--repo-match",
+            "apps/",
+            "--repo-match",
+            "thr*",
+            "--condition-file",
+            "debian/*",
+            "--condition-no-file",
+            "Jenkinsfile",
+            "touch ran",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Matched 1 repos, skipped 2" in result.output
+    assert (meta_repo / "apps" / "one" / "ran").exists()
+    assert not (meta_repo / "apps" / "two" / "ran").exists()
+    assert not (meta_repo / "three" / "ran").exists()
+    # Conditions evaluated in Python aren't part of the script
+    assert "compgen" not in result.output
+
+
+def test_bash_conditions(runner: CliRunner, meta_repo) -> None:
+    """It still evaluates bash conditions in the projects that match."""
+    (meta_repo / "apps" / "two" / "marker").touch()
+    result = runner.invoke(
+        __main__.main,
+        ["--repo-match", "apps", "--condition", "[ -f marker ]", "touch ran"],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Matched 2 repos, skipped 1" in result.output
+    assert not (meta_repo / "apps" / "one" / "ran").exists()
+    assert (meta_repo / "apps" / "two" / "ran").exists()
+
+
+def test_interactive_reuses_shells(runner: CliRunner, meta_repo) -> None:
+    """It runs each command typed at the prompt in the same shell per project,
+    with lib.bash already loaded."""
+    result = runner.invoke(
+        __main__.main,
+        ["--parallel", "--repo-match", "three"],
+        input="echo pid=$$\nhello_world\nfalse\necho pid=$$\nexit\n",
+    )
+    assert result.exit_code == 0, result.output
+    pids = [line for line in result.output.splitlines() if "pid=" in line]
+    assert len(pids) == 2 and pids[0] == pids[1]
+    assert "Hello World" in result.output
+    assert "three (exit code 1)" in result.output
+
+
+def test_interactive_commands_are_isolated(runner: CliRunner, meta_repo) -> None:
+    """A command can't change the directory or state of the next one."""
+    result = runner.invoke(
+        __main__.main,
+        input="cd ..; exit 3\necho \"'unbalanced\necho in $(basename $PWD)\nexit\n",
+    )
+    assert result.exit_code == 0, result.output
+    for name in ("one", "two", "three"):
+        assert f"in {name}" in result.output
+
+
+def test_check_matrix(runner: CliRunner, meta_repo) -> None:
+    """It shows the result of every check in every project, and fails if any
+    check failed."""
+    spec = meta_repo / "checks.yaml"
+    spec.write_text("""
+checks:
+  - name: buster
+    changelog:
+      distribution: buster
+      urgency: medium
+  - name: ignores Jenkinsfile
+    file: debian/clean
+    line: "^tar-ignore = Jenkinsfile$"
+  - name: ignores .github
+    file: debian/clean
+    line: "^tar-ignore = .github$"
+  - name: has clean
+    file: debian/clean
+    required: true
+""")
+    for name in ("apps/one", "apps/two"):
+        (meta_repo / name / "debian").mkdir()
+        (meta_repo / name / "debian" / "changelog").write_text(
+            "pkg (1.0.0) buster; urgency=medium\n\n  * Initial release\n"
+        )
+    (meta_repo / "apps" / "one" / "debian" / "clean").write_text(
+        "tar-ignore = Jenkinsfile\n"
+    )
+
+    result = runner.invoke(__main__.check, [str(spec), "--format", "json"])
+    assert result.exit_code == 1
+    matrix = json.loads(result.output[: result.output.rindex("}") + 1])
+    assert matrix == {
+        "apps/one": {
+            "buster": "pass",
+            "ignores Jenkinsfile": "pass",
+            "ignores .github": "fail",
+            "has clean": "pass",
+        },
+        "apps/two": {
+            "buster": "pass",
+            "ignores Jenkinsfile": "missing",
+            "ignores .github": "missing",
+            "has clean": "missing",
+        },
+        "three": {
+            "buster": "missing",
+            "ignores Jenkinsfile": "missing",
+            "ignores .github": "missing",
+            "has clean": "missing",
+        },
+    }
+    assert "Checks failed in 3 of 3 repos" in result.output
+
+    result = runner.invoke(__main__.check, [str(spec), "--repo-match", "two"])
+    assert result.exit_code == 1
+    assert "apps/two    ok    -    -    -" in result.output
+
+
+def test_check_invalid_spec(runner: CliRunner, meta_repo) -> None:
+    """It reports mistakes in the check spec."""
+    spec = meta_repo / "checks.yaml"
+    spec.write_text("checks:\n  - name: typo\n    changelog:\n      distro: buster\n")
+    result = runner.invoke(__main__.check, [str(spec)])
+    assert result.exit_code == 1
+    assert "Unknown changelog fields in check 'typo': distro" in result.output
+
+
+@pytest.fixture
+def facts_cache(tmp_path, monkeypatch):
+    """Fixture for an empty cache directory for the facts index."""
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache))
+    return cache / "pt-os-meta-exec"
+
+
+def git(path, *args, env=None):
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=path,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        env=dict(os.environ, **(env or {})),
+    )
+
+
+def test_where_filters_on_facts(runner: CliRunner, meta_repo, facts_cache) -> None:
+    """It only runs the command in projects whose facts match."""
+    for name, distribution in (("apps/one", "bookworm"), ("apps/two", "buster")):
+        (meta_repo / name / "debian").mkdir()
+        (meta_repo / name / "debian" / "changelog").write_text(
+            f"pkg (2.1.0) {distribution}; urgency=medium\n"
+        )
+    git(meta_repo / "apps" / "one", "init", "-q", "-b", "feature")
+    git(meta_repo / "apps" / "one", "commit", "-q", "--allow-empty", "-m", "init")
+
+    result = runner.invoke(
+        __main__.main,
+        ["--where", "distribution=bookworm", "--where", "version=2.*", "touch ran"],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Matched 1 repos, skipped 2" in result.output
+    assert (meta_repo / "apps" / "one" / "ran").exists()
+    assert not (meta_repo / "apps" / "two" / "ran").exists()
+
+    result = runner.invoke(__main__.main, ["--where", "branch=feature", "true"])
+    assert "Matched 1 repos, skipped 2" in result.output
+
+    # Facts are collected again when a key file changes
+    (meta_repo / "apps" / "two" / "debian" / "changelog").write_text(
+        "pkg (2.2.0) bookworm; urgency=medium\n"
+    )
+    result = runner.invoke(__main__.main, ["--where", "distribution=bookworm", "true"])
+    assert "Matched 2 repos, skipped 1" in result.output
+
+
+def test_where_file_exists(runner: CliRunner, meta_repo, facts_cache) -> None:
+    """It filters on which key files exist, from the facts index."""
+    (meta_repo / "apps" / "one" / "Jenkinsfile").write_text("")
+
+    result = runner.invoke(__main__.main, ["--where", "file:Jenkinsfile=yes", "true"])
+    assert result.exit_code == 0, result.output
+    assert "Matched 1 repos, skipped 2" in result.output
+    result = runner.invoke(__main__.main, ["--where", "file:Jenkinsfile=no", "true"])
+    assert "Matched 2 repos, skipped 1" in result.output
+
+    # Only key files are indexed
+    result = runner.invoke(__main__.main, ["--where", "file:README=yes", "true"])
+    assert result.exit_code == 2
+    assert "Invalid condition 'file:README=yes'" in result.output
+
+
+def test_facts_index_is_reused(meta_repo, facts_cache, monkeypatch) -> None:
+    """It doesn't start any process to get facts about unchanged projects."""
+    git(meta_repo / "three", "init", "-q")
+    git(meta_repo / "three", "commit", "-q", "--allow-empty", "-m", "init")
+    projects = load_projects(meta_repo / ".meta")
+    index = FactsIndex.for_meta_file(meta_repo / ".meta")
+    facts = [index.facts(project) for project in projects]
+    index.save()
+    assert facts[2]["tree"] == "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+    def no_process(*args, **kwargs):
+        raise AssertionError("unexpected process")
+
+    monkeypatch.setattr(subprocess, "run", no_process)
+    index = FactsIndex.for_meta_file(meta_repo / ".meta")
+    assert [index.facts(project) for project in projects] == facts
+
+
+def test_where_invalid_fact(runner: CliRunner, meta_repo) -> None:
+    """It rejects conditions on unknown facts."""
+    result = runner.invoke(__main__.main, ["--where", "distro=buster", "true"])
+    assert result.exit_code == 2
+    assert "Invalid condition 'distro=buster'" in result.output
+
+
+def test_memoize(runner: CliRunner, meta_repo, facts_cache) -> None:
+    """It replays the results of repos that didn't change."""
+    for name in ("apps/one", "apps/two"):
+        git(meta_repo / name, "init", "-q")
+        (meta_repo / name / "file").write_text("v1\n")
+        git(meta_repo / name, "add", "file")
+        git(meta_repo / name, "commit", "-q", "-m", "init")
+    args = ["--memoize", "--repo-match", "apps", "echo run >> ../runs; cat file"]
+
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert (meta_repo / "apps" / "runs").read_text() == "run\nrun\n"
+
+    # Uncommitted changes invalidate the result of their repo only
+    (meta_repo / "apps" / "two" / "file").write_text("v2\n")
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert (meta_repo / "apps" / "runs").read_text() == "run\nrun\nrun\n"
+    assert "apps/one | v1\napps/one | cached, exit code 0\n" in result.output
+    assert "apps/two | v2\n" in result.output
+
+    result = runner.invoke(__main__.main, args)
+    assert (meta_repo / "apps" / "runs").read_text() == "run\nrun\nrun\n"
+    assert result.output.count("| cached") == 2
+
+
+def test_memoize_grouped_output(runner: CliRunner, meta_repo, facts_cache) -> None:
+    """It shows and replays the whole output of each repo when grouped, not
+    only the lines kept in memory."""
+    git(meta_repo / "apps" / "one", "init", "-q")
+    git(meta_repo / "apps" / "one", "commit", "-q", "--allow-empty", "-m", "init")
+    args = ["--memoize", "--output", "grouped", "--repo-match", "one", "seq 120"]
+    expected = "".join(f"{i}\n" for i in range(1, 121))
+
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert f"apps/one:\n{expected}" in result.output
+    # The output is stored as it is, beside the exit code
+    outputs = [path.read_text() for path in (facts_cache / "results").glob("*.out")]
+    assert outputs == [expected]
+
+    result = runner.invoke(__main__.main, args)
+    assert result.exit_code == 0, result.output
+    assert f"apps/one: (cached)\n{expected}" in result.output
+
+
+def test_changed_since(runner: CliRunner, meta_repo) -> None:
+    """It only runs the command in repos with commits since a ref or date."""
+    for name in ("apps/one", "apps/two"):
+        git(meta_repo / name, "init", "-q")
+        git(
+            meta_repo / name,
+            "commit",
+            "-q",
+            "--allow-empty",
+            "-m",
+            "init",
+            env={"GIT_COMMITTER_DATE": "2020-01-01T00:00:00"},
+        )
+        git(meta_repo / name, "tag", "released")
+    git(meta_repo / "apps" / "two", "commit", "-q", "--allow-empty", "-m", "new")
+
+    result = runner.invoke(__main__.main, ["--changed-since", "released", "true"])
+    assert "Matched 2 repos, skipped 1" in result.output
+    assert "'three': can't tell if it changed since 'released'" in result.output
+    assert "\nthree:" in result.output
+
+    result = runner.invoke(
+        __main__.main, ["--changed-since", "2021-06-01", "--repo-match", "apps", "true"]
+    )
+    assert "Matched 1 repos, skipped 2" in result.output
+    assert "apps/two:" in result.output
+
+
+def test_results_file(runner: CliRunner, meta_repo) -> None:
+    """It streams output prefixed by repo, and writes the result of each repo
+    with the end of its output."""
+    results_file = meta_repo / "results.json"
+    result = runner.invoke(
+        __main__.main,
+        [
+            "--parallel",
+            "-j",
+            "3",
+            "--results-file",
+            str(results_file),
+            'seq 100; echo oops >&2; [ "$(basename $PWD)" != two ]',
+        ],
+    )
+    assert result.exit_code == 1
+    assert "apps/two | oops\n" in result.output
+    assert "three    | 100\n" in result.output
+
+    results = json.loads(results_file.read_text())
+    assert [repo["name"] for repo in results["repos"]] == [
+        "apps/one",
+        "apps/two",
+        "three",
+    ]
+    assert results["failed"] == ["apps/two"]
+    two = results["repos"][1]
+    assert two["exit_code"] == 1
+    assert len(two["output_tail"]) == 50
+    assert two["output_tail"][-1] == "oops"
+
+
+def test_results_file_without_parallel(runner: CliRunner, meta_repo) -> None:
+    """It captures the end of the output of each repo when running them one
+    at a time too."""
+    results_file = meta_repo / "results.json"
+    result = runner.invoke(
+        __main__.main,
+        ["--results-file", str(results_file), 'echo "in $(basename $PWD)"'],
+    )
+    assert result.exit_code == 0, result.output
+    results = json.loads(results_file.read_text())
+    assert [repo["output_tail"] for repo in results["repos"]] == [
+        ["in one"],
+        ["in two"],
+        ["in three"],
+    ]
+
+
+@pytest.fixture
+def remotes(tmp_path):
+    """Fixture for bare repositories with a few commits, and a meta repository
+    listing them as projects."""
+    remotes = tmp_path / "remotes"
+    work = tmp_path / "work"
+    projects = {}
+    for name in ("one", "two"):
+        git(tmp_path, "init", "-q", "-b", "main", str(work / name))
+        for i in range(3):
+            (work / name / "file").write_text(f"{i}\n")
+            git(work / name, "add", "file")
+            git(work / name, "commit", "-q", "-m", f"commit {i}")
+        git(
+            tmp_path,
+            "clone",
+            "-q",
+            "--bare",
+            str(work / name),
+            str(remotes / f"{name}.git"),
+        )
+        git(work / name, "remote", "add", "origin", str(remotes / f"{name}.git"))
+        # 'file://' so that '--depth' isn't ignored as it is for local paths
+        projects[f"apps/{name}"] = (remotes / f"{name}.git").as_uri()
+
+    meta = tmp_path / "meta"
+    meta.mkdir()
+    (meta / ".meta").write_text(json.dumps({"projects": projects}))
+    return {"meta": meta, "work": work}
+
+
+def test_sync(runner: CliRunner, remotes, monkeypatch) -> None:
+    """It clones missing repos, and only fetches the ones that are behind."""
+    meta = remotes["meta"]
+    monkeypatch.chdir(meta)
+    result = runner.invoke(__main__.main, ["sync", "-j", "2", "--depth", "1"])
+    assert result.exit_code == 0, result.output
+    assert "apps/one: cloned (" in result.output
+    assert "Synced 2 repos in" in result.output
+    assert (meta / "apps" / "two" / ".git" / "shallow").exists()
+
+    result = runner.invoke(__main__.main, ["sync"])
+    assert result.exit_code == 0, result.output
+    assert "apps/one: up to date" in result.output
+    assert "apps/two: up to date" in result.output
+
+    work = remotes["work"] / "two"
+    (work / "file").write_text("new\n")
+    git(work, "commit", "-q", "-am", "new")
+    git(work, "push", "-q", "origin", "main")
+    result = runner.invoke(__main__.main, ["sync"])
+    assert result.exit_code == 0, result.output
+    assert "apps/one: up to date" in result.output
+    assert "apps/two: fetched" in result.output
+
+
+def test_sync_reference(runner: CliRunner, remotes, monkeypatch, tmp_path) -> None:
+    """It borrows objects from local copies of the repos."""
+    reference = tmp_path / "reference"
+    git(
+        tmp_path,
+        "clone",
+        "-q",
+        str(remotes["work"] / "one"),
+        str(reference / "apps" / "one"),
+    )
+    monkeypatch.chdir(remotes["meta"])
+    result = runner.invoke(
+        __main__.main, ["sync", "--reference", str(reference), "--filter", "blob:none"]
+    )
+    assert result.exit_code == 0, result.output
+    alternates = (
+        remotes["meta"] / "apps" / "one" / ".git" / "objects" / "info" / "alternates"
+    )
+    assert alternates.read_text().strip() == str(
+        reference / "apps" / "one" / ".git" / "objects"
+    )
+    assert not (
+        remotes["meta"] / "apps" / "two" / ".git" / "objects" / "info" / "alternates"
+    ).exists()
+
+
+def test_sync_failure(runner: CliRunner, remotes, monkeypatch, tmp_path) -> None:
+    """It reports repos that couldn't be cloned."""
+    meta_file = remotes["meta"] / ".meta"
+    meta = json.loads(meta_file.read_text())
+    meta["projects"]["three"] = (tmp_path / "missing.git").as_uri()
+    meta_file.write_text(json.dumps(meta))
+    monkeypatch.chdir(remotes["meta"])
+    result = runner.invoke(__main__.main, ["sync"])
+    assert result.exit_code == 1
+    assert "apps/one: cloned" in result.output
+    assert "three: failed" in result.output
+    assert "Failed to sync 1 of 3 repos" in result.output
+
+
+def test_exec_after_double_dash(runner: CliRunner, meta_repo) -> None:
+    """It runs commands named like a pt-os-meta-exec command after '--'."""
+    result = runner.invoke(__main__.main, ["--repo-match", "three", "--", "sync"])
+    assert result.exit_code == 0, result.output
+    assert "Matched 1 repos" in result.output